@@ -1,9 +1,16 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Response
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Response, Header, Query
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+from bson import ObjectId
+from bson.errors import InvalidId
 import os
+import asyncio
+import anyio
 import logging
 import httpx
 from pathlib import Path
@@ -12,13 +19,21 @@ from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
+from collections import OrderedDict, deque
+from contextlib import aclosing
+import time
 from enum import Enum
 import random
+import re
+import sys
+import inspect
 from openai import AsyncOpenAI
 import qrcode
 import io
 import base64
 import hashlib
+import json
+import functools
 from cryptography.fernet import Fernet
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -55,6 +70,200 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ==================== INDEX REGISTRY ====================
+
+# Indexes are declared with register_index() next to the code that queries
+# each collection and created by ensure_indexes() on startup. A unique index
+# over a collection that may already hold duplicates registers a dedupe
+# coroutine (collection, fields) -> count that folds them.
+INDEX_REGISTRY: List[dict] = []
+
+def register_index(collection: str, keys: list, dedupe=None, **options):
+    """Declare an index for ensure_indexes() to create at startup"""
+    if "name" not in options:
+        options["name"] = "_".join(f"{field}_{direction}" for field, direction in keys)
+    INDEX_REGISTRY.append({"collection": collection, "keys": keys, "options": options, "dedupe": dedupe})
+
+async def ensure_indexes():
+    """
+    Create every registered index.
+    
+    A unique index that fails over duplicate keys is built again once its
+    dedupe has run (under a data_migrations lease, so one worker at a time).
+    A failed index is logged; if it is a unique index startup fails, since
+    claims and idempotent writes rely on it to reject duplicates, unless
+    another worker is still deduplicating that collection.
+    """
+    missing_unique = []
+    for spec in INDEX_REGISTRY:
+        name = f"{spec['collection']}.{spec['options']['name']}"
+        try:
+            await db[spec["collection"]].create_index(spec["keys"], **spec["options"])
+            continue
+        except Exception as e:
+            error = e
+        
+        if spec["dedupe"] and isinstance(error, OperationFailure) and error.code == 11000:
+            fields = [field for field, _ in spec["keys"]]
+            status = await run_migration(
+                f"dedupe:{name}", functools.partial(spec["dedupe"], spec["collection"], fields), once=False
+            )
+            if status == "busy":
+                logger.warning(f"Index {name} not created yet: another worker is removing duplicates")
+                continue
+            if status == "done":
+                try:
+                    await db[spec["collection"]].create_index(spec["keys"], **spec["options"])
+                    continue
+                except Exception as e:
+                    error = e
+        
+        logger.error(f"Index {name} not created: {error}")
+        if spec["options"].get("unique"):
+            missing_unique.append(name)
+    if missing_unique:
+        raise RuntimeError(f"Unique indexes not created: {', '.join(missing_unique)}")
+
+async def drop_duplicate_documents(collection: str, fields: list) -> int:
+    """Keep the oldest document per key (the one find_one has been returning) and delete the rest"""
+    dropped = 0
+    duplicates = db[collection].aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {
+            "_id": {field: f"${field}" for field in fields},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    async for group in duplicates:
+        result = await db[collection].delete_many({"_id": {"$in": group["ids"][1:]}})
+        dropped += result.deleted_count
+    if dropped:
+        logger.warning(f"Removed {dropped} duplicate {collection} documents")
+    return dropped
+
+async def find_or_create(collection: str, filter: dict, defaults: dict) -> dict:
+    """
+    The document matching `filter`, inserted from `defaults` when missing.
+    One atomic upsert against the collection's unique index, so concurrent
+    first requests share one document.
+    """
+    for attempt in range(2):
+        try:
+            return await db[collection].find_one_and_update(
+                filter,
+                {"$setOnInsert": defaults},
+                upsert=True,
+                return_document=True,
+                projection={"_id": 0}
+            )
+        except DuplicateKeyError:
+            # Lost the insert race; the retry matches the winner's document
+            if attempt:
+                raise
+
+# ==================== DATA MIGRATIONS ====================
+
+# One-off jobs (backfills, dedupes) claimed in data_migrations so a single
+# worker runs each: the claim records a status and a lease_until. A failed
+# run can be claimed again straight away and an abandoned one once its
+# lease lapses. `once` jobs are never re-run after they are done.
+DATA_MIGRATION_LEASE_SECONDS = float(os.environ.get("DATA_MIGRATION_LEASE_SECONDS", "3600"))
+
+register_index("data_migrations", [("name", 1)], unique=True)
+
+async def run_migration(name: str, migration, once: bool = True) -> str:
+    """Run `migration` under its claim; returns "done", "failed", or "busy" when it is not ours to run"""
+    now = datetime.now(timezone.utc)
+    lease_until = now + timedelta(seconds=DATA_MIGRATION_LEASE_SECONDS)
+    claim = {"name": name, "$or": [{"status": "failed"}, {"lease_until": {"$lt": now}}]}
+    if once:
+        claim["status"] = {"$ne": "done"}
+    else:
+        claim["$or"].append({"status": "done"})
+    try:
+        await db.data_migrations.update_one(
+            claim,
+            {
+                "$set": {"status": "running", "lease_until": lease_until, "started_at": now},
+                "$inc": {"attempts": 1}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return "busy"
+    
+    try:
+        result = await migration()
+    except Exception as e:
+        logger.error(f"Data migration {name} failed: {e}")
+        await db.data_migrations.update_one(
+            {"name": name, "lease_until": lease_until},
+            {"$set": {"status": "failed", "error": str(e)}}
+        )
+        return "failed"
+    await db.data_migrations.update_one(
+        {"name": name, "lease_until": lease_until},
+        {"$set": {
+            "status": "done",
+            "result": jsonable_encoder(result),
+            "completed_at": datetime.now(timezone.utc)
+        }}
+    )
+    logger.info(f"Data migration {name}: {result}")
+    return "done"
+
+# Rollup backfills split the source documents at a watermark: the first
+# worker to start records when live rollup maintenance began, everything
+# older is backfilled and everything newer was already counted by the
+# writers. Documents written by old workers still running during a rolling
+# deploy after that moment are not counted by either.
+async def live_rollups_since() -> datetime:
+    """When the live rollup writers started on this database (recorded once)"""
+    marker = await find_or_create(
+        "data_migrations",
+        {"name": "live_rollups"},
+        {"status": "done", "since": datetime.now(timezone.utc)}
+    )
+    return marker["since"]
+
+def older_than(field: str, before: Optional[datetime]) -> dict:
+    """Filter for source documents a backfill up to `before` covers (all of them without one)"""
+    return {field: {"$lt": before}} if before else {}
+
+async def write_rollup_totals(collection: str, key_fields: tuple, buckets: dict,
+                              before: Optional[datetime] = None) -> int:
+    """
+    Write recomputed rollup `buckets` ({key tuple: {field: total}}).
+    
+    Without `before` the totals replace what is stored: a full rebuild for a
+    quiet database. With it they cover only source documents older than the
+    watermark, which the live writers never counted, so they are $inc'ed on
+    top of the live counts. Each document records the watermark it was
+    backfilled at, and a retried run skips the ones it already reached.
+    """
+    now = datetime.now(timezone.utc)
+    ops = []
+    for key, totals in buckets.items():
+        selector = dict(zip(key_fields, key))
+        if before is None:
+            ops.append(UpdateOne(selector, {"$set": {**totals, "updated_at": now}}, upsert=True))
+        else:
+            ops.append(UpdateOne(
+                {**selector, "backfilled_before": {"$ne": before}},
+                {"$inc": totals, "$set": {"backfilled_before": before, "updated_at": now}},
+                upsert=True
+            ))
+    for i in range(0, len(ops), 1000):
+        try:
+            await db[collection].bulk_write(ops[i:i + 1000], ordered=False)
+        except BulkWriteError as e:
+            # Already backfilled: the filter misses and the upsert hits the unique key
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+    return len(ops)
+
 # ==================== MODELS ====================
 
 class User(BaseModel):
@@ -670,8 +879,116 @@ VIP_LEVELS_DATA = [
     }
 ]
 
+# ==================== SESSION CACHE ====================
+
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "60"))
+
+class SessionCache:
+    """Bounded LRU + TTL cache of session_token -> (User, expires_at)"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_token: str) -> Optional[User]:
+        entry = self._entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at, cached_until = entry
+        if time.monotonic() >= cached_until or expires_at < datetime.now(timezone.utc):
+            # Stale entry or expired session - force a fresh lookup
+            del self._entries[session_token]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_token)
+        self.hits += 1
+        return user
+
+    def put(self, session_token: str, user: User, expires_at: datetime):
+        self._entries[session_token] = (user, expires_at, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(session_token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, session_token: str):
+        if self._entries.pop(session_token, None) is not None:
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached session belonging to a user"""
+        for token in [t for t, entry in self._entries.items() if entry[0].user_id == user_id]:
+            self.invalidate(token)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+session_cache = SessionCache(SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_TTL_SECONDS)
+
+# "denormalized": user profile is embedded in the session document at login
+# "lookup": a single $lookup aggregation joins user_sessions to users
+SESSION_RESOLUTION_MODE = os.environ.get("SESSION_RESOLUTION_MODE", "denormalized")
+SESSION_USER_FIELDS = ("user_id", "email", "name", "picture", "created_at")
+
+# ==================== USER PROFILE HYDRATION ====================
+
+PROFILE_CACHE_TTL_SECONDS = float(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "30"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get("PROFILE_CACHE_MAX_ENTRIES", "50000"))
+PROFILE_PROJECTION = {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
+
+_profile_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+async def load_user_profiles(user_ids) -> dict:
+    """
+    Resolve public profiles (user_id, name, picture) for many users at once.
+    
+    Ids missing from the short-TTL cache are fetched with a single $in query.
+    Returns {user_id: profile}; unknown users are simply absent.
+    """
+    now = time.monotonic()
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        cached = _profile_cache.get(user_id)
+        if cached and cached[1] > now:
+            profiles[user_id] = dict(cached[0])
+        else:
+            missing.append(user_id)
+    
+    if missing:
+        async for doc in db.users.find({"user_id": {"$in": missing}}, PROFILE_PROJECTION):
+            profiles[doc["user_id"]] = dict(doc)
+            _profile_cache[doc["user_id"]] = (doc, now + PROFILE_CACHE_TTL_SECONDS)
+            _profile_cache.move_to_end(doc["user_id"])
+        while len(_profile_cache) > PROFILE_CACHE_MAX_ENTRIES:
+            _profile_cache.popitem(last=False)
+    
+    return profiles
+
 # ==================== AUTH HELPERS ====================
 
+register_index("users", [("user_id", 1)], unique=True)
+register_index("users", [("email", 1)])
+register_index("user_sessions", [("session_token", 1)], unique=True)
+register_index("user_sessions", [("user_id", 1)])
+register_index("user_sessions", [("expires_at", 1)], expireAfterSeconds=0)
+
 async def get_session_token(request: Request) -> Optional[str]:
     """Get session token from cookie or Authorization header"""
     # Try cookie first
@@ -686,16 +1003,57 @@ async def get_session_token(request: Request) -> Optional[str]:
     
     return None
 
+def session_user_snapshot(user_doc: dict) -> dict:
+    """Profile fields copied into user_sessions for single-read auth"""
+    return {field: user_doc.get(field) for field in SESSION_USER_FIELDS}
+
+async def resolve_session(session_token: str) -> Optional[dict]:
+    """Fetch a session together with its user in one round-trip"""
+    if SESSION_RESOLUTION_MODE == "lookup":
+        sessions = await db.user_sessions.aggregate([
+            {"$match": {"session_token": session_token}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "users",
+                "localField": "user_id",
+                "foreignField": "user_id",
+                "as": "user"
+            }},
+            {"$unwind": {"path": "$user", "preserveNullAndEmptyArrays": True}},
+            {"$project": {"_id": 0, "user._id": 0}}
+        ]).to_list(1)
+        return sessions[0] if sessions else None
+    
+    return await db.user_sessions.find_one(
+        {"session_token": session_token},
+        {"_id": 0}
+    )
+
+async def update_user_profile(user_id: str, updates: dict):
+    """Update profile fields on the user and every denormalized session copy"""
+    updates = {k: v for k, v in updates.items() if k in SESSION_USER_FIELDS and k != "user_id"}
+    if not updates:
+        return
+    
+    await db.users.update_one({"user_id": user_id}, {"$set": updates})
+    await db.user_sessions.update_many(
+        {"user_id": user_id, "user": {"$exists": True}},
+        {"$set": {f"user.{k}": v for k, v in updates.items()}}
+    )
+    session_cache.invalidate_user(user_id)
+    _profile_cache.pop(user_id, None)
+
 async def get_current_user(request: Request) -> User:
     """Get current user from session token"""
     session_token = await get_session_token(request)
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    session = await db.user_sessions.find_one(
-        {"session_token": session_token},
-        {"_id": 0}
-    )
+    cached_user = session_cache.get(session_token)
+    if cached_user:
+        return cached_user
+    
+    session = await resolve_session(session_token)
     if not session:
         raise HTTPException(status_code=401, detail="Invalid session")
     
@@ -707,14 +1065,19 @@ async def get_current_user(request: Request) -> User:
     if expires_at < datetime.now(timezone.utc):
         raise HTTPException(status_code=401, detail="Session expired")
     
-    user_doc = await db.users.find_one(
-        {"user_id": session["user_id"]},
-        {"_id": 0}
-    )
+    user_doc = session.get("user")
+    if not user_doc:
+        # Sessions created before profiles were denormalized
+        user_doc = await db.users.find_one(
+            {"user_id": session["user_id"]},
+            {"_id": 0}
+        )
     if not user_doc:
         raise HTTPException(status_code=401, detail="User not found")
     
-    return User(**user_doc)
+    user = User(**user_doc)
+    session_cache.put(session_token, user, expires_at)
+    return user
 
 async def get_optional_user(request: Request) -> Optional[User]:
     """Get current user if authenticated, None otherwise"""
@@ -760,19 +1123,28 @@ async def exchange_session(request: Request, response: Response):
     
     if existing_user:
         user_id = existing_user["user_id"]
+        profile_changes = {
+            k: v for k, v in {"name": session_data.name, "picture": session_data.picture}.items()
+            if v is not None and existing_user.get(k) != v
+        }
+        if profile_changes:
+            await update_user_profile(user_id, profile_changes)
+            existing_user.update(profile_changes)
+        user_doc = existing_user
     else:
         # Create new user
-        await db.users.insert_one({
+        user_doc = {
             "user_id": user_id,
             "email": session_data.email,
             "name": session_data.name,
             "picture": session_data.picture,
             "created_at": datetime.now(timezone.utc)
-        })
+        }
+        await db.users.insert_one({**user_doc})
+        live_counters.add("total_users", 1)
         
         # Create wallet for new user
-        await db.wallets.insert_one({
-            "user_id": user_id,
+        await find_or_create("wallets", {"user_id": user_id}, {
             "coins_balance": 1000.0,  # Welcome bonus
             "stars_balance": 0.0,
             "bonus_balance": 100.0,  # Bonus balance
@@ -784,8 +1156,7 @@ async def exchange_session(request: Request, response: Response):
         })
         
         # Create VIP status for new user
-        await db.vip_status.insert_one({
-            "user_id": user_id,
+        await find_or_create("vip_status", {"user_id": user_id}, {
             "vip_level": 0,
             "subscription_start": None,
             "subscription_end": None,
@@ -797,7 +1168,7 @@ async def exchange_session(request: Request, response: Response):
         })
         
         # Add welcome notification
-        await db.notifications.insert_one({
+        notification_queue.enqueue({
             "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
             "user_id": user_id,
             "title": "Welcome to VIP Club! 🎉",
@@ -814,6 +1185,7 @@ async def exchange_session(request: Request, response: Response):
         "user_id": user_id,
         "session_token": session_data.session_token,
         "expires_at": expires_at,
+        "user": session_user_snapshot(user_doc),
         "created_at": datetime.now(timezone.utc)
     })
     
@@ -828,9 +1200,6 @@ async def exchange_session(request: Request, response: Response):
         max_age=7 * 24 * 60 * 60
     )
     
-    # Get user data
-    user_doc = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-    
     return {
         "success": True,
         "user": user_doc,
@@ -848,6 +1217,7 @@ async def logout(request: Request, response: Response):
     session_token = await get_session_token(request)
     
     if session_token:
+        session_cache.invalidate(session_token)
         await db.user_sessions.delete_one({"session_token": session_token})
     
     response.delete_cookie(key="session_token", path="/")
@@ -860,8 +1230,1128 @@ async def check_auth(request: Request):
     user = await get_optional_user(request)
     return {"authenticated": user is not None, "user": user}
 
+@api_router.get("/auth/session-cache/stats")
+async def get_session_cache_stats(current_user: User = Depends(get_current_user)):
+    """Session cache hit/miss counters"""
+    return {"success": True, "session_cache": session_cache.stats()}
+
+# ==================== WALLET DEBIT PRIMITIVE ====================
+
+async def debit_wallet(
+    user_id: str,
+    debits: dict,
+    credits: Optional[dict] = None,
+    minimums: Optional[dict] = None,
+    session=None
+) -> Optional[dict]:
+    """
+    Atomically debit wallet balances in a single round-trip.
+    
+    The update only matches if every debited field covers its amount (or the
+    larger floor given in `minimums`), so concurrent spends can never overdraw.
+    `credits` are applied in the same update. Returns the updated wallet, or
+    None when the balance guard fails.
+    """
+    guard = {"user_id": user_id}
+    inc = {}
+    for field, amount in debits.items():
+        guard[field] = {"$gte": max(amount, (minimums or {}).get(field, 0))}
+        inc[field] = inc.get(field, 0) - amount
+    for field, amount in (credits or {}).items():
+        inc[field] = inc.get(field, 0) + amount
+    
+    return await db.wallets.find_one_and_update(
+        guard,
+        {
+            "$inc": inc,
+            "$set": {"updated_at": datetime.now(timezone.utc)}
+        },
+        return_document=True,
+        projection={"_id": 0},
+        session=session
+    )
+
+# ==================== NOTIFICATION PIPELINE ====================
+
+NOTIFICATION_FLUSH_INTERVAL_MS = int(os.environ.get("NOTIFICATION_FLUSH_INTERVAL_MS", "250"))
+NOTIFICATION_FLUSH_BATCH_SIZE = int(os.environ.get("NOTIFICATION_FLUSH_BATCH_SIZE", "500"))
+NOTIFICATION_BUFFER_MAX = int(os.environ.get("NOTIFICATION_BUFFER_MAX", "20000"))
+
+class NotificationQueue:
+    """
+    Write-behind buffer for user notifications.
+    
+    Endpoints enqueue() instead of awaiting an insert; a background worker
+    flushes the buffer with insert_many every flush interval, or sooner once
+    a full batch is waiting. A batch that fails to insert goes back to the
+    front of the buffer for the next flush; past max_buffered the oldest
+    notifications are dropped. drain() stops the worker after its final
+    flush on shutdown.
+    """
+
+    def __init__(self, flush_interval_ms: int, batch_size: int, max_buffered: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self._buffer: list = []
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def enqueue(self, notification: dict):
+        self._buffer.append(notification)
+        self._trim()
+        if self._batch_ready and len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    def _trim(self):
+        excess = len(self._buffer) - self.max_buffered
+        if excess > 0:
+            del self._buffer[:excess]
+            # Log about once per batch rather than for every enqueue
+            if self.dropped // self.batch_size != (self.dropped + excess) // self.batch_size:
+                logger.error(f"Notification buffer full, {self.dropped + excess} dropped so far")
+            self.dropped += excess
+
+    def start(self):
+        if self._worker is None:
+            self._stopping = False
+            self._batch_ready = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Insert what is buffered now; stops at the first failed batch and keeps it for the next flush"""
+        pending = len(self._buffer)
+        while pending > 0 and self._buffer:
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            pending -= len(batch)
+            try:
+                await db.notifications.insert_many(batch, ordered=False)
+                self.flushed += len(batch)
+                continue
+            except BulkWriteError as e:
+                # insert_many stamps an _id on each document, so the ones that
+                # made it in come back as duplicates on a retry
+                errors = e.details.get("writeErrors", [])
+                failed_at = {error["index"] for error in errors if error.get("code") != 11000}
+                retry = [doc for i, doc in enumerate(batch) if i in failed_at]
+                self.flushed += len(batch) - len(retry)
+                reason = errors[0].get("errmsg") if errors else e
+            except Exception as e:
+                retry = batch
+                reason = e
+            if not retry:
+                continue
+            self.failed += len(retry)
+            logger.error(f"Notification flush failed ({len(retry)} re-buffered): {reason}")
+            self._buffer[:0] = retry
+            self._trim()
+            break
+
+    async def drain(self):
+        if self._worker:
+            # Let the worker finish its current flush and run a last one
+            self._stopping = True
+            self._batch_ready.set()
+            await self._worker
+            self._worker = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"Notification drain left {len(self._buffer)} unsaved")
+
+notification_queue = NotificationQueue(
+    NOTIFICATION_FLUSH_INTERVAL_MS, NOTIFICATION_FLUSH_BATCH_SIZE, NOTIFICATION_BUFFER_MAX
+)
+
+# ==================== DOMAIN EVENTS ====================
+
+class DomainEventBus:
+    """
+    In-process publish/subscribe for things that happened to a user.
+    
+    Endpoints emit() an event once their own writes are done; handlers
+    registered with on() run synchronously in the emitting request and must
+    not block, so they only buffer work for their own background flush. A
+    failing handler is logged and never fails the request.
+    """
+
+    def __init__(self):
+        self._handlers: dict = {}
+
+    def on(self, event_type: str):
+        def decorator(handler):
+            self._handlers.setdefault(event_type, []).append(handler)
+            return handler
+        return decorator
+
+    def emit(self, event_type: str, user_id: str, **event):
+        for handler in self._handlers.get(event_type, []):
+            try:
+                handler(user_id, **event)
+            except Exception as e:
+                logger.error(f"Domain event {event_type} handler {handler.__name__} failed: {e}")
+
+domain_events = DomainEventBus()
+
+# ==================== SHARDED COUNTERS ====================
+
+register_index("charity_wallet", [("counter_id", 1), ("shard", 1)], unique=True)
+register_index("platform_stats", [("counter_id", 1), ("shard", 1)], unique=True)
+
+COUNTER_SHARDS = int(os.environ.get("COUNTER_SHARDS", "16"))
+COUNTER_ROLLUP_TTL_SECONDS = float(os.environ.get("COUNTER_ROLLUP_TTL_SECONDS", "2"))
+
+class ShardedCounter:
+    """
+    Spreads $inc traffic for a global stats document over K shard documents.
+    
+    Each increment upserts a randomly chosen {counter_id, shard} document, so
+    concurrent writers rarely contend on the same document. read() sums the
+    numeric fields of every shard (plus the pre-sharding singleton matched by
+    legacy_filter) and caches the rollup for a short TTL.
+    """
+
+    def __init__(self, collection: str, counter_id: str, legacy_filter: dict,
+                 shards: int = COUNTER_SHARDS, rollup_ttl: float = COUNTER_ROLLUP_TTL_SECONDS):
+        self.collection = collection
+        self.counter_id = counter_id
+        self.legacy_filter = legacy_filter
+        self.shards = shards
+        self.rollup_ttl = rollup_ttl
+        self._rollup: Optional[dict] = None
+        self._rollup_until = 0.0
+
+    def increment_op(self, amounts: dict) -> tuple:
+        """(filter, update) for one shard, for callers batching their own writes"""
+        shard_filter = {"counter_id": self.counter_id, "shard": random.randrange(self.shards)}
+        update = {
+            "$inc": amounts,
+            "$set": {"updated_at": datetime.now(timezone.utc)}
+        }
+        return shard_filter, update
+
+    async def increment(self, amounts: dict, session=None):
+        shard_filter, update = self.increment_op(amounts)
+        await db[self.collection].update_one(shard_filter, update, upsert=True, session=session)
+    
+    async def seed(self, shard: str, amounts: dict):
+        """Add `amounts` once, in a named shard that a second call leaves untouched"""
+        await db[self.collection].update_one(
+            {"counter_id": self.counter_id, "shard": shard},
+            {"$setOnInsert": {**amounts, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    async def read(self, use_cache: bool = True) -> dict:
+        if use_cache and self._rollup is not None and time.monotonic() < self._rollup_until:
+            return dict(self._rollup)
+        
+        docs = await db[self.collection].find(
+            {"$or": [{"counter_id": self.counter_id}, self.legacy_filter]},
+            {"_id": 0, "counter_id": 0, "shard": 0}
+        ).to_list(None)
+        
+        rollup = {}
+        for doc in docs:
+            for field, value in doc.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    rollup[field] = rollup.get(field, 0) + value
+                elif isinstance(value, datetime):
+                    if field not in rollup or value > rollup[field]:
+                        rollup[field] = value
+                else:
+                    rollup.setdefault(field, value)
+        
+        self._rollup = rollup
+        self._rollup_until = time.monotonic() + self.rollup_ttl
+        return dict(rollup)
+
+charity_wallet_counter = ShardedCounter("charity_wallet", "global", {"counter_id": {"$exists": False}})
+platform_stats_counter = ShardedCounter("platform_stats", "main", {"stat_id": "main"})
+
+# ==================== USER LEDGER SUMMARY ====================
+
+# One document per (user_id, period): period "all" holds lifetime totals and
+# "YYYY-MM-DD" periods hold daily buckets. Write paths $inc both, so the
+# stats endpoints read two small documents instead of scanning history.
+register_index("user_ledger_summary", [("user_id", 1), ("period", 1)], unique=True)
+
+def ledger_summary_ops(user_id: str, amounts: dict, now: Optional[datetime] = None) -> list:
+    """UpdateOne ops adding dotted-path `amounts` to the lifetime and today's summary"""
+    now = now or datetime.now(timezone.utc)
+    return [
+        UpdateOne(
+            {"user_id": user_id, "period": period},
+            {"$inc": amounts, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        for period in ("all", now.strftime("%Y-%m-%d"))
+    ]
+
+async def update_ledger_summary(user_id: str, amounts: dict, session=None):
+    await db.user_ledger_summary.bulk_write(
+        ledger_summary_ops(user_id, amounts),
+        ordered=False,
+        session=session
+    )
+
+async def read_ledger_summary(user_id: str, day: Optional[str] = None) -> tuple:
+    """(lifetime, day) summary documents for a user; missing ones come back empty"""
+    day = day or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    docs = await db.user_ledger_summary.find(
+        {"user_id": user_id, "period": {"$in": ["all", day]}},
+        {"_id": 0}
+    ).to_list(2)
+    by_period = {doc["period"]: doc for doc in docs}
+    return by_period.get("all", {}), by_period.get(day, {})
+
+async def rebuild_ledger_summary(before: Optional[datetime] = None):
+    """Recompute the summary documents from the raw collections, up to the `before` watermark"""
+    buckets: dict = {}
+    
+    def add(user_id, day, amounts):
+        for period in ("all", day):
+            bucket = buckets.setdefault((user_id, period), {})
+            for field, value in amounts.items():
+                bucket[field] = bucket.get(field, 0) + value
+    
+    day_of = {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+    
+    games = db.lucky_wallet_challenges.aggregate([
+        {"$match": older_than("created_at", before)},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": "$date"},
+            "total_challenges": {"$sum": 1},
+            "wins": {"$sum": {"$cond": [{"$eq": ["$result", "win"]}, 1, 0]}},
+            "total_bet": {"$sum": "$bet_amount"},
+            "total_won": {"$sum": {"$cond": [{"$eq": ["$result", "win"]}, "$won_amount", 0]}},
+            "total_charity": {"$sum": "$charity_amount"}
+        }}
+    ])
+    async for row in games:
+        key = row.pop("_id")
+        add(key["user_id"], key["day"], {f"lucky_wallet.{k}": v for k, v in row.items()})
+    
+    contributions = db.charity_contributions.aggregate([
+        {"$match": older_than("created_at", before)},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": day_of, "source": "$source"},
+            "amount": {"$sum": "$amount"}
+        }}
+    ])
+    async for row in contributions:
+        key = row["_id"]
+        add(key["user_id"], key["day"], {
+            "charity.total": row["amount"],
+            f"charity.{key['source']}": row["amount"]
+        })
+    
+    exchanges = db.star_exchanges.aggregate([
+        {"$match": older_than("created_at", before)},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": day_of},
+            "count": {"$sum": 1},
+            "total_stars_exchanged": {"$sum": "$stars_exchanged"},
+            "total_coins_received": {"$sum": "$coins_received"},
+            "total_fees": {"$sum": "$fee_coins"}
+        }}
+    ])
+    async for row in exchanges:
+        key = row.pop("_id")
+        add(key["user_id"], key["day"], {f"star_exchange.{k}": v for k, v in row.items()})
+    
+    host_sessions = db.host_sessions.aggregate([
+        {"$match": {"status": "completed", **older_than("ended_at", before)}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ended_at"}},
+                "host_type": "$host_type"
+            },
+            "sessions": {"$sum": 1},
+            "minutes": {"$sum": "$duration_minutes"},
+            "stars": {"$sum": "$stars_earned"}
+        }}
+    ])
+    async for row in host_sessions:
+        key = row["_id"]
+        add(key["user_id"], key["day"], {
+            "host.sessions": row["sessions"],
+            f"host.{key['host_type']}_minutes": row["minutes"],
+            "host.stars": row["stars"]
+        })
+    
+    return await write_rollup_totals("user_ledger_summary", ("user_id", "period"), buckets, before)
+
+# ==================== LIVE LEADERBOARDS ====================
+
+# One document per (board, window, period, user_id) holding a running score.
+# Write paths $inc the user's row in every window, so top-N is a bounded scan
+# of the score index instead of a $group over the raw history. Window
+# boundaries follow the reward resets: UTC midnight, Monday and the 1st.
+LIVE_LEADERBOARDS = ("gifts_sent", "gifts_received", "charity", "lucky_wallet", "host", "education")
+LIVE_LEADERBOARD_WINDOWS = ("all", "daily", "weekly", "monthly")
+LIVE_LEADERBOARD_CACHE_TTL_SECONDS = float(os.environ.get("LIVE_LEADERBOARD_CACHE_TTL_SECONDS", "1"))
+
+register_index("leaderboard_scores", [("board", 1), ("window", 1), ("period", 1), ("user_id", 1)], unique=True)
+register_index("leaderboard_scores", [("board", 1), ("window", 1), ("period", 1), ("score", -1), ("user_id", 1)])
+
+def leaderboard_periods(now: Optional[datetime] = None) -> dict:
+    """Period key of every window at `now`"""
+    now = now or datetime.now(timezone.utc)
+    iso_year, iso_week, _ = now.isocalendar()
+    return {
+        "all": "all",
+        "daily": now.strftime("%Y-%m-%d"),
+        "weekly": f"{iso_year}-W{iso_week:02d}",
+        "monthly": now.strftime("%Y-%m")
+    }
+
+def leaderboard_score_ops(board: str, user_id: str, score: float, now: Optional[datetime] = None) -> list:
+    """UpdateOne ops adding `score` to the user's row in every window of a board"""
+    now = now or datetime.now(timezone.utc)
+    return [
+        UpdateOne(
+            {"board": board, "window": window, "period": period, "user_id": user_id},
+            {"$inc": {"score": score, "events": 1}, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        for window, period in leaderboard_periods(now).items()
+    ]
+
+async def record_leaderboard_score(board: str, user_id: str, score: float, session=None):
+    await db.leaderboard_scores.bulk_write(
+        leaderboard_score_ops(board, user_id, score),
+        ordered=False,
+        session=session
+    )
+
+_live_top_cache: dict = {}
+
+async def live_leaderboard_top(board: str, window: str = "all", limit: int = 10,
+                               period: Optional[str] = None) -> list:
+    """Ranked top `limit` rows of a board window, hydrated with user profiles"""
+    period = period or leaderboard_periods()[window]
+    key = (board, window, period, limit)
+    cached = _live_top_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    rows = await db.leaderboard_scores.find(
+        {"board": board, "window": window, "period": period},
+        {"_id": 0, "user_id": 1, "score": 1, "events": 1}
+    ).sort([("score", -1), ("user_id", 1)]).limit(limit).to_list(limit)
+    
+    profiles = await load_user_profiles(row["user_id"] for row in rows)
+    leaderboard = [
+        {
+            "rank": i + 1,
+            "user_id": row["user_id"],
+            "user": profiles.get(row["user_id"]),
+            "score": row["score"],
+            "events": row.get("events", 0)
+        }
+        for i, row in enumerate(rows)
+    ]
+    
+    if len(_live_top_cache) > 1000:
+        _live_top_cache.clear()
+    _live_top_cache[key] = (time.monotonic() + LIVE_LEADERBOARD_CACHE_TTL_SECONDS, leaderboard)
+    return leaderboard
+
+async def rebuild_live_leaderboards(before: Optional[datetime] = None):
+    """Recompute the leaderboard score rows from the raw collections, up to the `before` watermark"""
+    buckets: dict = {}
+    
+    def add(board, user_id, day, score, events):
+        periods = leaderboard_periods(datetime.strptime(day, "%Y-%m-%d"))
+        for window, period in periods.items():
+            bucket = buckets.setdefault((board, window, period, user_id), {"score": 0, "events": 0})
+            bucket["score"] += score
+            bucket["events"] += events
+    
+    day_of = {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+    created = older_than("created_at", before)
+    sources = [
+        ("gifts_sent", db.gift_records, created, "$sender_id", "$total_value"),
+        ("gifts_received", db.gift_records, created, "$receiver_id", "$total_value"),
+        ("charity", db.charity_contributions, created, "$user_id", "$amount"),
+        ("lucky_wallet", db.lucky_wallet_challenges, {"result": "win", **created}, "$user_id", "$won_amount"),
+        ("host", db.host_sessions, {"stars_earned": {"$gt": 0}, **older_than("ended_at", before)}, "$user_id", "$stars_earned"),
+        ("education", db.learning_sessions, created, "$user_id", {"$divide": ["$duration_minutes", 60]})
+    ]
+    for board, collection, match, user_field, score in sources:
+        rows = collection.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {"user_id": user_field, "day": day_of},
+                "score": {"$sum": score},
+                "events": {"$sum": 1}
+            }}
+        ])
+        async for row in rows:
+            add(board, row["_id"]["user_id"], row["_id"]["day"], row["score"], row["events"])
+    
+    return await write_rollup_totals(
+        "leaderboard_scores", ("board", "window", "period", "user_id"), buckets, before
+    )
+
+# ==================== LEDGER POSTING SERVICE ====================
+
+# "auto" probes the server once; "on"/"off" force transactions on or off
+LEDGER_TRANSACTIONS = os.environ.get("LEDGER_TRANSACTIONS", "auto")
+_ledger_transactions_supported: Optional[bool] = None
+
+async def ledger_transactions_supported() -> bool:
+    """Multi-document transactions need a replica set or sharded cluster"""
+    global _ledger_transactions_supported
+    if LEDGER_TRANSACTIONS != "auto":
+        return LEDGER_TRANSACTIONS == "on"
+    if _ledger_transactions_supported is None:
+        hello = await db.command("hello")
+        _ledger_transactions_supported = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+    return _ledger_transactions_supported
+
+LEDGER_TRANSACTION_ATTEMPTS = int(os.environ.get("LEDGER_TRANSACTION_ATTEMPTS", "5"))
+
+register_index("ledger_posting_failures", [("resolved", 1), ("created_at", -1)])
+
+class LedgerPosting:
+    """
+    Groups every write of one wallet operation into a single posting.
+    
+    Use as
+    
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                ...
+    
+    The wallet debit/credit runs immediately so callers can act on the guard
+    result; everything queued with insert()/update() is flushed when the
+    block exits, with inserts batched into one insert_many per collection
+    and updates into one bulk_write per collection.
+    
+    When transactions are available the whole posting commits in one
+    client-session transaction and an exception inside the block aborts it.
+    A transient transaction error (a write conflict on a hot wallet or
+    summary document, a primary step-down) aborts the attempt and attempts()
+    runs the block again in a fresh transaction, up to
+    LEDGER_TRANSACTION_ATTEMPTS times, so the block must write only through
+    the posting or with session=posting.session. An unknown commit result is
+    retried on the same transaction.
+    
+    Without transactions (standalone mongod) the block runs once and the
+    batches are sent concurrently, so a failure can leave part of a posting
+    written. To compensate, when the block or the flush fails the wallet
+    moves made through debit()/credit() and the writes registered with
+    undo() are reversed and the posting is journaled in
+    ledger_posting_failures for reconciliation. Other writes the block made
+    directly with session=posting.session are not reversed.
+    """
+
+    def __init__(self, retry_transient: bool = False):
+        self.session = None
+        self.retry_transient = retry_transient
+        self.committed = False
+        self.retrying = False
+        self._inserts: dict = {}
+        self._updates: dict = {}
+        self._notifications: list = []
+        self._after_commit: list = []
+        self._wallet_moves: list = []
+        self._undo: list = []
+
+    @classmethod
+    async def attempts(cls):
+        """Fresh postings until one commits or fails with a non-transient error"""
+        for attempt in range(LEDGER_TRANSACTION_ATTEMPTS):
+            posting = cls(retry_transient=attempt + 1 < LEDGER_TRANSACTION_ATTEMPTS)
+            yield posting
+            if not posting.retrying:
+                return
+            await asyncio.sleep(random.uniform(0, min(0.5, 0.01 * 2 ** attempt)))
+
+    async def __aenter__(self):
+        if await ledger_transactions_supported():
+            self.session = await client.start_session()
+            self.session.start_transaction()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.session:
+            return await self._exit_transaction(exc)
+        return await self._exit_plain(exc)
+
+    def _transient(self, error: Optional[BaseException]) -> bool:
+        return (
+            self.retry_transient
+            and isinstance(error, PyMongoError)
+            and error.has_error_label("TransientTransactionError")
+        )
+
+    async def _exit_transaction(self, exc: Optional[BaseException]) -> bool:
+        try:
+            if exc is None:
+                await self._flush()
+                await self._commit()
+        except PyMongoError as e:
+            if not self._transient(e):
+                raise
+            exc = e
+        finally:
+            if self.session.in_transaction:
+                await self.session.abort_transaction()
+            await self.session.end_session()
+        
+        if exc is not None:
+            if self._transient(exc):
+                logger.info(f"Ledger posting hit a transient transaction error, retrying: {exc}")
+                self.retrying = True
+                return True
+            return False
+        self._committed()
+        return False
+
+    async def _commit(self):
+        for attempt in range(LEDGER_TRANSACTION_ATTEMPTS):
+            try:
+                await self.session.commit_transaction()
+                return
+            except PyMongoError as e:
+                if not e.has_error_label("UnknownTransactionCommitResult") or attempt + 1 == LEDGER_TRANSACTION_ATTEMPTS:
+                    raise
+
+    async def _exit_plain(self, exc: Optional[BaseException]) -> bool:
+        if exc is not None:
+            if self._wallet_moves or self._undo:
+                await self._compensate(exc)
+            return False
+        try:
+            await self._flush()
+        except Exception as e:
+            await self._compensate(e)
+            raise
+        self._committed()
+        return False
+
+    def _committed(self):
+        self.committed = True
+        for notification in self._notifications:
+            notification_queue.enqueue(notification)
+        for callback in self._after_commit:
+            callback()
+
+    async def _compensate(self, error: BaseException):
+        """Reverse this posting's wallet moves and journal it (no-transaction mode only)"""
+        now = datetime.now(timezone.utc)
+        reversed_moves = True
+        for user_id, inc in reversed(self._wallet_moves):
+            try:
+                await db.wallets.update_one(
+                    {"user_id": user_id},
+                    {"$inc": {field: -amount for field, amount in inc.items()}, "$set": {"updated_at": now}}
+                )
+            except Exception as e:
+                reversed_moves = False
+                logger.error(f"Reversing wallet move for {user_id} failed: {e}")
+        undone = True
+        for collection, filter, update in reversed(self._undo):
+            try:
+                await db[collection].update_one(filter, update)
+            except Exception as e:
+                undone = False
+                logger.error(f"Undoing {collection} write failed: {e}")
+        try:
+            await db.ledger_posting_failures.insert_one({
+                "error": repr(error),
+                "wallet_moves": [{"user_id": user_id, "inc": inc} for user_id, inc in self._wallet_moves],
+                "wallet_moves_reversed": reversed_moves,
+                "undone": undone,
+                "undo": json.dumps([
+                    {"collection": collection, "filter": filter, "update": update}
+                    for collection, filter, update in self._undo
+                ], default=str),
+                # Queued writes, any of which may or may not have been applied
+                "writes": json.dumps({
+                    "inserts": self._inserts,
+                    "updates": {
+                        name: [{"filter": op._filter, "update": op._doc, "upsert": op._upsert} for op in ops]
+                        for name, ops in self._updates.items()
+                    }
+                }, default=str),
+                "resolved": False,
+                "created_at": now
+            })
+        except Exception as e:
+            logger.error(f"Journaling failed ledger posting failed: {e}")
+        logger.error(
+            f"Ledger posting failed without a transaction "
+            f"(wallet moves reversed: {reversed_moves}, undone: {undone}): {error!r}"
+        )
+
+    def _record_move(self, user_id: str, debits: dict, credits: Optional[dict], wallet: Optional[dict]):
+        if wallet is None:
+            return
+        inc = {}
+        for field, amount in debits.items():
+            inc[field] = inc.get(field, 0) - amount
+        for field, amount in (credits or {}).items():
+            inc[field] = inc.get(field, 0) + amount
+        self._wallet_moves.append((user_id, inc))
+
+    async def debit(self, user_id: str, debits: dict, credits: Optional[dict] = None,
+                    minimums: Optional[dict] = None) -> Optional[dict]:
+        wallet = await debit_wallet(user_id, debits, credits, minimums, session=self.session)
+        self._record_move(user_id, debits, credits, wallet)
+        return wallet
+
+    async def credit(self, user_id: str, credits: dict) -> Optional[dict]:
+        wallet = await debit_wallet(user_id, {}, credits, session=self.session)
+        self._record_move(user_id, {}, credits, wallet)
+        return wallet
+
+    def insert(self, collection: str, document: dict):
+        self._inserts.setdefault(collection, []).append(document)
+
+    def undo(self, collection: str, filter: dict, update: dict):
+        """Reverse a write the block made directly if the posting is compensated (no-transaction mode)"""
+        self._undo.append((collection, filter, update))
+
+    def update(self, collection: str, filter: dict, update: dict, upsert: bool = False):
+        self._updates.setdefault(collection, []).append(UpdateOne(filter, update, upsert=upsert))
+
+    def summarize(self, user_id: str, amounts: dict):
+        """Add dotted-path amounts to the user's ledger summary"""
+        self._updates.setdefault("user_ledger_summary", []).extend(ledger_summary_ops(user_id, amounts))
+
+    def score(self, board: str, user_id: str, score: float):
+        """Add to the user's live leaderboard score in every window"""
+        self._updates.setdefault("leaderboard_scores", []).extend(leaderboard_score_ops(board, user_id, score))
+
+    def increment(self, counter: ShardedCounter, amounts: dict):
+        self.update(counter.collection, *counter.increment_op(amounts), upsert=True)
+
+    def charity(self, user_id: str, amount: float, source: str, **reference):
+        """Post a charity ledger entry with its global, per-source and per-user rollups"""
+        self.insert("charity_contributions", {
+            "contribution_id": f"char_{uuid.uuid4().hex[:12]}",
+            "user_id": user_id,
+            "amount": amount,
+            "source": source,
+            **reference,
+            "created_at": datetime.now(timezone.utc)
+        })
+        self.increment(charity_wallet_counter, {
+            "total_balance": amount,
+            "total_received": amount,
+            f"source_{source}": amount
+        })
+        self.summarize(user_id, {"charity.total": amount, f"charity.{source}": amount})
+        self.score("charity", user_id, amount)
+        self._after_commit.append(lambda: live_counters.add("charity_collected", amount))
+
+    def notify(self, notification: dict):
+        """Hand a notification to the write-behind pipeline once the posting commits"""
+        self._notifications.append(notification)
+
+    async def _flush(self):
+        writes = [
+            db[name].insert_many(documents, session=self.session)
+            for name, documents in self._inserts.items()
+        ] + [
+            db[name].bulk_write(requests, ordered=False, session=self.session)
+            for name, requests in self._updates.items()
+        ]
+        if self.session:
+            # A client session must not run operations concurrently
+            for write in writes:
+                await write
+        else:
+            await asyncio.gather(*writes)
+
+# ==================== CHARITY LEDGER ====================
+
+# charity_contributions is the single charity ledger. Each entry is posted
+# together with its rollups: the global running total in the charity_wallet
+# counter shards (with a source_<source> field per source), the
+# contributor's user_ledger_summary and the live charity leaderboard.
+# Readers use the rollups and never sum the entries.
+register_index("charity_contributions", [("created_at", -1)])
+
+async def read_charity_totals() -> dict:
+    """Global charity total, undistributed balance and per-source breakdown"""
+    rollup = await charity_wallet_counter.read()
+    return {
+        "total": rollup.get("total_received", 0),
+        "balance": rollup.get("total_balance", 0),
+        "by_source": {
+            field[len("source_"):]: value
+            for field, value in rollup.items() if field.startswith("source_")
+        }
+    }
+
+async def rebuild_charity_sources(before: Optional[datetime] = None):
+    """Backfill the per-source totals from the ledger entries, up to the `before` watermark"""
+    if before:
+        totals = {}
+        async for row in db.charity_contributions.aggregate([
+            {"$match": older_than("created_at", before)},
+            {"$group": {"_id": "$source", "amount": {"$sum": "$amount"}}}
+        ]):
+            totals[f"source_{row['_id']}"] = row["amount"]
+        await charity_wallet_counter.seed("backfill", totals)
+        return totals
+    
+    rollup = await charity_wallet_counter.read(use_cache=False)
+    corrections = {}
+    async for row in db.charity_contributions.aggregate([
+        {"$group": {"_id": "$source", "amount": {"$sum": "$amount"}}}
+    ]):
+        field = f"source_{row['_id']}"
+        if row["amount"] != rollup.get(field, 0):
+            corrections[field] = row["amount"] - rollup.get(field, 0)
+    if corrections:
+        await charity_wallet_counter.increment(corrections)
+    return corrections
+
+# ==================== KEYSET PAGINATION ====================
+
+PAGE_COUNT_CACHE_TTL_SECONDS = float(os.environ.get("PAGE_COUNT_CACHE_TTL_SECONDS", "60"))
+PAGE_MAX_LIMIT = 100
+_page_count_cache: dict = {}
+
+def encode_page_cursor(doc: dict) -> str:
+    """Opaque cursor for the (created_at, _id) position of a document"""
+    created_at = doc["created_at"]
+    payload = json.dumps({"t": created_at.isoformat(), "i": str(doc["_id"])})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_page_cursor(cursor: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["i"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def keyset_page(
+    collection: str,
+    query: dict,
+    limit: int,
+    cursor: Optional[str] = None,
+    keep_id: bool = False
+) -> tuple:
+    """
+    Fetch one page of a collection ordered newest-first by (created_at, _id).
+    
+    The cursor seeks straight to the last row of the previous page, so deep
+    pages cost the same as the first one. Returns (documents, next_cursor);
+    next_cursor is None on the last page. A limit outside 1..PAGE_MAX_LIMIT
+    is rejected with 422.
+    """
+    if not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {PAGE_MAX_LIMIT}")
+    if cursor:
+        created_at, last_id = decode_page_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}}
+        ]}]}
+    
+    docs = await db[collection].find(query).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_page_cursor(docs[-1])
+    
+    if not keep_id:
+        for doc in docs:
+            doc.pop("_id", None)
+    return docs, next_cursor
+
+async def cached_count(collection: str, query: dict) -> int:
+    """count_documents memoized per query for PAGE_COUNT_CACHE_TTL_SECONDS"""
+    key = (collection, json.dumps(query, sort_keys=True, default=str))
+    cached = _page_count_cache.get(key)
+    if cached and time.monotonic() < cached[1]:
+        return cached[0]
+    
+    total = await db[collection].count_documents(query)
+    if len(_page_count_cache) > 10000:
+        _page_count_cache.clear()
+    _page_count_cache[key] = (total, time.monotonic() + PAGE_COUNT_CACHE_TTL_SECONDS)
+    return total
+
+# ==================== IDEMPOTENCY KEYS ====================
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.environ.get("IDEMPOTENCY_CACHE_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_WRITE_ATTEMPTS = 3
+
+register_index("idempotency_keys", [("key", 1)], unique=True)
+register_index("idempotency_keys", [("expires_at", 1)], expireAfterSeconds=0)
+
+# In-memory LRU of completed responses in front of the idempotency_keys
+# collection; entries expire with the key they mirror
+_idempotency_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def _remember_idempotent_response(key: str, fingerprint: str, response, expires_at: datetime):
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    _idempotency_cache[key] = (fingerprint, response, expires_at)
+    _idempotency_cache.move_to_end(key)
+    while len(_idempotency_cache) > IDEMPOTENCY_CACHE_MAX_ENTRIES:
+        _idempotency_cache.popitem(last=False)
+
+def _cached_idempotent_response(key: str) -> Optional[tuple]:
+    cached = _idempotency_cache.get(key)
+    if cached and cached[2] <= datetime.now(timezone.utc):
+        del _idempotency_cache[key]
+        return None
+    return cached
+
+async def _write_idempotency_key(action: str, *args):
+    """Retried, cancellation-shielded update of a claimed key; failures are logged"""
+    with anyio.CancelScope(shield=True):
+        for attempt in range(1, IDEMPOTENCY_WRITE_ATTEMPTS + 1):
+            try:
+                await getattr(db.idempotency_keys, action)(*args)
+                return True
+            except PyMongoError as e:
+                if attempt == IDEMPOTENCY_WRITE_ATTEMPTS:
+                    logger.error(f"Idempotency key {args[0].get('key')} {action} failed: {e}")
+                    return False
+                await asyncio.sleep(0.05 * attempt)
+
+def idempotent(scope: str):
+    """
+    Make a wallet-mutating endpoint safe to retry with an Idempotency-Key header.
+    
+    The endpoint must declare `current_user` and an `idempotency_key` Header
+    parameter. The first request claims the key; a retry with the same key
+    and body gets the stored response without re-running the endpoint, and
+    a retry while the first is still running gets 409. If the endpoint
+    fails the key is released for a retry. Keys expire after
+    IDEMPOTENCY_TTL_HOURS.
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            idempotency_key = kwargs.get("idempotency_key")
+            if not idempotency_key:
+                return await endpoint(*args, **kwargs)
+            
+            key = f"{scope}:{kwargs['current_user'].user_id}:{idempotency_key}"
+            body = kwargs.get("request")
+            fingerprint = hashlib.sha256(
+                json.dumps(jsonable_encoder(body), sort_keys=True).encode()
+            ).hexdigest()
+            
+            cached = _cached_idempotent_response(key)
+            if cached:
+                if cached[0] != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+                return cached[1]
+            
+            now = datetime.now(timezone.utc)
+            expires_at = now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+            try:
+                await db.idempotency_keys.insert_one({
+                    "key": key,
+                    "fingerprint": fingerprint,
+                    "status": "pending",
+                    "created_at": now,
+                    "expires_at": expires_at
+                })
+            except DuplicateKeyError:
+                stored = await db.idempotency_keys.find_one({"key": key}, {"_id": 0})
+                if not stored or stored["fingerprint"] != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+                if stored["status"] != "completed":
+                    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+                _remember_idempotent_response(key, fingerprint, stored["response"], stored["expires_at"])
+                return stored["response"]
+            
+            try:
+                response = jsonable_encoder(await endpoint(*args, **kwargs))
+            except BaseException:
+                # Release the key so the client can retry a failed request
+                await _write_idempotency_key("delete_one", {"key": key, "status": "pending"})
+                raise
+            
+            # Cached first so retries reaching this process are answered even
+            # if the completed record can't be written
+            _remember_idempotent_response(key, fingerprint, response, expires_at)
+            await _write_idempotency_key(
+                "update_one",
+                {"key": key},
+                {"$set": {"status": "completed", "response": response}}
+            )
+            return response
+        return wrapper
+    return decorator
+
+# ==================== LEADERBOARD SNAPSHOTS ====================
+
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get("LEADERBOARD_REFRESH_SECONDS", "60"))
+LEADERBOARD_SCHEDULER_TICK_SECONDS = float(os.environ.get("LEADERBOARD_SCHEDULER_TICK_SECONDS", "5"))
+LEADERBOARD_VARIANT_CACHE_SIZE = int(os.environ.get("LEADERBOARD_VARIANT_CACHE_SIZE", "64"))
+
+register_index("leaderboard_snapshots", [("board", 1)], unique=True)
+
+class LeaderboardEngine:
+    """
+    Serves public leaderboards from precomputed snapshots.
+    
+    Boards register a builder coroutine with @leaderboard_engine.board(name).
+    A background scheduler rebuilds each board once its refresh interval has
+    passed and stores the result in leaderboard_snapshots plus an in-process
+    copy, so requests never run the aggregation themselves. Parameterised
+    variants (e.g. a past month) are built on first request, refreshed in
+    the background once stale and kept in a bounded LRU. Concurrent rebuilds
+    of one board share a task.
+    """
+
+    def __init__(self, refresh_seconds: float, tick_seconds: float, max_variants: int):
+        self.refresh_seconds = refresh_seconds
+        self.tick_seconds = tick_seconds
+        self.max_variants = max_variants
+        self._builders: dict = {}
+        self._snapshots: dict = {}
+        self._variants: "OrderedDict[str, dict]" = OrderedDict()
+        self._inflight: dict = {}
+        self._worker: Optional[asyncio.Task] = None
+
+    def board(self, name: str, refresh_seconds: Optional[float] = None):
+        def decorator(builder):
+            self._builders[name] = (builder, refresh_seconds or self.refresh_seconds)
+            return builder
+        return decorator
+
+    @staticmethod
+    def _key(name: str, args: tuple) -> str:
+        return ":".join((name,) + tuple(str(a) for a in args))
+
+    def _is_stale(self, name: str, snapshot: dict) -> bool:
+        age = (datetime.now(timezone.utc) - snapshot["last_updated"]).total_seconds()
+        return age >= self._builders[name][1]
+
+    def _cached(self, key: str, args: tuple) -> Optional[dict]:
+        if not args:
+            return self._snapshots.get(key)
+        snapshot = self._variants.get(key)
+        if snapshot is not None:
+            self._variants.move_to_end(key)
+        return snapshot
+
+    def _store(self, key: str, args: tuple, snapshot: dict):
+        if not args:
+            self._snapshots[key] = snapshot
+            return
+        self._variants[key] = snapshot
+        self._variants.move_to_end(key)
+        while len(self._variants) > self.max_variants:
+            self._variants.popitem(last=False)
+
+    async def _rebuild(self, name: str, args: tuple) -> dict:
+        builder, _ = self._builders[name]
+        key = self._key(name, args)
+        
+        # Another worker process may have rebuilt this board already
+        stored = await db.leaderboard_snapshots.find_one({"board": key}, {"_id": 0})
+        if stored:
+            if stored["last_updated"].tzinfo is None:
+                stored["last_updated"] = stored["last_updated"].replace(tzinfo=timezone.utc)
+            if not self._is_stale(name, stored):
+                self._store(key, args, stored)
+                return stored
+        
+        snapshot = {
+            "board": key,
+            "data": await builder(*args),
+            "last_updated": datetime.now(timezone.utc)
+        }
+        await db.leaderboard_snapshots.replace_one({"board": key}, snapshot, upsert=True)
+        self._store(key, args, snapshot)
+        return snapshot
+
+    async def refresh(self, name: str, *args) -> dict:
+        key = self._key(name, args)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._rebuild(name, args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _refresh_quietly(self, name: str, *args):
+        try:
+            await self.refresh(name, *args)
+        except Exception as e:
+            logger.error(f"Leaderboard {self._key(name, args)} refresh failed: {e}")
+
+    async def serve(self, name: str, *args) -> dict:
+        """Latest snapshot of a board with its last_updated stamp"""
+        key = self._key(name, args)
+        snapshot = self._cached(key, args)
+        if snapshot is None:
+            snapshot = await self.refresh(name, *args)
+        elif args and key not in self._inflight and self._is_stale(name, snapshot):
+            asyncio.create_task(self._refresh_quietly(name, *args))
+        return {**snapshot["data"], "last_updated": snapshot["last_updated"].isoformat()}
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            for name in list(self._builders):
+                snapshot = self._snapshots.get(name)
+                if snapshot is None or self._is_stale(name, snapshot):
+                    await self._refresh_quietly(name)
+            await asyncio.sleep(self.tick_seconds)
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+leaderboard_engine = LeaderboardEngine(
+    LEADERBOARD_REFRESH_SECONDS, LEADERBOARD_SCHEDULER_TICK_SECONDS, LEADERBOARD_VARIANT_CACHE_SIZE
+)
+
 # ==================== WALLET ENDPOINTS ====================
 
+register_index("wallets", [("user_id", 1)], unique=True)
+register_index("wallet_transactions", [("user_id", 1), ("created_at", -1)])
+register_index("wallet_transactions", [("user_id", 1), ("transaction_type", 1), ("created_at", -1)])
+register_index("wallet_transactions", [("transaction_type", 1), ("status", 1)])
+# Partial: rows written before every writer set a transaction_id have none
+register_index(
+    "wallet_transactions", [("transaction_id", 1)],
+    unique=True, partialFilterExpression={"transaction_id": {"$exists": True}}
+)
+
 @api_router.get("/wallet")
 async def get_wallet(current_user: User = Depends(get_current_user)):
     """Get user's wallet"""
@@ -876,37 +2366,50 @@ async def get_wallet(current_user: User = Depends(get_current_user)):
 
 @api_router.get("/wallet/transactions")
 async def get_transactions(
-    limit: int = 20,
-    offset: int = 0,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     transaction_type: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Get user's wallet transactions"""
+    """
+    Get user's wallet transactions (pass next_cursor back as cursor for the next page).
+    
+    total is still returned by default; callers paging by cursor can pass
+    include_total=false to skip the count.
+    """
     query = {"user_id": current_user.user_id}
     if transaction_type:
         query["transaction_type"] = transaction_type
     
-    transactions = await db.wallet_transactions.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
-    
-    total = await db.wallet_transactions.count_documents(query)
+    if offset and not cursor:
+        # Legacy offset paging
+        transactions = await db.wallet_transactions.find(
+            query,
+            {"_id": 0}
+        ).sort("created_at", -1).skip(offset).limit(limit).to_list(limit)
+        next_cursor = None
+    else:
+        transactions, next_cursor = await keyset_page("wallet_transactions", query, limit, cursor)
     
     return {
         "transactions": transactions,
-        "total": total,
+        "total": await cached_count("wallet_transactions", query) if include_total else None,
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor
     }
 
 class DepositRequest(BaseModel):
     amount: float
 
 @api_router.post("/wallet/deposit")
+@idempotent("wallet_deposit")
 async def deposit(
     request: DepositRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Deposit coins to wallet (mock - for MVP)"""
     if request.amount <= 0:
@@ -964,7 +2467,7 @@ async def deposit(
             eligible_level = level_data["level"]
     
     # Add notification
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "title": "Deposit Successful! 💰",
@@ -994,28 +2497,15 @@ async def withdraw(
     if request.amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be positive")
     
-    wallet = await db.wallets.find_one(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
+    wallet = await debit_wallet(
+        current_user.user_id,
+        {"withdrawable_balance": request.amount},
+        credits={"total_withdrawn": request.amount}
     )
     
-    if wallet["withdrawable_balance"] < request.amount:
+    if not wallet:
         raise HTTPException(status_code=400, detail="Insufficient withdrawable balance")
     
-    # Update wallet
-    wallet = await db.wallets.find_one_and_update(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {
-                "withdrawable_balance": -request.amount,
-                "total_withdrawn": request.amount
-            },
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        },
-        return_document=True,
-        projection={"_id": 0}
-    )
-    
     # Create transaction
     transaction_id = f"txn_{uuid.uuid4().hex[:12]}"
     await db.wallet_transactions.insert_one({
@@ -1030,7 +2520,7 @@ async def withdraw(
     })
     
     # Add notification
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "title": "Withdrawal Requested 📤",
@@ -1068,32 +2558,21 @@ async def transfer_balance(
     if request.amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be positive")
     
-    wallet = await db.wallets.find_one(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
+    wallet = await debit_wallet(
+        current_user.user_id,
+        {from_field: request.amount},
+        credits={to_field: request.amount}
     )
     
-    if wallet[from_field] < request.amount:
+    if not wallet:
         raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    # Update wallet
-    wallet = await db.wallets.find_one_and_update(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {
-                from_field: -request.amount,
-                to_field: request.amount
-            },
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        },
-        return_document=True,
-        projection={"_id": 0}
-    )
-    
     return {"success": True, "wallet": wallet}
 
 # ==================== VIP ENDPOINTS ====================
 
+register_index("vip_status", [("user_id", 1)], unique=True, dedupe=drop_duplicate_documents)
+
 @api_router.get("/vip/levels")
 async def get_vip_levels():
     """Get all VIP levels and their benefits"""
@@ -1169,24 +2648,15 @@ async def subscribe_vip(
             detail=f"Need to recharge {level_data['recharge_requirement']} to unlock this level"
         )
     
-    # Check wallet balance
-    wallet = await db.wallets.find_one(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
+    # Deduct fee from wallet
+    wallet = await debit_wallet(
+        current_user.user_id,
+        {"coins_balance": level_data["monthly_fee"]}
     )
     
-    if wallet["coins_balance"] < level_data["monthly_fee"]:
+    if not wallet:
         raise HTTPException(status_code=400, detail="Insufficient coins balance")
     
-    # Deduct fee from wallet
-    await db.wallets.update_one(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {"coins_balance": -level_data["monthly_fee"]},
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        }
-    )
-    
     # Update VIP status
     now = datetime.now(timezone.utc)
     subscription_end = now + timedelta(days=30)
@@ -1218,7 +2688,7 @@ async def subscribe_vip(
     })
     
     # Add notification
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "title": f"VIP {level_data['name']} Activated! 👑",
@@ -1278,7 +2748,7 @@ async def cancel_vip(current_user: User = Depends(get_current_user)):
     )
     
     # Add notification
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "title": "VIP Subscription Cancelled",
@@ -1293,10 +2763,14 @@ async def cancel_vip(current_user: User = Depends(get_current_user)):
 
 # ==================== NOTIFICATION ENDPOINTS ====================
 
+register_index("notifications", [("user_id", 1), ("created_at", -1)])
+register_index("notifications", [("user_id", 1), ("is_read", 1)])
+
 @api_router.get("/notifications")
 async def get_notifications(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
     unread_only: bool = False,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get user notifications"""
@@ -1304,10 +2778,7 @@ async def get_notifications(
     if unread_only:
         query["is_read"] = False
     
-    notifications = await db.notifications.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+    notifications, next_cursor = await keyset_page("notifications", query, limit, cursor)
     
     unread_count = await db.notifications.count_documents({
         "user_id": current_user.user_id,
@@ -1316,7 +2787,8 @@ async def get_notifications(
     
     return {
         "notifications": notifications,
-        "unread_count": unread_count
+        "unread_count": unread_count,
+        "next_cursor": next_cursor
     }
 
 @api_router.post("/notifications/{notification_id}/read")
@@ -1347,6 +2819,11 @@ async def mark_all_notifications_read(current_user: User = Depends(get_current_u
 
 # ==================== ACTIVITY REWARD SYSTEM ====================
 
+register_index(
+    "activity_sessions", [("user_id", 1), ("date", 1)],
+    unique=True, dedupe=lambda collection, fields: merge_duplicate_activity_sessions()
+)
+
 # Reward Configuration
 ACTIVITY_REWARD_CONFIG = {
     "minutes_required": 15,
@@ -1364,35 +2841,217 @@ class ActivitySession(BaseModel):
     rewards_claimed: int = 0
     date: str  # YYYY-MM-DD format for daily tracking
 
+async def touch_activity_session(user_id: str, date: str, minutes: int = 0,
+                                 now: Optional[datetime] = None) -> dict:
+    """
+    The user's activity session for `date` after adding `minutes`, created
+    on first touch. One atomic upsert, so concurrent first requests of the
+    day cannot create two documents.
+    """
+    now = now or datetime.now(timezone.utc)
+    update = {
+        "$setOnInsert": {
+            "session_id": f"activity_{uuid.uuid4().hex[:12]}",
+            "started_at": now,
+            "rewards_claimed": 0
+        },
+        "$inc": {"total_active_minutes": minutes}
+    }
+    if minutes:
+        update["$set"] = {"last_active_at": now}
+    else:
+        update["$setOnInsert"]["last_active_at"] = now
+    
+    for attempt in range(2):
+        try:
+            return await db.activity_sessions.find_one_and_update(
+                {"user_id": user_id, "date": date},
+                update,
+                upsert=True,
+                return_document=True,
+                projection={"_id": 0}
+            )
+        except DuplicateKeyError:
+            # Lost the insert race; the retry matches the winner's document
+            if attempt:
+                raise
+
+def activity_rewards_available(activity: dict) -> int:
+    """Rewards earned by active minutes and not yet claimed, within the daily cap"""
+    rewards_earned = activity["total_active_minutes"] // ACTIVITY_REWARD_CONFIG["minutes_required"]
+    return max(0, min(
+        rewards_earned - activity["rewards_claimed"],
+        ACTIVITY_REWARD_CONFIG["max_daily_rewards"] - activity["rewards_claimed"]
+    ))
+
+async def merge_duplicate_activity_sessions():
+    """Fold duplicate (user_id, date) sessions into one so the unique index can build (one-off)"""
+    merged = 0
+    duplicates = db.activity_sessions.aggregate([
+        {"$group": {
+            "_id": {"user_id": "$user_id", "date": "$date"},
+            "ids": {"$push": "$_id"},
+            "total_active_minutes": {"$sum": "$total_active_minutes"},
+            "rewards_claimed": {"$sum": "$rewards_claimed"},
+            "started_at": {"$min": "$started_at"},
+            "last_active_at": {"$max": "$last_active_at"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    async for group in duplicates:
+        keep, *extra = group["ids"]
+        await db.activity_sessions.update_one({"_id": keep}, {"$set": {
+            "total_active_minutes": group["total_active_minutes"],
+            "rewards_claimed": group["rewards_claimed"],
+            "started_at": group["started_at"],
+            "last_active_at": group["last_active_at"]
+        }})
+        await db.activity_sessions.delete_many({"_id": {"$in": extra}})
+        merged += len(extra)
+    return merged
+
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = float(os.environ.get("HEARTBEAT_FLUSH_INTERVAL_SECONDS", "5"))
+HEARTBEAT_MIN_INTERVAL_SECONDS = float(os.environ.get("HEARTBEAT_MIN_INTERVAL_SECONDS", "50"))
+HEARTBEAT_IDLE_EVICT_SECONDS = float(os.environ.get("HEARTBEAT_IDLE_EVICT_SECONDS", "600"))
+
+class ActivityHeartbeatBuffer:
+    """
+    Absorbs /rewards/track-activity heartbeats in memory.
+    
+    Each (user_id, date) keeps the minutes already persisted, the minutes
+    still pending and the rewards claimed, so a beat is answered without
+    touching the database. A background worker flushes all pending minutes
+    as one bulk_write of upserting $inc updates every flush interval. Beats
+    closer together than HEARTBEAT_MIN_INTERVAL_SECONDS count once, so two
+    open tabs do not earn double minutes.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._entries: dict = {}
+        self._lock = asyncio.Lock()
+        self._worker: Optional[asyncio.Task] = None
+        self.flushed = 0
+
+    async def _entry(self, user_id: str, date: str) -> dict:
+        entry = self._entries.get((user_id, date))
+        if entry is None:
+            activity = await touch_activity_session(user_id, date)
+            entry = self._entries.setdefault((user_id, date), {
+                "persisted": activity["total_active_minutes"],
+                "rewards_claimed": activity["rewards_claimed"],
+                "pending": 0,
+                "last_beat": 0.0,
+                "last_active_at": None
+            })
+        return entry
+
+    async def beat(self, user_id: str, date: str, now: datetime) -> dict:
+        """Count one active minute; returns {total_active_minutes, rewards_claimed}"""
+        entry = await self._entry(user_id, date)
+        if time.monotonic() - entry["last_beat"] >= HEARTBEAT_MIN_INTERVAL_SECONDS:
+            entry["pending"] += 1
+            entry["last_beat"] = time.monotonic()
+            entry["last_active_at"] = now
+        return {
+            "total_active_minutes": entry["persisted"] + entry["pending"],
+            "rewards_claimed": entry["rewards_claimed"]
+        }
+
+    def _flush_op(self, key: tuple, entry: dict) -> UpdateOne:
+        user_id, date = key
+        return UpdateOne(
+            {"user_id": user_id, "date": date},
+            {
+                "$inc": {"total_active_minutes": entry["pending"]},
+                "$set": {"last_active_at": entry["last_active_at"]},
+                "$setOnInsert": {
+                    "session_id": f"activity_{uuid.uuid4().hex[:12]}",
+                    "started_at": entry["last_active_at"],
+                    "rewards_claimed": 0
+                }
+            },
+            upsert=True
+        )
+
+    async def flush(self):
+        async with self._lock:
+            pending = [(key, entry) for key, entry in self._entries.items() if entry["pending"]]
+            if pending:
+                counts = {key: entry["pending"] for key, entry in pending}
+                try:
+                    await db.activity_sessions.bulk_write(
+                        [self._flush_op(key, entry) for key, entry in pending],
+                        ordered=False
+                    )
+                except BulkWriteError as e:
+                    # Unordered: everything except the reported failures was applied
+                    failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                    logger.error(f"Activity heartbeat flush: {len(failed)} sessions kept pending")
+                    pending = [item for i, item in enumerate(pending) if i not in failed]
+                except Exception as e:
+                    logger.error(f"Activity heartbeat flush failed ({len(pending)} sessions kept pending): {e}")
+                    return
+                # Beats that arrived during the write stay pending for the next flush
+                for key, entry in pending:
+                    entry["pending"] -= counts[key]
+                    entry["persisted"] += counts[key]
+                self.flushed += len(pending)
+        
+        idle_before = time.monotonic() - HEARTBEAT_IDLE_EVICT_SECONDS
+        for key in [k for k, e in self._entries.items() if not e["pending"] and e["last_beat"] < idle_before]:
+            del self._entries[key]
+
+    async def flush_user(self, user_id: str, date: str):
+        """Persist one user's pending minutes now (before reads that need them)"""
+        async with self._lock:
+            entry = self._entries.get((user_id, date))
+            if entry and entry["pending"]:
+                count = entry["pending"]
+                await db.activity_sessions.bulk_write([self._flush_op((user_id, date), entry)])
+                entry["pending"] -= count
+                entry["persisted"] += count
+
+    def note_claim(self, user_id: str, date: str):
+        """Keep the cached rewards_claimed in step with a successful claim"""
+        entry = self._entries.get((user_id, date))
+        if entry:
+            entry["rewards_claimed"] += 1
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def drain(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.flush()
+
+activity_heartbeats = ActivityHeartbeatBuffer(HEARTBEAT_FLUSH_INTERVAL_SECONDS)
+
 @api_router.get("/rewards/activity-status")
 async def get_activity_status(current_user: User = Depends(get_current_user)):
     """Get user's current activity status and progress towards reward"""
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    await activity_heartbeats.flush_user(current_user.user_id, today)
     
     # Get or create today's activity session
-    activity = await db.activity_sessions.find_one(
-        {"user_id": current_user.user_id, "date": today},
-        {"_id": 0}
-    )
-    
-    if not activity:
-        activity = {
-            "session_id": f"activity_{uuid.uuid4().hex[:12]}",
-            "user_id": current_user.user_id,
-            "started_at": datetime.now(timezone.utc),
-            "last_active_at": datetime.now(timezone.utc),
-            "total_active_minutes": 0,
-            "rewards_claimed": 0,
-            "date": today
-        }
-        await db.activity_sessions.insert_one(activity)
+    activity = await touch_activity_session(current_user.user_id, today)
     
     # Calculate progress
     minutes_towards_next = activity["total_active_minutes"] % ACTIVITY_REWARD_CONFIG["minutes_required"]
-    rewards_available = min(
-        (activity["total_active_minutes"] // ACTIVITY_REWARD_CONFIG["minutes_required"]) - activity["rewards_claimed"],
-        ACTIVITY_REWARD_CONFIG["max_daily_rewards"] - activity["rewards_claimed"]
-    )
+    rewards_available = activity_rewards_available(activity)
     
     return {
         "today": today,
@@ -1401,7 +3060,7 @@ async def get_activity_status(current_user: User = Depends(get_current_user)):
         "minutes_required": ACTIVITY_REWARD_CONFIG["minutes_required"],
         "progress_percent": (minutes_towards_next / ACTIVITY_REWARD_CONFIG["minutes_required"]) * 100,
         "rewards_claimed_today": activity["rewards_claimed"],
-        "rewards_available": max(0, rewards_available),
+        "rewards_available": rewards_available,
         "max_daily_rewards": ACTIVITY_REWARD_CONFIG["max_daily_rewards"],
         "coins_per_reward": ACTIVITY_REWARD_CONFIG["coins_reward"]
     }
@@ -1414,45 +3073,16 @@ async def track_activity(
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     now = datetime.now(timezone.utc)
     
-    # Get or create today's activity session
-    activity = await db.activity_sessions.find_one(
-        {"user_id": current_user.user_id, "date": today},
-        {"_id": 0}
-    )
-    
-    if not activity:
-        activity = {
-            "session_id": f"activity_{uuid.uuid4().hex[:12]}",
-            "user_id": current_user.user_id,
-            "started_at": now,
-            "last_active_at": now,
-            "total_active_minutes": 1,
-            "rewards_claimed": 0,
-            "date": today
-        }
-        await db.activity_sessions.insert_one(activity)
-    else:
-        # Update activity
-        await db.activity_sessions.update_one(
-            {"user_id": current_user.user_id, "date": today},
-            {
-                "$set": {"last_active_at": now},
-                "$inc": {"total_active_minutes": 1}
-            }
-        )
-        activity["total_active_minutes"] += 1
+    # Count the minute in memory; the heartbeat buffer persists it in bulk
+    activity = await activity_heartbeats.beat(current_user.user_id, today, now)
     
     # Check if reward is available
-    rewards_earned = activity["total_active_minutes"] // ACTIVITY_REWARD_CONFIG["minutes_required"]
-    rewards_available = min(
-        rewards_earned - activity["rewards_claimed"],
-        ACTIVITY_REWARD_CONFIG["max_daily_rewards"] - activity["rewards_claimed"]
-    )
+    rewards_available = activity_rewards_available(activity)
     
     return {
         "success": True,
         "total_active_minutes": activity["total_active_minutes"],
-        "rewards_available": max(0, rewards_available),
+        "rewards_available": rewards_available,
         "can_claim": rewards_available > 0
     }
 
@@ -1460,89 +3090,94 @@ async def track_activity(
 async def claim_activity_reward(current_user: User = Depends(get_current_user)):
     """Claim activity reward after 15 minutes of activity"""
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    await activity_heartbeats.flush_user(current_user.user_id, today)
     
-    activity = await db.activity_sessions.find_one(
-        {"user_id": current_user.user_id, "date": today},
-        {"_id": 0}
-    )
-    
-    if not activity:
-        raise HTTPException(status_code=400, detail="No activity recorded today")
-    
-    # Check if reward is available
-    rewards_earned = activity["total_active_minutes"] // ACTIVITY_REWARD_CONFIG["minutes_required"]
-    rewards_available = min(
-        rewards_earned - activity["rewards_claimed"],
-        ACTIVITY_REWARD_CONFIG["max_daily_rewards"] - activity["rewards_claimed"]
-    )
-    
-    if rewards_available <= 0:
-        raise HTTPException(status_code=400, detail="No rewards available to claim")
-    
-    # Check if reached daily limit
-    if activity["rewards_claimed"] >= ACTIVITY_REWARD_CONFIG["max_daily_rewards"]:
-        raise HTTPException(status_code=400, detail="Daily reward limit reached")
-    
-    # Calculate reward amount
-    reward_amount = ACTIVITY_REWARD_CONFIG["coins_reward"]
-    is_first_reward = activity["rewards_claimed"] == 0
-    
-    # Add daily bonus for first reward
-    if is_first_reward:
-        reward_amount += ACTIVITY_REWARD_CONFIG["daily_bonus_coins"]
-    
-    # Update activity rewards claimed
-    await db.activity_sessions.update_one(
-        {"user_id": current_user.user_id, "date": today},
-        {"$inc": {"rewards_claimed": 1}}
-    )
-    
-    # Add reward to wallet
-    wallet = await db.wallets.find_one_and_update(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {"coins_balance": reward_amount},
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        },
-        return_document=True,
-        projection={"_id": 0}
-    )
-    
-    # Create transaction
     transaction_id = f"txn_{uuid.uuid4().hex[:12]}"
-    description = f"Activity reward ({activity['rewards_claimed'] + 1}/{ACTIVITY_REWARD_CONFIG['max_daily_rewards']})"
-    if is_first_reward:
-        description += " + Daily bonus"
-    
-    await db.wallet_transactions.insert_one({
-        "transaction_id": transaction_id,
-        "user_id": current_user.user_id,
-        "transaction_type": TransactionType.ACTIVITY_REWARD,
-        "amount": reward_amount,
-        "currency_type": "coins",
-        "status": TransactionStatus.COMPLETED,
-        "description": description,
-        "created_at": datetime.now(timezone.utc)
-    })
+    now = datetime.now(timezone.utc)
     
-    # Add notification
-    await db.notifications.insert_one({
-        "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
-        "user_id": current_user.user_id,
-        "title": "Activity Reward Claimed! 🎉",
-        "message": f"You earned {reward_amount} coins for being active!",
-        "notification_type": "reward",
-        "is_read": False,
-        "action_url": "/rewards",
-        "created_at": datetime.now(timezone.utc)
-    })
+    async for posting in LedgerPosting.attempts():
+        async with posting:
+            # Claim one reward only if minutes earned it and the daily cap allows it
+            activity = await db.activity_sessions.find_one_and_update(
+                {
+                    "user_id": current_user.user_id,
+                    "date": today,
+                    "rewards_claimed": {"$lt": ACTIVITY_REWARD_CONFIG["max_daily_rewards"]},
+                    "$expr": {"$lt": [
+                        "$rewards_claimed",
+                        {"$floor": {"$divide": ["$total_active_minutes", ACTIVITY_REWARD_CONFIG["minutes_required"]]}}
+                    ]}
+                },
+                {"$inc": {"rewards_claimed": 1}},
+                return_document=True,
+                projection={"_id": 0},
+                session=posting.session
+            )
+            if activity:
+                # Give the claim back if the payout below never lands
+                posting.undo(
+                    "activity_sessions",
+                    {"user_id": current_user.user_id, "date": today, "rewards_claimed": {"$gt": 0}},
+                    {"$inc": {"rewards_claimed": -1}}
+                )
+            
+            if not activity:
+                current = await db.activity_sessions.find_one(
+                    {"user_id": current_user.user_id, "date": today},
+                    {"_id": 0, "rewards_claimed": 1}
+                )
+                if not current:
+                    raise HTTPException(status_code=400, detail="No activity recorded today")
+                if current["rewards_claimed"] >= ACTIVITY_REWARD_CONFIG["max_daily_rewards"]:
+                    raise HTTPException(status_code=400, detail="Daily reward limit reached")
+                raise HTTPException(status_code=400, detail="No rewards available to claim")
+            
+            # Calculate reward amount
+            reward_amount = ACTIVITY_REWARD_CONFIG["coins_reward"]
+            is_first_reward = activity["rewards_claimed"] == 1
+            
+            # Add daily bonus for first reward
+            if is_first_reward:
+                reward_amount += ACTIVITY_REWARD_CONFIG["daily_bonus_coins"]
+            
+            description = f"Activity reward ({activity['rewards_claimed']}/{ACTIVITY_REWARD_CONFIG['max_daily_rewards']})"
+            if is_first_reward:
+                description += " + Daily bonus"
+            
+            # Add reward to wallet
+            wallet = await posting.credit(current_user.user_id, {"coins_balance": reward_amount})
+            
+            # Create transaction
+            posting.insert("wallet_transactions", {
+                "transaction_id": transaction_id,
+                "user_id": current_user.user_id,
+                "transaction_type": TransactionType.ACTIVITY_REWARD,
+                "amount": reward_amount,
+                "currency_type": "coins",
+                "status": TransactionStatus.COMPLETED,
+                "description": description,
+                "created_at": now
+            })
+            
+            # Add notification
+            posting.notify({
+                "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
+                "user_id": current_user.user_id,
+                "title": "Activity Reward Claimed! 🎉",
+                "message": f"You earned {reward_amount} coins for being active!",
+                "notification_type": "reward",
+                "is_read": False,
+                "action_url": "/rewards",
+                "created_at": now
+            })
+    activity_heartbeats.note_claim(current_user.user_id, today)
     
     return {
         "success": True,
         "reward_amount": reward_amount,
         "is_first_reward": is_first_reward,
         "daily_bonus_included": is_first_reward,
-        "rewards_claimed_today": activity["rewards_claimed"] + 1,
+        "rewards_claimed_today": activity["rewards_claimed"],
         "wallet_balance": wallet["coins_balance"],
         "transaction_id": transaction_id
     }
@@ -1596,6 +3231,12 @@ async def get_daily_summary(current_user: User = Depends(get_current_user)):
 
 # ==================== AGENCY/COMMISSION SYSTEM ====================
 
+register_index("agency_status", [("user_id", 1)], unique=True, dedupe=drop_duplicate_documents)
+register_index("agency_status", [("referral_code", 1)])
+register_index("referrals", [("referrer_id", 1)])
+register_index("referrals", [("referred_id", 1)])
+register_index("commissions", [("user_id", 1), ("created_at", -1)])
+
 """
 DETAILED AGENT COMMISSION STRUCTURE:
 
@@ -1691,8 +3332,7 @@ async def get_agency_status(current_user: User = Depends(get_current_user)):
         # Create agency status for user
         referral_code = f"MN{uuid.uuid4().hex[:8].upper()}"
         today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        agency = {
-            "user_id": current_user.user_id,
+        agency = await find_or_create("agency_status", {"user_id": current_user.user_id}, {
             "agency_level": 0,
             "referral_code": referral_code,
             "total_referrals": 0,
@@ -1707,8 +3347,7 @@ async def get_agency_status(current_user: User = Depends(get_current_user)):
             "is_banned": False,
             "created_at": datetime.now(timezone.utc),
             "updated_at": datetime.now(timezone.utc)
-        }
-        await db.agency_status.insert_one(agency)
+        })
     
     # Calculate 30-day earnings
     thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
@@ -1868,7 +3507,7 @@ async def apply_referral_code(
     )
     
     # Add notification to referrer
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": referrer_agency["user_id"],
         "title": "New Referral! 🎉",
@@ -1893,30 +3532,20 @@ async def convert_stars_to_coins(
     if request.stars_amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be positive")
     
-    wallet = await db.wallets.find_one(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
-    )
-    
-    if wallet["stars_balance"] < request.stars_amount:
-        raise HTTPException(status_code=400, detail="Insufficient stars balance")
-    
     # Calculate conversion with 8% fee
     fee_amount = request.stars_amount * (STARS_TO_COINS_FEE / 100)
     coins_received = request.stars_amount - fee_amount
     
     # Update wallet
-    await db.wallets.update_one(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {
-                "stars_balance": -request.stars_amount,
-                "coins_balance": coins_received
-            },
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        }
+    wallet = await debit_wallet(
+        current_user.user_id,
+        {"stars_balance": request.stars_amount},
+        credits={"coins_balance": coins_received}
     )
     
+    if not wallet:
+        raise HTTPException(status_code=400, detail="Insufficient stars balance")
+    
     # Create transaction
     transaction_id = f"txn_{uuid.uuid4().hex[:12]}"
     await db.wallet_transactions.insert_one({
@@ -1959,6 +3588,11 @@ async def get_commission_history(
 
 # ==================== WITHDRAWAL SYSTEM ====================
 
+register_index("withdrawals", [("user_id", 1), ("created_at", -1)])
+register_index("withdrawals", [("withdrawal_id", 1)])
+register_index("payment_methods", [("user_id", 1)])
+register_index("payment_methods", [("method_id", 1)])
+
 WITHDRAWAL_CONFIG = {
     "min_stars_required": 100000,
     "processing_time_days": 3,
@@ -2070,24 +3704,9 @@ async def create_withdrawal_request(
     current_user: User = Depends(get_current_user)
 ):
     """Create a withdrawal request"""
-    wallet = await db.wallets.find_one(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
-    )
-    
-    # Check minimum stars requirement
-    if wallet["stars_balance"] < WITHDRAWAL_CONFIG["min_stars_required"]:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Minimum {WITHDRAWAL_CONFIG['min_stars_required']} stars required for withdrawal"
-        )
-    
     if request.amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be positive")
     
-    if request.amount > wallet["stars_balance"]:
-        raise HTTPException(status_code=400, detail="Insufficient stars balance")
-    
     # Get payment method
     payment_method = await db.payment_methods.find_one(
         {"method_id": request.payment_method_id, "user_id": current_user.user_id},
@@ -2108,6 +3727,25 @@ async def create_withdrawal_request(
     withdrawal_id = f"wd_{uuid.uuid4().hex[:12]}"
     processing_days = WITHDRAWAL_CONFIG["vip_processing_time_days"] if is_vip else WITHDRAWAL_CONFIG["processing_time_days"]
     
+    # Deduct stars from wallet (balance must also meet the withdrawal minimum)
+    wallet = await debit_wallet(
+        current_user.user_id,
+        {"stars_balance": request.amount},
+        minimums={"stars_balance": WITHDRAWAL_CONFIG["min_stars_required"]}
+    )
+    
+    if not wallet:
+        current = await db.wallets.find_one(
+            {"user_id": current_user.user_id},
+            {"_id": 0, "stars_balance": 1}
+        )
+        if not current or current["stars_balance"] < WITHDRAWAL_CONFIG["min_stars_required"]:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Minimum {WITHDRAWAL_CONFIG['min_stars_required']} stars required for withdrawal"
+            )
+        raise HTTPException(status_code=400, detail="Insufficient stars balance")
+    
     withdrawal = {
         "withdrawal_id": withdrawal_id,
         "user_id": current_user.user_id,
@@ -2125,15 +3763,6 @@ async def create_withdrawal_request(
     
     await db.withdrawals.insert_one(withdrawal)
     
-    # Deduct stars from wallet
-    await db.wallets.update_one(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {"stars_balance": -request.amount},
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        }
-    )
-    
     # Create transaction
     await db.wallet_transactions.insert_one({
         "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
@@ -2148,7 +3777,7 @@ async def create_withdrawal_request(
     })
     
     # Add notification
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "title": "Withdrawal Request Submitted 📤",
@@ -2170,16 +3799,19 @@ async def create_withdrawal_request(
 
 @api_router.get("/withdrawal/history")
 async def get_withdrawal_history(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get withdrawal history"""
-    withdrawals = await db.withdrawals.find(
+    withdrawals, next_cursor = await keyset_page(
+        "withdrawals",
         {"user_id": current_user.user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+        limit,
+        cursor
+    )
     
-    return {"withdrawals": withdrawals}
+    return {"withdrawals": withdrawals, "next_cursor": next_cursor}
 
 @api_router.post("/withdrawal/{withdrawal_id}/verify-face")
 async def verify_face_for_withdrawal(
@@ -2211,7 +3843,7 @@ async def verify_face_for_withdrawal(
     )
     
     # Add notification
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "title": "Face Verification Complete ✅",
@@ -2226,6 +3858,8 @@ async def verify_face_for_withdrawal(
 
 # ==================== CHARITY SYSTEM ====================
 
+register_index("charity_contributions", [("user_id", 1), ("created_at", -1)])
+
 CHARITY_CONFIG = {
     "vip_gift_charity_percent": 2,  # 2% of VIP gift income goes to charity
 }
@@ -2233,18 +3867,15 @@ CHARITY_CONFIG = {
 @api_router.get("/charity/stats")
 async def get_charity_stats(current_user: User = Depends(get_current_user)):
     """Get charity statistics"""
-    # Get global charity wallet
-    charity_wallet = await db.charity_wallet.find_one({}, {"_id": 0})
-    
-    if not charity_wallet:
-        charity_wallet = {
-            "total_balance": 0,
-            "total_received": 0,
-            "total_distributed": 0,
-            "lives_helped": 0,
-            "updated_at": datetime.now(timezone.utc)
-        }
-        await db.charity_wallet.insert_one(charity_wallet)
+    # Get global charity wallet (summed across counter shards)
+    charity_wallet = {
+        "total_balance": 0,
+        "total_received": 0,
+        "total_distributed": 0,
+        "lives_helped": 0,
+        "updated_at": datetime.now(timezone.utc),
+        **await charity_wallet_counter.read()
+    }
     
     # Get user's charity contributions
     user_contributions = await db.charity_contributions.find(
@@ -2252,7 +3883,8 @@ async def get_charity_stats(current_user: User = Depends(get_current_user)):
         {"_id": 0}
     ).sort("created_at", -1).limit(10).to_list(10)
     
-    total_user_contribution = sum(c["amount"] for c in user_contributions)
+    summary, _ = await read_ledger_summary(current_user.user_id)
+    total_user_contribution = summary.get("charity", {}).get("total", 0)
     
     # Get recent distributions
     distributions = await db.charity_distributions.find(
@@ -2268,39 +3900,32 @@ async def get_charity_stats(current_user: User = Depends(get_current_user)):
         "config": CHARITY_CONFIG
     }
 
-@api_router.get("/charity/leaderboard")
-async def get_charity_leaderboard():
+@leaderboard_engine.board("charity")
+async def build_charity_leaderboard():
     """Get charity contribution leaderboard"""
-    # Aggregate top contributors
-    pipeline = [
-        {"$group": {
-            "_id": "$user_id",
-            "total_donated": {"$sum": "$amount"}
-        }},
-        {"$sort": {"total_donated": -1}},
-        {"$limit": 20}
+    # Top contributors from the per-user charity rollup
+    top_contributors = await live_leaderboard_top("charity", "all", 20)
+    leaderboard = [
+        {
+            "rank": contributor["rank"],
+            "user": contributor["user"],
+            "total_donated": contributor["score"]
+        }
+        for contributor in top_contributors if contributor["user"]
     ]
     
-    top_contributors = await db.charity_contributions.aggregate(pipeline).to_list(20)
-    
-    # Get user details for each contributor
-    leaderboard = []
-    for i, contributor in enumerate(top_contributors):
-        user = await db.users.find_one(
-            {"user_id": contributor["_id"]},
-            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
-        )
-        if user:
-            leaderboard.append({
-                "rank": i + 1,
-                "user": user,
-                "total_donated": contributor["total_donated"]
-            })
-    
     return {"leaderboard": leaderboard}
 
+@api_router.get("/charity/leaderboard")
+async def get_charity_leaderboard():
+    """Get charity contribution leaderboard"""
+    return await leaderboard_engine.serve("charity")
+
 # ==================== GIFT SYSTEM ====================
 
+register_index("gift_records", [("sender_id", 1), ("created_at", -1)])
+register_index("gift_records", [("receiver_id", 1), ("created_at", -1)])
+
 # Signature Gift Categories with Unique Designs
 SIGNATURE_GIFTS = {
     "basic": [
@@ -2353,9 +3978,11 @@ class SendGiftRequest(BaseModel):
     message: Optional[str] = None
 
 @api_router.post("/gifts/send")
+@idempotent("gift_send")
 async def send_gift(
     request: SendGiftRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Send a gift to another user"""
     # Find the gift
@@ -2382,114 +4009,92 @@ async def send_gift(
     if request.receiver_id == current_user.user_id:
         raise HTTPException(status_code=400, detail="Cannot send gift to yourself")
     
-    total_cost = gift["price"] * request.quantity
-    
-    # Check sender's balance
-    wallet = await db.wallets.find_one(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
-    )
+    if request.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
     
-    if wallet["coins_balance"] < total_cost:
-        raise HTTPException(status_code=400, detail="Insufficient coins balance")
-    
-    # Deduct from sender
-    await db.wallets.update_one(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {"coins_balance": -total_cost},
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        }
-    )
+    total_cost = gift["price"] * request.quantity
     
     # Calculate charity contribution (2%)
     charity_amount = total_cost * (CHARITY_CONFIG["vip_gift_charity_percent"] / 100)
     receiver_amount = total_cost - charity_amount
     
-    # Add to receiver's stars (gifts convert to stars)
-    await db.wallets.update_one(
-        {"user_id": request.receiver_id},
-        {
-            "$inc": {"stars_balance": receiver_amount},
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        }
-    )
-    
-    # Add to charity wallet
-    await db.charity_wallet.update_one(
-        {},
-        {
-            "$inc": {
-                "total_balance": charity_amount,
-                "total_received": charity_amount
-            },
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        },
-        upsert=True
-    )
-    
-    # Record charity contribution
-    await db.charity_contributions.insert_one({
-        "contribution_id": f"char_{uuid.uuid4().hex[:12]}",
-        "user_id": current_user.user_id,
-        "amount": charity_amount,
-        "source": "gift",
-        "gift_id": gift["gift_id"],
-        "created_at": datetime.now(timezone.utc)
-    })
-    
-    # Create gift record
     gift_record_id = f"gift_{uuid.uuid4().hex[:12]}"
-    await db.gift_records.insert_one({
-        "gift_record_id": gift_record_id,
-        "sender_id": current_user.user_id,
-        "receiver_id": request.receiver_id,
-        "gift_id": gift["gift_id"],
-        "gift_name": gift["name"],
-        "gift_price": gift["price"],
-        "quantity": request.quantity,
-        "total_value": total_cost,
-        "message": request.message,
-        "charity_amount": charity_amount,
-        "created_at": datetime.now(timezone.utc)
-    })
-    
-    # Create transactions
-    await db.wallet_transactions.insert_one({
-        "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
-        "user_id": current_user.user_id,
-        "transaction_type": "gift_sent",
-        "amount": -total_cost,
-        "currency_type": "coins",
-        "status": TransactionStatus.COMPLETED,
-        "reference_id": gift_record_id,
-        "description": f"Sent {request.quantity}x {gift['name']} to {receiver['name']}",
-        "created_at": datetime.now(timezone.utc)
-    })
-    
-    await db.wallet_transactions.insert_one({
-        "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
-        "user_id": request.receiver_id,
-        "transaction_type": "gift_received",
-        "amount": receiver_amount,
-        "currency_type": "stars",
-        "status": TransactionStatus.COMPLETED,
-        "reference_id": gift_record_id,
-        "description": f"Received {request.quantity}x {gift['name']} from {current_user.name}",
-        "created_at": datetime.now(timezone.utc)
-    })
+    now = datetime.now(timezone.utc)
     
-    # Send notification to receiver
-    await db.notifications.insert_one({
-        "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
-        "user_id": request.receiver_id,
-        "title": f"Gift Received! 🎁",
-        "message": f"{current_user.name} sent you {request.quantity}x {gift['name']}!" + (f"\nMessage: {request.message}" if request.message else ""),
-        "notification_type": "gift",
-        "is_read": False,
-        "action_url": "/gifts",
-        "created_at": datetime.now(timezone.utc)
-    })
+    async for posting in LedgerPosting.attempts():
+        async with posting:
+            # Deduct from sender
+            wallet = await posting.debit(current_user.user_id, {"coins_balance": total_cost})
+            
+            if not wallet:
+                raise HTTPException(status_code=400, detail="Insufficient coins balance")
+            
+            # Add to receiver's stars (gifts convert to stars)
+            posting.update(
+                "wallets",
+                {"user_id": request.receiver_id},
+                {
+                    "$inc": {"stars_balance": receiver_amount},
+                    "$set": {"updated_at": now}
+                }
+            )
+            
+            # Record charity contribution
+            posting.charity(current_user.user_id, charity_amount, "gift", gift_id=gift["gift_id"])
+            posting.score("gifts_sent", current_user.user_id, total_cost)
+            posting.score("gifts_received", request.receiver_id, total_cost)
+            
+            # Create gift record
+            posting.insert("gift_records", {
+                "gift_record_id": gift_record_id,
+                "sender_id": current_user.user_id,
+                "receiver_id": request.receiver_id,
+                "gift_id": gift["gift_id"],
+                "gift_name": gift["name"],
+                "gift_price": gift["price"],
+                "quantity": request.quantity,
+                "total_value": total_cost,
+                "message": request.message,
+                "charity_amount": charity_amount,
+                "created_at": now
+            })
+            
+            # Create transactions
+            posting.insert("wallet_transactions", {
+                "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
+                "user_id": current_user.user_id,
+                "transaction_type": "gift_sent",
+                "amount": -total_cost,
+                "currency_type": "coins",
+                "status": TransactionStatus.COMPLETED,
+                "reference_id": gift_record_id,
+                "description": f"Sent {request.quantity}x {gift['name']} to {receiver['name']}",
+                "created_at": now
+            })
+            
+            posting.insert("wallet_transactions", {
+                "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
+                "user_id": request.receiver_id,
+                "transaction_type": "gift_received",
+                "amount": receiver_amount,
+                "currency_type": "stars",
+                "status": TransactionStatus.COMPLETED,
+                "reference_id": gift_record_id,
+                "description": f"Received {request.quantity}x {gift['name']} from {current_user.name}",
+                "created_at": now
+            })
+            
+            # Send notification to receiver
+            posting.notify({
+                "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
+                "user_id": request.receiver_id,
+                "title": f"Gift Received! 🎁",
+                "message": f"{current_user.name} sent you {request.quantity}x {gift['name']}!" + (f"\nMessage: {request.message}" if request.message else ""),
+                "notification_type": "gift",
+                "is_read": False,
+                "action_url": "/gifts",
+                "created_at": now
+            })
     
     return {
         "success": True,
@@ -2503,48 +4108,48 @@ async def send_gift(
 
 @api_router.get("/gifts/sent")
 async def get_sent_gifts(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get gifts sent by current user"""
-    gifts = await db.gift_records.find(
+    gifts, next_cursor = await keyset_page(
+        "gift_records",
         {"sender_id": current_user.user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+        limit,
+        cursor
+    )
     
     # Get receiver details
+    profiles = await load_user_profiles(gift["receiver_id"] for gift in gifts)
     for gift in gifts:
-        receiver = await db.users.find_one(
-            {"user_id": gift["receiver_id"]},
-            {"_id": 0, "name": 1, "picture": 1}
-        )
-        gift["receiver"] = receiver
+        gift["receiver"] = profiles.get(gift["receiver_id"])
     
-    return {"gifts": gifts}
+    return {"gifts": gifts, "next_cursor": next_cursor}
 
 @api_router.get("/gifts/received")
 async def get_received_gifts(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get gifts received by current user"""
-    gifts = await db.gift_records.find(
+    gifts, next_cursor = await keyset_page(
+        "gift_records",
         {"receiver_id": current_user.user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+        limit,
+        cursor
+    )
     
     # Get sender details
+    profiles = await load_user_profiles(gift["sender_id"] for gift in gifts)
     for gift in gifts:
-        sender = await db.users.find_one(
-            {"user_id": gift["sender_id"]},
-            {"_id": 0, "name": 1, "picture": 1}
-        )
-        gift["sender"] = sender
+        gift["sender"] = profiles.get(gift["sender_id"])
     
-    return {"gifts": gifts}
+    return {"gifts": gifts, "next_cursor": next_cursor}
 
-@api_router.get("/gifts/leaderboard")
-async def get_gift_leaderboard():
+@leaderboard_engine.board("gifts")
+async def build_gift_leaderboard():
     """Get top gift senders and receivers"""
     # Top senders
     sender_pipeline = [
@@ -2573,12 +4178,10 @@ async def get_gift_leaderboard():
     top_receivers = await db.gift_records.aggregate(receiver_pipeline).to_list(10)
     
     # Get user details
+    profiles = await load_user_profiles(sender["_id"] for sender in top_senders)
     senders_leaderboard = []
     for i, sender in enumerate(top_senders):
-        user = await db.users.find_one(
-            {"user_id": sender["_id"]},
-            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
-        )
+        user = profiles.get(sender["_id"])
         if user:
             senders_leaderboard.append({
                 "rank": i + 1,
@@ -2587,12 +4190,10 @@ async def get_gift_leaderboard():
                 "gifts_count": sender["gifts_count"]
             })
     
+    profiles = await load_user_profiles(receiver["_id"] for receiver in top_receivers)
     receivers_leaderboard = []
     for i, receiver in enumerate(top_receivers):
-        user = await db.users.find_one(
-            {"user_id": receiver["_id"]},
-            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
-        )
+        user = profiles.get(receiver["_id"])
         if user:
             receivers_leaderboard.append({
                 "rank": i + 1,
@@ -2606,8 +4207,15 @@ async def get_gift_leaderboard():
         "top_receivers": receivers_leaderboard
     }
 
+@api_router.get("/gifts/leaderboard")
+async def get_gift_leaderboard():
+    """Get top gift senders and receivers"""
+    return await leaderboard_engine.serve("gifts")
+
 # ==================== MESSAGING REWARDS ====================
 
+register_index("messaging_rewards", [("user_id", 1), ("date", 1)])
+
 @api_router.post("/messages/reward")
 async def claim_messaging_reward(
     current_user: User = Depends(get_current_user)
@@ -2660,6 +4268,8 @@ async def claim_messaging_reward(
         "created_at": datetime.now(timezone.utc)
     })
     
+    domain_events.emit("chat_rewarded", current_user.user_id)
+    
     return {
         "success": True,
         "reward_amount": reward_amount,
@@ -2689,6 +4299,9 @@ async def get_messaging_reward_status(current_user: User = Depends(get_current_u
 
 # ==================== CHARITY LUCKY WALLET (GAME SYSTEM) ====================
 
+register_index("lucky_wallet_challenges", [("user_id", 1), ("created_at", -1)])
+register_index("lucky_wallet_challenges", [("user_id", 1), ("date", 1)])
+
 """
 CHARITY LUCKY WALLET - Game Rules:
 1. Winning Rate: EXACTLY 45%
@@ -2723,33 +4336,25 @@ async def get_lucky_wallet_config():
 @api_router.get("/lucky-wallet/stats")
 async def get_lucky_wallet_stats(current_user: User = Depends(get_current_user)):
     """Get user's Lucky Wallet game statistics"""
-    # Get user's game history
-    challenges = await db.lucky_wallet_challenges.find(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
-    ).to_list(1000)
+    summary, today_summary = await read_ledger_summary(current_user.user_id)
+    games = summary.get("lucky_wallet", {})
+    today_games = today_summary.get("lucky_wallet", {})
     
-    total_challenges = len(challenges)
-    wins = sum(1 for g in challenges if g["result"] == "win")
+    total_challenges = games.get("total_challenges", 0)
+    wins = games.get("wins", 0)
     losses = total_challenges - wins
-    total_bet = sum(g["bet_amount"] for g in challenges)
-    total_won = sum(g["won_amount"] for g in challenges if g["result"] == "win")
-    total_charity = sum(g["charity_amount"] for g in challenges)
+    total_bet = games.get("total_bet", 0)
+    total_won = games.get("total_won", 0)
+    total_charity = games.get("total_charity", 0)
     
     win_rate = (wins / total_challenges * 100) if total_challenges > 0 else 0
     
     # Today's stats
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    today_challenges = await db.lucky_wallet_challenges.find(
-        {"user_id": current_user.user_id, "date": today},
-        {"_id": 0}
-    ).to_list(100)
-    
-    today_total = len(today_challenges)
-    today_wins = sum(1 for g in today_challenges if g["result"] == "win")
-    today_bet = sum(g["bet_amount"] for g in today_challenges)
-    today_won = sum(g["won_amount"] for g in today_challenges if g["result"] == "win")
-    today_charity = sum(g["charity_amount"] for g in today_challenges)
+    today_total = today_games.get("total_challenges", 0)
+    today_wins = today_games.get("wins", 0)
+    today_bet = today_games.get("total_bet", 0)
+    today_won = today_games.get("total_won", 0)
+    today_charity = today_games.get("total_charity", 0)
     
     return {
         "all_time": {
@@ -2773,9 +4378,11 @@ async def get_lucky_wallet_stats(current_user: User = Depends(get_current_user))
     }
 
 @api_router.post("/lucky-wallet/play")
+@idempotent("lucky_wallet_play")
 async def play_lucky_wallet(
     request: PlayLuckyWalletRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Play Charity Lucky Wallet Game
@@ -2799,21 +4406,6 @@ async def play_lucky_wallet(
             detail=f"Maximum bet is {CHARITY_LUCKY_WALLET_CONFIG['max_bet']} coins"
         )
     
-    # Check user's wallet balance
-    wallet = await db.wallets.find_one(
-        {"user_id": current_user.user_id},
-        {"_id": 0}
-    )
-    
-    if not wallet:
-        raise HTTPException(status_code=404, detail="Wallet not found")
-    
-    if wallet["coins_balance"] < request.bet_amount:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Insufficient balance. You have {wallet['coins_balance']} coins, need {request.bet_amount} coins"
-        )
-    
     # Generate random number for game result (1-100)
     random_number = random.randint(1, 100)
     is_winner = random_number <= CHARITY_LUCKY_WALLET_CONFIG["winning_rate"]  # 45% chance
@@ -2856,98 +4448,95 @@ async def play_lucky_wallet(
         result = "lose"
         balance_change = -bet_amount  # User loses entire bet
     
-    # Update user's wallet
-    new_balance = wallet["coins_balance"] + balance_change
-    
-    await db.wallets.update_one(
-        {"user_id": current_user.user_id},
-        {
-            "$set": {
-                "coins_balance": round(new_balance, 2),
-                "updated_at": datetime.now(timezone.utc)
-            }
-        }
-    )
-    
-    # Update charity wallet
-    await db.charity_wallet.update_one(
-        {},
-        {
-            "$inc": {
-                "total_balance": charity_amount,
-                "total_received": charity_amount
-            },
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        },
-        upsert=True
-    )
-    
-    # Record game
     game_id = f"game_{uuid.uuid4().hex[:12]}"
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    
-    game_record = {
-        "game_id": game_id,
-        "user_id": current_user.user_id,
-        "bet_amount": bet_amount,
-        "result": result,
-        "random_number": random_number,
-        "winning_threshold": CHARITY_LUCKY_WALLET_CONFIG["winning_rate"],
-        "won_amount": won_amount,
-        "charity_amount": charity_amount,
-        "platform_amount": platform_amount,
-        "balance_change": balance_change,
-        "new_balance": round(new_balance, 2),
-        "charity_boost": request.charity_boost,
-        "date": today,
-        "created_at": datetime.now(timezone.utc)
-    }
-    
-    await db.lucky_wallet_challenges.insert_one(game_record)
-    
-    # Record charity contribution
-    await db.charity_contributions.insert_one({
-        "contribution_id": f"char_{uuid.uuid4().hex[:12]}",
-        "user_id": current_user.user_id,
-        "amount": charity_amount,
-        "source": "lucky_wallet",
-        "game_id": game_id,
-        "result": result,
-        "created_at": datetime.now(timezone.utc)
-    })
-    
-    # Create wallet transaction
     transaction_id = f"txn_{uuid.uuid4().hex[:12]}"
-    await db.wallet_transactions.insert_one({
-        "transaction_id": transaction_id,
-        "user_id": current_user.user_id,
-        "transaction_type": "lucky_wallet_bet" if result == "lose" else "lucky_wallet_win",
-        "amount": balance_change,
-        "currency_type": "coins",
-        "status": TransactionStatus.COMPLETED,
-        "reference_id": game_id,
-        "description": f"Charity Lucky Wallet - {'Won' if is_winner else 'Lost'} (Bet: {bet_amount}, Charity: {charity_amount})",
-        "created_at": datetime.now(timezone.utc)
-    })
-    
-    # Send notification
-    if is_winner:
-        notif_title = "You Won! 🎉"
-        notif_message = f"Congratulations! You won {won_amount} coins. {charity_amount} coins went to charity!"
-    else:
-        notif_title = "Better luck next time! 💪"
-        notif_message = f"You lost {bet_amount} coins. But {charity_amount} coins went to charity to help others!"
-    
-    await db.notifications.insert_one({
-        "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
-        "user_id": current_user.user_id,
-        "title": notif_title,
-        "message": notif_message,
-        "notification_type": "lucky_wallet",
-        "is_read": False,
-        "action_url": "/lucky-wallet",
-        "created_at": datetime.now(timezone.utc)
-    })
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    
+    async for posting in LedgerPosting.attempts():
+        async with posting:
+            # Take the bet and pay out any winnings in one guarded update
+            wallet = await posting.debit(
+                current_user.user_id,
+                {"coins_balance": bet_amount},
+                credits={"coins_balance": won_amount}
+            )
+            
+            if not wallet:
+                current = await db.wallets.find_one(
+                    {"user_id": current_user.user_id},
+                    {"_id": 0, "coins_balance": 1}
+                )
+                if not current:
+                    raise HTTPException(status_code=404, detail="Wallet not found")
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Insufficient balance. You have {current['coins_balance']} coins, need {request.bet_amount} coins"
+                )
+            
+            new_balance = wallet["coins_balance"]
+            
+            # Record game
+            posting.insert("lucky_wallet_challenges", {
+                "game_id": game_id,
+                "user_id": current_user.user_id,
+                "bet_amount": bet_amount,
+                "result": result,
+                "random_number": random_number,
+                "winning_threshold": CHARITY_LUCKY_WALLET_CONFIG["winning_rate"],
+                "won_amount": won_amount,
+                "charity_amount": charity_amount,
+                "platform_amount": platform_amount,
+                "balance_change": balance_change,
+                "new_balance": round(new_balance, 2),
+                "charity_boost": request.charity_boost,
+                "date": today,
+                "created_at": now
+            })
+            
+            # Record charity contribution
+            posting.charity(current_user.user_id, charity_amount, "lucky_wallet", game_id=game_id, result=result)
+            posting.summarize(current_user.user_id, {
+                "lucky_wallet.total_challenges": 1,
+                "lucky_wallet.wins": 1 if is_winner else 0,
+                "lucky_wallet.total_bet": bet_amount,
+                "lucky_wallet.total_won": won_amount,
+                "lucky_wallet.total_charity": charity_amount
+            })
+            if is_winner:
+                posting.score("lucky_wallet", current_user.user_id, won_amount)
+            
+            # Create wallet transaction
+            posting.insert("wallet_transactions", {
+                "transaction_id": transaction_id,
+                "user_id": current_user.user_id,
+                "transaction_type": "lucky_wallet_bet" if result == "lose" else "lucky_wallet_win",
+                "amount": balance_change,
+                "currency_type": "coins",
+                "status": TransactionStatus.COMPLETED,
+                "reference_id": game_id,
+                "description": f"Charity Lucky Wallet - {'Won' if is_winner else 'Lost'} (Bet: {bet_amount}, Charity: {charity_amount})",
+                "created_at": now
+            })
+            
+            # Send notification
+            if is_winner:
+                notif_title = "You Won! 🎉"
+                notif_message = f"Congratulations! You won {won_amount} coins. {charity_amount} coins went to charity!"
+            else:
+                notif_title = "Better luck next time! 💪"
+                notif_message = f"You lost {bet_amount} coins. But {charity_amount} coins went to charity to help others!"
+            
+            posting.notify({
+                "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
+                "user_id": current_user.user_id,
+                "title": notif_title,
+                "message": notif_message,
+                "notification_type": "lucky_wallet",
+                "is_read": False,
+                "action_url": "/lucky-wallet",
+                "created_at": now
+            })
     
     return {
         "success": True,
@@ -2967,19 +4556,22 @@ async def play_lucky_wallet(
 
 @api_router.get("/lucky-wallet/history")
 async def get_lucky_wallet_history(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get user's Charity Lucky Wallet game history"""
-    challenges = await db.lucky_wallet_challenges.find(
+    challenges, next_cursor = await keyset_page(
+        "lucky_wallet_challenges",
         {"user_id": current_user.user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+        limit,
+        cursor
+    )
     
-    return {"challenges": challenges}
+    return {"challenges": challenges, "next_cursor": next_cursor}
 
-@api_router.get("/lucky-wallet/leaderboard")
-async def get_lucky_wallet_leaderboard():
+@leaderboard_engine.board("lucky_wallet")
+async def build_lucky_wallet_leaderboard():
     """Get Lucky Wallet leaderboard - top winners and charity contributors"""
     
     # Top winners by total won
@@ -3010,12 +4602,10 @@ async def get_lucky_wallet_leaderboard():
     top_contributors = await db.lucky_wallet_challenges.aggregate(charity_pipeline).to_list(10)
     
     # Get user details
+    profiles = await load_user_profiles(winner["_id"] for winner in top_winners)
     winners_leaderboard = []
     for i, winner in enumerate(top_winners):
-        user = await db.users.find_one(
-            {"user_id": winner["_id"]},
-            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
-        )
+        user = profiles.get(winner["_id"])
         if user:
             winners_leaderboard.append({
                 "rank": i + 1,
@@ -3024,12 +4614,10 @@ async def get_lucky_wallet_leaderboard():
                 "challenges_won": winner["challenges_won"]
             })
     
+    profiles = await load_user_profiles(contributor["_id"] for contributor in top_contributors)
     contributors_leaderboard = []
     for i, contributor in enumerate(top_contributors):
-        user = await db.users.find_one(
-            {"user_id": contributor["_id"]},
-            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
-        )
+        user = profiles.get(contributor["_id"])
         if user:
             contributors_leaderboard.append({
                 "rank": i + 1,
@@ -3043,8 +4631,44 @@ async def get_lucky_wallet_leaderboard():
         "top_charity_contributors": contributors_leaderboard
     }
 
+@api_router.get("/lucky-wallet/leaderboard")
+async def get_lucky_wallet_leaderboard():
+    """Get Lucky Wallet leaderboard - top winners and charity contributors"""
+    return await leaderboard_engine.serve("lucky_wallet")
+
 # ==================== HOST POLICY SYSTEM (VONE STYLE) ====================
 
+register_index("host_profiles", [("user_id", 1)], unique=True, dedupe=drop_duplicate_documents)
+register_index("host_sessions", [("session_id", 1)])
+register_index("host_sessions", [("user_id", 1), ("status", 1)])
+register_index("host_sessions", [("user_id", 1), ("created_at", -1)])
+register_index("host_sessions", [("user_id", 1), ("date", 1), ("status", 1)])
+
+async def supersede_duplicate_active_sessions(collection: str, fields: list) -> int:
+    """Leave each host's newest active session open and mark older ones superseded, unpaid"""
+    superseded = 0
+    duplicates = db.host_sessions.aggregate([
+        {"$match": {"status": "active"}},
+        {"$sort": {"started_at": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$session_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    async for group in duplicates:
+        result = await db.host_sessions.update_many(
+            {"session_id": {"$in": group["ids"][1:]}, "status": "active"},
+            {"$set": {"status": "superseded", "ended_at": datetime.now(timezone.utc)}}
+        )
+        superseded += result.modified_count
+    if superseded:
+        logger.warning(f"Marked {superseded} duplicate active host sessions superseded")
+    return superseded
+
+register_index(
+    "host_sessions", [("user_id", 1)],
+    name="user_id_1_active", unique=True, partialFilterExpression={"status": "active"},
+    dedupe=supersede_duplicate_active_sessions
+)
+
 """
 VONE STYLE HOST POLICY:
 
@@ -3083,6 +4707,48 @@ HOST_POLICY_CONFIG = {
     "min_audio_minutes": 120,  # 2 hours minimum for audio
 }
 
+# Host reward policy: pure functions of the config, no I/O.
+
+def host_welcome_status(registered_at: datetime, now: datetime, config: dict = HOST_POLICY_CONFIG) -> tuple:
+    """(days_since_registration, is_welcome_period) for a host registered at `registered_at`"""
+    if registered_at.tzinfo is None:
+        registered_at = registered_at.replace(tzinfo=timezone.utc)
+    days_since_registration = (now - registered_at).days
+    return days_since_registration, days_since_registration < config["welcome_period_days"]
+
+def host_reward_rates(is_welcome: bool, config: dict = HOST_POLICY_CONFIG) -> dict:
+    if is_welcome:
+        return {
+            "video_per_hour": config["welcome_video_reward_per_hour"],
+            "audio_per_2hours": config["welcome_audio_reward_per_2hours"]
+        }
+    return {
+        "video_per_hour": config["normal_video_reward_per_hour"],
+        "audio_per_2hours": config["normal_audio_reward_per_hour"] * 2
+    }
+
+def host_min_minutes(host_type: str, config: dict = HOST_POLICY_CONFIG) -> int:
+    return config["min_video_minutes"] if host_type == "video" else config["min_audio_minutes"]
+
+def host_session_stars(host_type: str, duration_minutes: int, is_welcome: bool,
+                       config: dict = HOST_POLICY_CONFIG) -> int:
+    """Stars earned by a live session of `duration_minutes`"""
+    if host_type == "video":
+        # Welcome period: 2,000 Stars per hour; normal: 1,000 Stars per hour
+        if duration_minutes < config["min_video_minutes"]:
+            return 0
+        per_hour = config["welcome_video_reward_per_hour"] if is_welcome else config["normal_video_reward_per_hour"]
+        return (duration_minutes // 60) * per_hour
+    if host_type == "audio":
+        if is_welcome:
+            # Welcome period: 3,000 Stars per 2 hours (1500 x 2)
+            if duration_minutes < config["min_audio_minutes"]:
+                return 0
+            return (duration_minutes // 120) * config["welcome_audio_reward_per_2hours"]
+        # Normal: 500 Stars per hour
+        return (duration_minutes // 60) * config["normal_audio_reward_per_hour"]
+    return 0
+
 class HostType(str, Enum):
     VIDEO = "video"
     AUDIO = "audio"
@@ -3106,9 +4772,280 @@ async def get_host_policy():
         "description": "Vone Style Host Policy - Earn stars by going live!"
     }
 
+HOST_CHECKPOINT_INTERVAL_SECONDS = float(os.environ.get("HOST_CHECKPOINT_INTERVAL_SECONDS", "30"))
+HOST_SESSION_STALE_SECONDS = float(os.environ.get("HOST_SESSION_STALE_SECONDS", "900"))
+HOST_HEARTBEAT_INTERVAL_SECONDS = float(os.environ.get("HOST_HEARTBEAT_INTERVAL_SECONDS", "60"))
+# Closing silent sessions needs clients that heartbeat; off until they all do
+HOST_SESSION_AUTO_CLOSE = os.environ.get("HOST_SESSION_AUTO_CLOSE", "off") == "on"
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+class HostSessionEngine:
+    """
+    Registry of active host sessions, keyed by host.
+    
+    The registry holds each session's running state (heartbeat times,
+    running minutes), so the dashboard's live numbers need no history
+    queries. Which session is active is always confirmed with one indexed
+    read, because another worker may have ended it or started a new one;
+    the partial unique index on active sessions guards starts. A background
+    worker checkpoints heartbeat times and running minutes into host_sessions
+    with one bulk_write per interval and drops sessions another worker ended.
+    With auto_close on, it also closes sessions with no heartbeat for
+    HOST_SESSION_STALE_SECONDS, paying them up to their last heartbeat.
+    """
+
+    def __init__(self, checkpoint_interval: float, stale_seconds: float, auto_close: bool):
+        self.checkpoint_interval = checkpoint_interval
+        self.stale_seconds = stale_seconds
+        self.auto_close = auto_close
+        self._active: dict = {}
+        self._worker: Optional[asyncio.Task] = None
+
+    def _adopt(self, session: dict) -> dict:
+        session["started_at"] = as_utc(session["started_at"])
+        session["last_heartbeat_at"] = as_utc(session.get("last_heartbeat_at") or session["started_at"])
+        # Sessions from before heartbeats existed get a full stale window from now
+        session["adopted_at"] = datetime.now(timezone.utc)
+        self._active[session["user_id"]] = session
+        return session
+
+    def _drop(self, session: dict):
+        if self._active.get(session["user_id"], {}).get("session_id") == session["session_id"]:
+            del self._active[session["user_id"]]
+
+    async def load(self):
+        async for session in db.host_sessions.find({"status": "active"}, {"_id": 0}):
+            self._adopt(session)
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        """The host's active session as stored, with its running state from the registry"""
+        stored = await db.host_sessions.find_one({"user_id": user_id, "status": "active"}, {"_id": 0})
+        cached = self._active.get(user_id)
+        if stored is None:
+            if cached:
+                self._drop(cached)
+            return None
+        if cached and cached["session_id"] == stored["session_id"]:
+            if stored.get("last_heartbeat_at"):
+                self.heartbeat(cached, as_utc(stored["last_heartbeat_at"]))
+            return cached
+        return self._adopt(stored)
+
+    async def start_session(self, user_id: str, host_type: str, is_welcome: bool) -> dict:
+        now = datetime.now(timezone.utc)
+        session = {
+            "session_id": f"session_{uuid.uuid4().hex[:12]}",
+            "user_id": user_id,
+            "host_type": host_type,
+            "started_at": now,
+            "ended_at": None,
+            "last_heartbeat_at": now,
+            "duration_minutes": 0,
+            "stars_earned": 0,
+            "is_welcome_period": is_welcome,
+            "status": "active",
+            "date": now.strftime("%Y-%m-%d"),
+            "created_at": now
+        }
+        try:
+            await db.host_sessions.insert_one({**session})
+        except DuplicateKeyError:
+            # The partial unique index allows one active session per host
+            await self.get(user_id)
+            raise HTTPException(status_code=400, detail="You already have an active session")
+        self._active[user_id] = {**session, "adopted_at": now}
+        return session
+
+    def heartbeat(self, session: dict, now: datetime):
+        session["last_heartbeat_at"] = max(session["last_heartbeat_at"], now)
+
+    async def beat(self, session: dict, now: datetime) -> bool:
+        """Record a heartbeat straight into the stored session; False once it is no longer active"""
+        result = await db.host_sessions.update_one(
+            {"session_id": session["session_id"], "status": "active"},
+            {"$max": {"last_heartbeat_at": now}}
+        )
+        if not result.matched_count:
+            self._drop(session)
+            return False
+        self.heartbeat(session, now)
+        return True
+
+    def live_state(self, session: dict, now: datetime) -> dict:
+        running_minutes = int((now - session["started_at"]).total_seconds() / 60)
+        state = {k: v for k, v in session.items() if k != "adopted_at"}
+        state["running_minutes"] = running_minutes
+        state["projected_stars"] = host_session_stars(
+            session["host_type"], running_minutes, session["is_welcome_period"]
+        )
+        return state
+
+    async def end_session(self, session: dict, ended_at: datetime, auto_closed: bool = False) -> Optional[dict]:
+        """Close and pay a session; None when another request or worker closed it first"""
+        user_id = session["user_id"]
+        host_type = session["host_type"]
+        is_welcome = session["is_welcome_period"]
+        duration_minutes = max(0, int((ended_at - session["started_at"]).total_seconds() / 60))
+        stars_earned = host_session_stars(host_type, duration_minutes, is_welcome)
+        
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                closed = await db.host_sessions.find_one_and_update(
+                    {"session_id": session["session_id"], "status": "active"},
+                    {
+                        "$set": {
+                            "ended_at": ended_at,
+                            "duration_minutes": duration_minutes,
+                            "stars_earned": stars_earned,
+                            "status": "completed",
+                            "auto_closed": auto_closed
+                        }
+                    },
+                    projection={"_id": 1},
+                    session=posting.session
+                )
+                if closed is None:
+                    self._drop(session)
+                    return None
+                
+                posting.summarize(user_id, {
+                    "host.sessions": 1,
+                    f"host.{host_type}_minutes": duration_minutes,
+                    "host.stars": stars_earned
+                })
+                
+                # Credit stars to wallet if earned
+                if stars_earned > 0:
+                    await posting.credit(user_id, {"stars_balance": stars_earned})
+                    posting.score("host", user_id, stars_earned)
+                    
+                    # Create transaction
+                    posting.insert("wallet_transactions", {
+                        "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
+                        "user_id": user_id,
+                        "transaction_type": "host_reward",
+                        "amount": stars_earned,
+                        "currency_type": "stars",
+                        "status": TransactionStatus.COMPLETED,
+                        "reference_id": session["session_id"],
+                        "description": f"{'Video' if host_type == 'video' else 'Audio'} Live Reward ({duration_minutes} mins)" + (" [Welcome Bonus]" if is_welcome else ""),
+                        "created_at": ended_at
+                    })
+                    
+                    # Update host profile
+                    posting.update(
+                        "host_profiles",
+                        {"user_id": user_id},
+                        {
+                            "$inc": {
+                                "total_live_minutes": duration_minutes,
+                                "total_stars_earned": stars_earned
+                            },
+                            "$set": {"updated_at": ended_at}
+                        }
+                    )
+                    
+                    # Send notification
+                    posting.notify({
+                        "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
+                        "user_id": user_id,
+                        "title": "Live Session Completed! ⭐",
+                        "message": f"You earned {stars_earned} stars for your {duration_minutes} minute {'video' if host_type == 'video' else 'audio'} session!",
+                        "notification_type": "host_reward",
+                        "is_read": False,
+                        "action_url": "/host",
+                        "created_at": ended_at
+                    })
+        self._drop(session)
+        
+        return {
+            "session_id": session["session_id"],
+            "duration_minutes": duration_minutes,
+            "stars_earned": stars_earned,
+            "is_welcome_period": is_welcome,
+            "host_type": host_type
+        }
+
+    async def checkpoint(self):
+        if not self._active:
+            return
+        now = datetime.now(timezone.utc)
+        sessions = list(self._active.values())
+        stored = {
+            doc["session_id"]: doc
+            async for doc in db.host_sessions.find(
+                {"session_id": {"$in": [session["session_id"] for session in sessions]}},
+                {"_id": 0, "session_id": 1, "status": 1, "last_heartbeat_at": 1}
+            )
+        }
+        
+        ops = []
+        stale = []
+        for session in sessions:
+            doc = stored.get(session["session_id"])
+            if not doc or doc["status"] != "active":
+                self._drop(session)
+                continue
+            if doc.get("last_heartbeat_at"):
+                # Heartbeats may be landing on another worker
+                self.heartbeat(session, as_utc(doc["last_heartbeat_at"]))
+            last_seen = max(session["last_heartbeat_at"], session["adopted_at"])
+            if self.auto_close and (now - last_seen).total_seconds() > self.stale_seconds:
+                stale.append(session)
+                continue
+            ops.append(UpdateOne(
+                {"session_id": session["session_id"], "status": "active"},
+                {"$max": {
+                    "last_heartbeat_at": session["last_heartbeat_at"],
+                    "duration_minutes": int((session["last_heartbeat_at"] - session["started_at"]).total_seconds() / 60)
+                }}
+            ))
+        
+        if ops:
+            try:
+                await db.host_sessions.bulk_write(ops, ordered=False)
+            except Exception as e:
+                logger.error(f"Host session checkpoint failed ({len(ops)} sessions): {e}")
+        for session in stale:
+            try:
+                await self.end_session(session, session["last_heartbeat_at"], auto_closed=True)
+            except Exception as e:
+                logger.error(f"Closing stale host session {session['session_id']} failed: {e}")
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Loading active host sessions failed: {e}")
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error(f"Host session checkpoint failed: {e}")
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+host_sessions_engine = HostSessionEngine(
+    HOST_CHECKPOINT_INTERVAL_SECONDS, HOST_SESSION_STALE_SECONDS, HOST_SESSION_AUTO_CLOSE
+)
+
 @api_router.get("/host/status")
 async def get_host_status(current_user: User = Depends(get_current_user)):
-    """Get user's host status and eligibility"""
+    """Get user's host status and eligibility (polling it while live counts as a heartbeat)"""
     
     # Check if user is registered as host
     host_profile = await db.host_profiles.find_one(
@@ -3118,8 +5055,7 @@ async def get_host_status(current_user: User = Depends(get_current_user)):
     
     if not host_profile:
         # Create host profile
-        host_profile = {
-            "user_id": current_user.user_id,
+        host_profile = await find_or_create("host_profiles", {"user_id": current_user.user_id}, {
             "registered_at": datetime.now(timezone.utc),
             "total_live_minutes": 0,
             "total_stars_earned": 0,
@@ -3127,41 +5063,23 @@ async def get_host_status(current_user: User = Depends(get_current_user)):
             "is_verified": False,
             "level": "new",
             "created_at": datetime.now(timezone.utc)
-        }
-        await db.host_profiles.insert_one(host_profile)
-    
-    # Calculate days since registration
-    registered_at = host_profile.get("registered_at", host_profile.get("created_at"))
-    if registered_at.tzinfo is None:
-        registered_at = registered_at.replace(tzinfo=timezone.utc)
-    
-    days_since_registration = (datetime.now(timezone.utc) - registered_at).days
-    is_welcome_period = days_since_registration < HOST_POLICY_CONFIG["welcome_period_days"]
+        })
     
-    # Get today's sessions
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    today_sessions = await db.host_sessions.find(
-        {"user_id": current_user.user_id, "date": today, "status": "completed"},
-        {"_id": 0}
-    ).to_list(100)
+    now = datetime.now(timezone.utc)
+    days_since_registration, is_welcome_period = host_welcome_status(
+        host_profile.get("registered_at", host_profile.get("created_at")), now
+    )
     
-    today_video_minutes = sum(s["duration_minutes"] for s in today_sessions if s["host_type"] == "video")
-    today_audio_minutes = sum(s["duration_minutes"] for s in today_sessions if s["host_type"] == "audio")
-    today_stars_earned = sum(s["stars_earned"] for s in today_sessions)
+    # Today's completed sessions, from the ledger summary
+    _, today_summary = await read_ledger_summary(current_user.user_id)
+    today_host = today_summary.get("host", {})
+    today_stars_earned = today_host.get("stars", 0)
     
     # Check for active session
-    active_session = await db.host_sessions.find_one(
-        {"user_id": current_user.user_id, "status": "active"},
-        {"_id": 0}
-    )
-    
-    # Calculate current rewards based on policy
-    if is_welcome_period:
-        video_reward = HOST_POLICY_CONFIG["welcome_video_reward_per_hour"]
-        audio_reward = HOST_POLICY_CONFIG["welcome_audio_reward_per_2hours"]
-    else:
-        video_reward = HOST_POLICY_CONFIG["normal_video_reward_per_hour"]
-        audio_reward = HOST_POLICY_CONFIG["normal_audio_reward_per_hour"] * 2
+    active_session = await host_sessions_engine.get(current_user.user_id)
+    if active_session:
+        host_sessions_engine.heartbeat(active_session, now)
+        active_session = host_sessions_engine.live_state(active_session, now)
     
     # Check high-earner status
     is_high_earner = host_profile.get("total_gifts_received", 0) >= HOST_POLICY_CONFIG["high_earner_threshold"]
@@ -3173,13 +5091,10 @@ async def get_host_status(current_user: User = Depends(get_current_user)):
         "is_welcome_period": is_welcome_period,
         "welcome_days_remaining": max(0, HOST_POLICY_CONFIG["welcome_period_days"] - days_since_registration),
         "is_high_earner": is_high_earner,
-        "current_rewards": {
-            "video_per_hour": video_reward,
-            "audio_per_2hours": audio_reward
-        },
+        "current_rewards": host_reward_rates(is_welcome_period),
         "today_stats": {
-            "video_minutes": today_video_minutes,
-            "audio_minutes": today_audio_minutes,
+            "video_minutes": today_host.get("video_minutes", 0),
+            "audio_minutes": today_host.get("audio_minutes", 0),
             "stars_earned": today_stars_earned,
             "target_progress": (today_stars_earned / HOST_POLICY_CONFIG["daily_target_stars"]) * 100
         },
@@ -3196,15 +5111,6 @@ async def start_host_session(
 ):
     """Start a live hosting session"""
     
-    # Check for existing active session
-    active_session = await db.host_sessions.find_one(
-        {"user_id": current_user.user_id, "status": "active"},
-        {"_id": 0}
-    )
-    
-    if active_session:
-        raise HTTPException(status_code=400, detail="You already have an active session")
-    
     # Get host profile
     host_profile = await db.host_profiles.find_one(
         {"user_id": current_user.user_id},
@@ -3213,8 +5119,7 @@ async def start_host_session(
     
     if not host_profile:
         # Create host profile
-        host_profile = {
-            "user_id": current_user.user_id,
+        host_profile = await find_or_create("host_profiles", {"user_id": current_user.user_id}, {
             "registered_at": datetime.now(timezone.utc),
             "total_live_minutes": 0,
             "total_stars_earned": 0,
@@ -3222,45 +5127,46 @@ async def start_host_session(
             "is_verified": False,
             "level": "new",
             "created_at": datetime.now(timezone.utc)
-        }
-        await db.host_profiles.insert_one(host_profile)
+        })
     
     # Check if in welcome period
-    registered_at = host_profile.get("registered_at", host_profile.get("created_at"))
-    if registered_at.tzinfo is None:
-        registered_at = registered_at.replace(tzinfo=timezone.utc)
-    
-    days_since_registration = (datetime.now(timezone.utc) - registered_at).days
-    is_welcome_period = days_since_registration < HOST_POLICY_CONFIG["welcome_period_days"]
+    _, is_welcome_period = host_welcome_status(
+        host_profile.get("registered_at", host_profile.get("created_at")), datetime.now(timezone.utc)
+    )
     
     # Create session
-    session_id = f"session_{uuid.uuid4().hex[:12]}"
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    
-    session = {
-        "session_id": session_id,
-        "user_id": current_user.user_id,
-        "host_type": request.host_type,
-        "started_at": datetime.now(timezone.utc),
-        "ended_at": None,
-        "duration_minutes": 0,
-        "stars_earned": 0,
-        "is_welcome_period": is_welcome_period,
-        "status": "active",
-        "date": today,
-        "created_at": datetime.now(timezone.utc)
-    }
-    
-    await db.host_sessions.insert_one(session)
+    session = await host_sessions_engine.start_session(
+        current_user.user_id, request.host_type.value, is_welcome_period
+    )
     
     return {
         "success": True,
-        "session_id": session_id,
+        "session_id": session["session_id"],
         "host_type": request.host_type,
         "is_welcome_period": is_welcome_period,
-        "started_at": session["started_at"].isoformat()
+        "started_at": session["started_at"].isoformat(),
+        "heartbeat": {
+            "interval_seconds": HOST_HEARTBEAT_INTERVAL_SECONDS,
+            "stale_after_seconds": HOST_SESSION_STALE_SECONDS,
+            "auto_close": HOST_SESSION_AUTO_CLOSE
+        }
     }
 
+@api_router.post("/host/heartbeat/{session_id}")
+async def host_session_heartbeat(
+    session_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Keep a live session open; returns its running minutes and projected stars"""
+    session = await host_sessions_engine.get(current_user.user_id)
+    if not session or session["session_id"] != session_id:
+        raise HTTPException(status_code=404, detail="Active session not found")
+    
+    now = datetime.now(timezone.utc)
+    if not await host_sessions_engine.beat(session, now):
+        raise HTTPException(status_code=404, detail="Active session not found")
+    return host_sessions_engine.live_state(session, now)
+
 @api_router.post("/host/end-session/{session_id}")
 async def end_host_session(
     session_id: str,
@@ -3268,119 +5174,19 @@ async def end_host_session(
 ):
     """End a live hosting session and calculate rewards"""
     
-    # Get session
-    session = await db.host_sessions.find_one(
-        {"session_id": session_id, "user_id": current_user.user_id, "status": "active"},
-        {"_id": 0}
-    )
-    
-    if not session:
+    session = await host_sessions_engine.get(current_user.user_id)
+    if not session or session["session_id"] != session_id:
         raise HTTPException(status_code=404, detail="Active session not found")
     
-    # Calculate duration
-    started_at = session["started_at"]
-    if started_at.tzinfo is None:
-        started_at = started_at.replace(tzinfo=timezone.utc)
-    
-    ended_at = datetime.now(timezone.utc)
-    duration_minutes = int((ended_at - started_at).total_seconds() / 60)
-    
-    # Calculate rewards based on policy
-    stars_earned = 0
-    host_type = session["host_type"]
-    is_welcome = session["is_welcome_period"]
-    
-    if host_type == "video":
-        if is_welcome:
-            # Welcome period: 2,000 Stars per hour
-            if duration_minutes >= HOST_POLICY_CONFIG["min_video_minutes"]:
-                hours = duration_minutes // 60
-                stars_earned = hours * HOST_POLICY_CONFIG["welcome_video_reward_per_hour"]
-        else:
-            # Normal: 1,000 Stars per hour
-            if duration_minutes >= HOST_POLICY_CONFIG["min_video_minutes"]:
-                hours = duration_minutes // 60
-                stars_earned = hours * HOST_POLICY_CONFIG["normal_video_reward_per_hour"]
-    
-    elif host_type == "audio":
-        if is_welcome:
-            # Welcome period: 3,000 Stars per 2 hours (1500 x 2)
-            if duration_minutes >= HOST_POLICY_CONFIG["min_audio_minutes"]:
-                two_hour_blocks = duration_minutes // 120
-                stars_earned = two_hour_blocks * HOST_POLICY_CONFIG["welcome_audio_reward_per_2hours"]
-        else:
-            # Normal: 500 Stars per hour
-            hours = duration_minutes // 60
-            stars_earned = hours * HOST_POLICY_CONFIG["normal_audio_reward_per_hour"]
-    
-    # Update session
-    await db.host_sessions.update_one(
-        {"session_id": session_id},
-        {
-            "$set": {
-                "ended_at": ended_at,
-                "duration_minutes": duration_minutes,
-                "stars_earned": stars_earned,
-                "status": "completed"
-            }
-        }
-    )
-    
-    # Credit stars to wallet if earned
-    if stars_earned > 0:
-        await db.wallets.update_one(
-            {"user_id": current_user.user_id},
-            {
-                "$inc": {"stars_balance": stars_earned},
-                "$set": {"updated_at": datetime.now(timezone.utc)}
-            }
-        )
-        
-        # Create transaction
-        await db.wallet_transactions.insert_one({
-            "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
-            "user_id": current_user.user_id,
-            "transaction_type": "host_reward",
-            "amount": stars_earned,
-            "currency_type": "stars",
-            "status": TransactionStatus.COMPLETED,
-            "reference_id": session_id,
-            "description": f"{'Video' if host_type == 'video' else 'Audio'} Live Reward ({duration_minutes} mins)" + (" [Welcome Bonus]" if is_welcome else ""),
-            "created_at": datetime.now(timezone.utc)
-        })
-        
-        # Update host profile
-        await db.host_profiles.update_one(
-            {"user_id": current_user.user_id},
-            {
-                "$inc": {
-                    "total_live_minutes": duration_minutes,
-                    "total_stars_earned": stars_earned
-                },
-                "$set": {"updated_at": datetime.now(timezone.utc)}
-            }
-        )
-        
-        # Send notification
-        await db.notifications.insert_one({
-            "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
-            "user_id": current_user.user_id,
-            "title": "Live Session Completed! ⭐",
-            "message": f"You earned {stars_earned} stars for your {duration_minutes} minute {'video' if host_type == 'video' else 'audio'} session!",
-            "notification_type": "host_reward",
-            "is_read": False,
-            "action_url": "/host",
-            "created_at": datetime.now(timezone.utc)
-        })
+    result = await host_sessions_engine.end_session(session, datetime.now(timezone.utc))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Active session not found")
     
+    stars_earned = result["stars_earned"]
     return {
         "success": True,
-        "session_id": session_id,
-        "duration_minutes": duration_minutes,
-        "stars_earned": stars_earned,
-        "is_welcome_period": is_welcome,
-        "host_type": host_type,
-        "message": f"Session ended. You earned {stars_earned} stars!" if stars_earned > 0 else f"Session ended. Minimum {HOST_POLICY_CONFIG['min_video_minutes'] if host_type == 'video' else HOST_POLICY_CONFIG['min_audio_minutes']} minutes required for rewards."
+        **result,
+        "message": f"Session ended. You earned {stars_earned} stars!" if stars_earned > 0 else f"Session ended. Minimum {host_min_minutes(result['host_type'])} minutes required for rewards."
     }
 
 @api_router.post("/host/check-high-earner-bonus")
@@ -3465,20 +5271,12 @@ async def check_high_earner_bonus(current_user: User = Depends(get_current_user)
     charity_amount = total_gifts * (HOST_POLICY_CONFIG["high_earner_charity_percent"] / 100)
     
     # Add to charity
-    await db.charity_wallet.update_one(
-        {},
-        {
-            "$inc": {
-                "total_balance": charity_amount,
-                "total_received": charity_amount
-            },
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        },
-        upsert=True
-    )
+    async for posting in LedgerPosting.attempts():
+        async with posting:
+            posting.charity(current_user.user_id, charity_amount, "high_earner", month=current_month)
     
     # Send notification
-    await db.notifications.insert_one({
+    notification_queue.enqueue({
         "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "title": "High-Earner Bonus Unlocked! 🏆",
@@ -3501,19 +5299,22 @@ async def check_high_earner_bonus(current_user: User = Depends(get_current_user)
 
 @api_router.get("/host/sessions")
 async def get_host_sessions(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get host session history"""
-    sessions = await db.host_sessions.find(
+    sessions, next_cursor = await keyset_page(
+        "host_sessions",
         {"user_id": current_user.user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+        limit,
+        cursor
+    )
     
-    return {"sessions": sessions}
+    return {"sessions": sessions, "next_cursor": next_cursor}
 
-@api_router.get("/host/leaderboard")
-async def get_host_leaderboard():
+@leaderboard_engine.board("host")
+async def build_host_leaderboard():
     """Get top hosts leaderboard"""
     
     # Top hosts by stars earned
@@ -3531,12 +5332,10 @@ async def get_host_leaderboard():
     top_hosts = await db.host_sessions.aggregate(pipeline).to_list(20)
     
     # Get user details
+    profiles = await load_user_profiles(host["_id"] for host in top_hosts)
     leaderboard = []
     for i, host in enumerate(top_hosts):
-        user = await db.users.find_one(
-            {"user_id": host["_id"]},
-            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
-        )
+        user = profiles.get(host["_id"])
         if user:
             leaderboard.append({
                 "rank": i + 1,
@@ -3548,8 +5347,16 @@ async def get_host_leaderboard():
     
     return {"leaderboard": leaderboard}
 
+@api_router.get("/host/leaderboard")
+async def get_host_leaderboard():
+    """Get top hosts leaderboard"""
+    return await leaderboard_engine.serve("host")
+
 # ==================== EDUCATION PLATFORM ====================
 
+register_index("education_profiles", [("user_id", 1)], unique=True, dedupe=drop_duplicate_documents)
+register_index("course_enrollments", [("user_id", 1), ("course_id", 1)])
+
 """
 EDUCATION PLATFORM FEATURES:
 1. Gamified Learning - Courses with rewards
@@ -3656,8 +5463,7 @@ async def get_education_profile(current_user: User = Depends(get_current_user)):
     )
     
     if not profile:
-        profile = {
-            "user_id": current_user.user_id,
+        profile = await find_or_create("education_profiles", {"user_id": current_user.user_id}, {
             "current_level": "seedling",
             "total_learning_hours": 0,
             "courses_completed": 0,
@@ -3668,8 +5474,7 @@ async def get_education_profile(current_user: User = Depends(get_current_user)):
             "last_learning_date": None,
             "badges": [],
             "created_at": datetime.now(timezone.utc)
-        }
-        await db.education_profiles.insert_one(profile)
+        })
     
     # Calculate current level
     hours = profile.get("total_learning_hours", 0)
@@ -3932,6 +5737,7 @@ async def complete_lesson(
         },
         upsert=True
     )
+    await record_leaderboard_score("education", current_user.user_id, hours_added)
     
     # Create transaction
     await db.wallet_transactions.insert_one({
@@ -3959,7 +5765,7 @@ async def complete_lesson(
             {"$inc": {"courses_completed": 1}}
         )
         
-        await db.notifications.insert_one({
+        notification_queue.enqueue({
             "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
             "user_id": current_user.user_id,
             "title": "Course Completed! 🎓",
@@ -3970,6 +5776,14 @@ async def complete_lesson(
             "created_at": datetime.now(timezone.utc)
         })
     
+    domain_events.emit(
+        "lesson_completed",
+        current_user.user_id,
+        course_id=request.course_id,
+        lesson_id=request.lesson_id,
+        duration_minutes=request.duration_minutes
+    )
+    
     return {
         "success": True,
         "coins_earned": coins_earned,
@@ -4055,6 +5869,8 @@ async def play_mind_game(
         "created_at": datetime.now(timezone.utc)
     })
     
+    domain_events.emit("mind_game_played", current_user.user_id, game_id=request.game_id, score=request.score)
+    
     return {
         "success": True,
         "game": game["name"],
@@ -4077,12 +5893,10 @@ async def get_education_leaderboard():
     
     top_learners = await db.education_profiles.aggregate(pipeline).to_list(20)
     
+    profiles = await load_user_profiles(learner["user_id"] for learner in top_learners)
     leaderboard = []
     for i, learner in enumerate(top_learners):
-        user = await db.users.find_one(
-            {"user_id": learner["user_id"]},
-            {"_id": 0, "user_id": 1, "name": 1, "picture": 1}
-        )
+        user = profiles.get(learner["user_id"])
         if user:
             leaderboard.append({
                 "rank": i + 1,
@@ -4097,6 +5911,11 @@ async def get_education_leaderboard():
 
 # ==================== PHASE 1: LOGIC PK SYSTEM (WITH BETTING) ====================
 
+register_index("logic_pk_challenges", [("challenge_id", 1)])
+register_index("logic_pk_challenges", [("challenger_id", 1)])
+register_index("logic_pk_challenges", [("opponent_id", 1)])
+register_index("logic_pk_history", [("user_id", 1), ("result", 1), ("created_at", -1)])
+
 class LogicPKChallenge(BaseModel):
     challenge_id: str
     challenger_id: str
@@ -4384,6 +6203,10 @@ async def get_logic_pk_challenges(current_user: dict = Depends(get_current_user)
 
 # ==================== PHASE 1: DAILY MISSIONS ====================
 
+register_index("daily_mission_progress", [("user_id", 1), ("date", 1)], unique=True, dedupe=drop_duplicate_documents)
+
+MISSION_FLUSH_INTERVAL_SECONDS = float(os.environ.get("MISSION_FLUSH_INTERVAL_SECONDS", "2"))
+
 DAILY_MISSIONS = [
     {
         "mission_id": "complete_video",
@@ -4427,25 +6250,162 @@ DAILY_MISSIONS = [
     }
 ]
 
+class MissionsEngine:
+    """
+    Advances daily missions from domain events.
+    
+    Event handlers call advance(), which only adds to an in-memory buffer
+    keyed by (user_id, date); a background worker flushes the buffer every
+    flush interval as one unordered bulk_write with a single update per user
+    day, however many events and missions it covers. Every update is a
+    pipeline that adds and caps (`$min` with the target) on the server, so
+    concurrent writers can neither lose increments nor overshoot. Readers
+    call progress(), which applies that user's buffered increments in the
+    same round trip that fetches (or creates) the day's document.
+    """
+
+    def __init__(self, missions: list, flush_interval: float):
+        self.targets = {m["mission_id"]: m["target"] for m in missions}
+        self.flush_interval = flush_interval
+        self._pending: dict = {}
+        self._worker: Optional[asyncio.Task] = None
+        self.flushed = 0
+
+    def advance(self, user_id: str, increments: dict):
+        date = str(datetime.now(timezone.utc).date())
+        pending = self._pending.setdefault((user_id, date), {})
+        for mission_id, amount in increments.items():
+            if mission_id in self.targets and amount:
+                pending[mission_id] = pending.get(mission_id, 0) + amount
+
+    def _pipeline(self, increments: dict) -> list:
+        defaults = {"all_completed_bonus_claimed": {"$ifNull": ["$all_completed_bonus_claimed", False]}}
+        progress = {}
+        completed = {}
+        for mission_id, target in self.targets.items():
+            path = f"missions.{mission_id}"
+            defaults[f"{path}.progress"] = {"$ifNull": [f"${path}.progress", 0]}
+            defaults[f"{path}.claimed"] = {"$ifNull": [f"${path}.claimed", False]}
+            if increments.get(mission_id):
+                progress[f"{path}.progress"] = {
+                    "$min": [{"$add": [f"${path}.progress", increments[mission_id]]}, target]
+                }
+            completed[f"{path}.completed"] = {"$gte": [f"${path}.progress", target]}
+        stages = [{"$set": defaults}]
+        if progress:
+            stages.append({"$set": progress})
+        stages.append({"$set": completed})
+        return stages
+
+    def blank(self, user_id: str, date: str) -> dict:
+        """A fresh day's document, as the pipeline would create it"""
+        return {
+            "user_id": user_id,
+            "date": date,
+            "missions": {
+                mission_id: {"progress": 0, "completed": False, "claimed": False}
+                for mission_id in self.targets
+            },
+            "all_completed_bonus_claimed": False
+        }
+
+    def _requeue(self, key: tuple, increments: dict):
+        pending = self._pending.setdefault(key, {})
+        for mission_id, amount in increments.items():
+            pending[mission_id] = pending.get(mission_id, 0) + amount
+
+    async def progress(self, user_id: str, date: str, increments: Optional[dict] = None) -> dict:
+        """The user's mission document for `date` with buffered and given increments applied"""
+        combined = self._pending.pop((user_id, date), {})
+        for mission_id, amount in (increments or {}).items():
+            combined[mission_id] = combined.get(mission_id, 0) + amount
+        for attempt in range(2):
+            try:
+                return await db.daily_mission_progress.find_one_and_update(
+                    {"user_id": user_id, "date": date},
+                    self._pipeline(combined),
+                    upsert=True,
+                    return_document=True,
+                    projection={"_id": 0}
+                )
+            except DuplicateKeyError:
+                # Lost the insert race; the retry matches the winner's document
+                if attempt:
+                    self._requeue((user_id, date), combined)
+                    raise
+            except Exception:
+                self._requeue((user_id, date), combined)
+                raise
+
+    async def flush_user(self, user_id: str, date: str):
+        """Persist one user's buffered increments now (before reads that need them)"""
+        if (user_id, date) in self._pending:
+            await self.progress(user_id, date)
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        keys = list(pending)
+        try:
+            await db.daily_mission_progress.bulk_write([
+                UpdateOne({"user_id": user_id, "date": date}, self._pipeline(pending[(user_id, date)]), upsert=True)
+                for user_id, date in keys
+            ], ordered=False)
+            self.flushed += len(keys)
+        except BulkWriteError as e:
+            # Unordered: everything except the reported failures was applied
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            logger.error(f"Mission progress flush: {len(failed)} user days kept pending")
+            for i in failed:
+                self._requeue(keys[i], pending[keys[i]])
+            self.flushed += len(keys) - len(failed)
+        except Exception as e:
+            # Progress is capped, so replaying a write that did land only re-caps it
+            logger.error(f"Mission progress flush failed ({len(keys)} user days kept pending): {e}")
+            for key in keys:
+                self._requeue(key, pending[key])
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def drain(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.flush()
+
+missions_engine = MissionsEngine(DAILY_MISSIONS, MISSION_FLUSH_INTERVAL_SECONDS)
+
+@domain_events.on("lesson_completed")
+def advance_lesson_missions(user_id: str, duration_minutes: int = 0, **event):
+    missions_engine.advance(user_id, {"complete_video": 1, "study_time": duration_minutes})
+
+@domain_events.on("mind_game_played")
+def advance_mind_game_missions(user_id: str, **event):
+    missions_engine.advance(user_id, {"gyan_yuddh": 1})
+
+@domain_events.on("chat_rewarded")
+def advance_chat_missions(user_id: str, **event):
+    missions_engine.advance(user_id, {"help_friend": 1})
+
 @api_router.get("/daily-missions")
 async def get_daily_missions(current_user: dict = Depends(get_current_user)):
     """Get user's daily missions with progress"""
     today = datetime.now(timezone.utc).date()
     
     # Get or create today's mission progress
-    progress = await db.daily_mission_progress.find_one({
-        "user_id": current_user.user_id,
-        "date": str(today)
-    })
-    
-    if not progress:
-        progress = {
-            "user_id": current_user.user_id,
-            "date": str(today),
-            "missions": {m["mission_id"]: {"progress": 0, "completed": False, "claimed": False} for m in DAILY_MISSIONS},
-            "all_completed_bonus_claimed": False
-        }
-        await db.daily_mission_progress.insert_one(progress)
+    progress = await missions_engine.progress(current_user.user_id, str(today))
     
     missions_with_progress = []
     for mission in DAILY_MISSIONS:
@@ -4480,34 +6440,14 @@ async def update_mission_progress(
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
     
-    progress = await db.daily_mission_progress.find_one({
-        "user_id": current_user.user_id,
-        "date": str(today)
-    })
-    
-    if not progress:
-        progress = {
-            "user_id": current_user.user_id,
-            "date": str(today),
-            "missions": {m["mission_id"]: {"progress": 0, "completed": False, "claimed": False} for m in DAILY_MISSIONS},
-            "all_completed_bonus_claimed": False
-        }
-        await db.daily_mission_progress.insert_one(progress)
-    
-    current_progress = progress["missions"].get(mission_id, {"progress": 0, "completed": False, "claimed": False})
-    new_progress = min(current_progress["progress"] + progress_amount, mission["target"])
-    completed = new_progress >= mission["target"]
-    
-    await db.daily_mission_progress.update_one(
-        {"user_id": current_user.user_id, "date": str(today)},
-        {"$set": {f"missions.{mission_id}.progress": new_progress, f"missions.{mission_id}.completed": completed}}
-    )
+    progress = await missions_engine.progress(current_user.user_id, str(today), {mission_id: progress_amount})
+    mp = progress["missions"][mission_id]
     
     return {
         "mission_id": mission_id,
-        "progress": new_progress,
+        "progress": mp["progress"],
         "target": mission["target"],
-        "completed": completed
+        "completed": mp["completed"]
     }
 
 @api_router.post("/daily-missions/claim/{mission_id}")
@@ -4522,6 +6462,7 @@ async def claim_mission_reward(
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
     
+    await missions_engine.flush_user(current_user.user_id, str(today))
     progress = await db.daily_mission_progress.find_one({
         "user_id": current_user.user_id,
         "date": str(today)
@@ -4559,6 +6500,7 @@ async def claim_all_missions_bonus(current_user: dict = Depends(get_current_user
     """Claim bonus for completing all daily missions"""
     today = datetime.now(timezone.utc).date()
     
+    await missions_engine.flush_user(current_user.user_id, str(today))
     progress = await db.daily_mission_progress.find_one({
         "user_id": current_user.user_id,
         "date": str(today)
@@ -4593,8 +6535,15 @@ async def claim_all_missions_bonus(current_user: dict = Depends(get_current_user
 
 # ==================== PHASE 1: 5-CATEGORY LEADERBOARD ====================
 
-@api_router.get("/leaderboard/multi-category")
-async def get_multi_category_leaderboard():
+# Coins paid to the top ranks of each window when its period closes
+LEADERBOARD_REWARDS = {
+    "daily": {"top1": 500, "top2": 300, "top3": 200},
+    "weekly": {"top1": 5000, "top2": 3000, "top3": 2000, "top4_10": 1000},
+    "monthly": {"top1": 5000, "top2": 3000, "top3": 2000, "top4_10": 500}
+}
+
+@leaderboard_engine.board("multi_category")
+async def build_multi_category_leaderboard():
     """Get 5-category leaderboard with auto-rewards info"""
     
     # 1. Education Rank (Most learning hours)
@@ -4610,12 +6559,10 @@ async def get_multi_category_leaderboard():
     logic_leaders = await db.logic_pk_history.aggregate(logic_pipeline).to_list(10)
     
     # 3. Charity Rank (Most charity contributions)
-    charity_pipeline = [
-        {"$group": {"_id": "$user_id", "total_charity": {"$sum": "$charity_amount"}}},
-        {"$sort": {"total_charity": -1}},
-        {"$limit": 10}
+    charity_leaders = [
+        {"_id": row["user_id"], "total_charity": row["score"]}
+        for row in await live_leaderboard_top("charity", "all", 10)
     ]
-    charity_leaders = await db.charity_contributions.aggregate(charity_pipeline).to_list(10)
     
     # 4. Unity Rank (Most helpful in community)
     unity_pipeline = [
@@ -4638,12 +6585,18 @@ async def get_multi_category_leaderboard():
     
     # Get user details for each leaderboard
     async def enrich_leaderboard(leaders, id_field="_id", score_field="total"):
+        user_ids = [leader[id_field] for leader in leaders]
+        profiles = await load_user_profiles(user_ids)
+        charity_wallets = {
+            w["user_id"]: w
+            async for w in db.charity_wallets.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "balance": 1})
+        }
         enriched = []
         for i, leader in enumerate(leaders):
-            user = await db.users.find_one({"user_id": leader[id_field]})
+            user = profiles.get(leader[id_field])
             if user:
                 # Get charity wallet balance
-                charity_wallet = await db.charity_wallets.find_one({"user_id": leader[id_field]})
+                charity_wallet = charity_wallets.get(leader[id_field])
                 enriched.append({
                     "rank": i + 1,
                     "user_id": leader[id_field],
@@ -4653,23 +6606,543 @@ async def get_multi_category_leaderboard():
                 })
         return enriched
     
-    return {
-        "education": await enrich_leaderboard(education_leaders, "user_id", "total_learning_hours"),
-        "logic": await enrich_leaderboard(logic_leaders, "_id", "wins"),
-        "charity": await enrich_leaderboard(charity_leaders, "_id", "total_charity"),
-        "unity": await enrich_leaderboard(unity_leaders, "_id", "help_count"),
-        "global_sultan": await enrich_leaderboard(global_leaders, "_id", "total_score"),
-        "rewards": {
-            "daily": {"top1": 500, "top2": 300, "top3": 200},
-            "weekly": {"top1": 5000, "top2": 3000, "top3": 2000, "top4_10": 1000},
-            "monthly": {"top1": 5000, "top2": 3000, "top3": 2000, "top4_10": 500}
-        },
-        "next_reset": {
-            "daily": "12:00 AM",
-            "weekly": "Monday 12:00 AM",
-            "monthly": "1st of month 12:00 AM"
-        }
+    return {
+        "education": await enrich_leaderboard(education_leaders, "user_id", "total_learning_hours"),
+        "logic": await enrich_leaderboard(logic_leaders, "_id", "wins"),
+        "charity": await enrich_leaderboard(charity_leaders, "_id", "total_charity"),
+        "unity": await enrich_leaderboard(unity_leaders, "_id", "help_count"),
+        "global_sultan": await enrich_leaderboard(global_leaders, "_id", "total_score"),
+        "rewards": LEADERBOARD_REWARDS,
+        "next_reset": {
+            "daily": "12:00 AM",
+            "weekly": "Monday 12:00 AM",
+            "monthly": "1st of month 12:00 AM"
+        }
+    }
+
+@api_router.get("/leaderboard/multi-category")
+async def get_multi_category_leaderboard():
+    """Get 5-category leaderboard with auto-rewards info"""
+    return await leaderboard_engine.serve("multi_category")
+
+@api_router.get("/leaderboard/live/{board}")
+async def get_live_leaderboard(
+    board: str,
+    window: str = "all",
+    period: Optional[str] = None,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """Live top-N of a board from the incremental score counters"""
+    if board not in LIVE_LEADERBOARDS:
+        raise HTTPException(status_code=404, detail=f"Unknown leaderboard. Use one of: {', '.join(LIVE_LEADERBOARDS)}")
+    if window not in LIVE_LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of: {', '.join(LIVE_LEADERBOARD_WINDOWS)}")
+    
+    period = period or leaderboard_periods()[window]
+    limit = max(1, min(limit, 100))
+    return {
+        "board": board,
+        "window": window,
+        "period": period,
+        "leaderboard": await live_leaderboard_top(board, window, limit, period)
+    }
+
+# Public board names accepted by the rank lookup, mapped to live score boards
+RANK_LOOKUP_BOARDS = {
+    "gifts": "gifts_sent",
+    "gifts-received": "gifts_received",
+    "charity": "charity",
+    "lucky-wallet": "lucky_wallet",
+    "host": "host",
+    "education": "education"
+}
+
+async def live_leaderboard_rank(board: str, window: str, period: str, user_id: str,
+                                neighbors: int = 2) -> dict:
+    """
+    Rank of one user on a live board plus the rows just above and below.
+    
+    Rows are ordered by (score desc, user_id asc), the same order as the top
+    list; the rank is an index count of the rows ahead of the user, so the
+    cost grows with the rank, never with the size of the board.
+    """
+    scope = {"board": board, "window": window, "period": period}
+    mine = await db.leaderboard_scores.find_one({**scope, "user_id": user_id}, {"_id": 0, "score": 1})
+    if not mine:
+        return {"rank": None, "score": 0, "above": [], "below": []}
+    
+    score = mine["score"]
+    ahead = {**scope, "$or": [{"score": {"$gt": score}}, {"score": score, "user_id": {"$lt": user_id}}]}
+    behind = {**scope, "$or": [{"score": {"$lt": score}}, {"score": score, "user_id": {"$gt": user_id}}]}
+    projection = {"_id": 0, "user_id": 1, "score": 1}
+    
+    rank, above, below = await asyncio.gather(
+        db.leaderboard_scores.count_documents(ahead),
+        db.leaderboard_scores.find(ahead, projection).sort([("score", 1), ("user_id", -1)]).limit(neighbors).to_list(neighbors),
+        db.leaderboard_scores.find(behind, projection).sort([("score", -1), ("user_id", 1)]).limit(neighbors).to_list(neighbors)
+    )
+    rank += 1
+    above.reverse()
+    
+    profiles = await load_user_profiles(row["user_id"] for row in above + below)
+    return {
+        "rank": rank,
+        "score": score,
+        "above": [
+            {"rank": rank - len(above) + i, "user": profiles.get(row["user_id"]), **row}
+            for i, row in enumerate(above)
+        ],
+        "below": [
+            {"rank": rank + 1 + i, "user": profiles.get(row["user_id"]), **row}
+            for i, row in enumerate(below)
+        ]
+    }
+
+@api_router.get("/leaderboard/{board}/me")
+async def get_my_leaderboard_rank(
+    board: str,
+    window: str = "all",
+    neighbors: int = 2,
+    current_user: User = Depends(get_current_user)
+):
+    """Current user's rank, score and neighbours on a leaderboard"""
+    neighbors = max(1, min(neighbors, 10))
+    
+    if board == "top-150":
+        # Ranked from the cached top-150 snapshot; users outside it are unranked
+        snapshot = await leaderboard_engine.serve("top_150")
+        models = snapshot["top_models"]
+        index = next((i for i, m in enumerate(models) if m["user_id"] == current_user.user_id), None)
+        if index is None:
+            return {"board": board, "rank": None, "score": 0, "above": [], "below": [],
+                    "last_updated": snapshot["last_updated"]}
+        return {
+            "board": board,
+            "rank": models[index]["rank"],
+            "score": models[index]["score"],
+            "above": models[max(0, index - neighbors):index],
+            "below": models[index + 1:index + 1 + neighbors],
+            "last_updated": snapshot["last_updated"]
+        }
+    
+    if board not in RANK_LOOKUP_BOARDS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown leaderboard. Use one of: {', '.join(list(RANK_LOOKUP_BOARDS) + ['top-150'])}"
+        )
+    if window not in LIVE_LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of: {', '.join(LIVE_LEADERBOARD_WINDOWS)}")
+    
+    period = leaderboard_periods()[window]
+    return {
+        "board": board,
+        "window": window,
+        "period": period,
+        **await live_leaderboard_rank(RANK_LOOKUP_BOARDS[board], window, period, current_user.user_id, neighbors)
+    }
+
+# ==================== LEADERBOARD PRIZE SETTLEMENT ====================
+
+# Live boards whose daily/weekly/monthly winners are paid LEADERBOARD_REWARDS;
+# the monthly video board is always settled with MONTHLY_PRIZES and crowns.
+LEADERBOARD_PRIZE_BOARDS = [
+    b for b in os.environ.get("LEADERBOARD_PRIZE_BOARDS", "charity,education").split(",") if b
+]
+LEADERBOARD_SETTLEMENT_INTERVAL_SECONDS = float(os.environ.get("LEADERBOARD_SETTLEMENT_INTERVAL_SECONDS", "300"))
+LEADERBOARD_SETTLEMENT_GRACE_SECONDS = float(os.environ.get("LEADERBOARD_SETTLEMENT_GRACE_SECONDS", "120"))
+LEADERBOARD_SETTLEMENT_LEASE_SECONDS = float(os.environ.get("LEADERBOARD_SETTLEMENT_LEASE_SECONDS", "600"))
+LEADERBOARD_SETTLEMENT_LOOKBACK = int(os.environ.get("LEADERBOARD_SETTLEMENT_LOOKBACK", "3"))
+# Settlement ids remembered on each wallet to make prize credits exactly-once
+LEADERBOARD_PRIZE_MEMORY = 100
+
+register_index("leaderboard_settlements", [("settlement_id", 1)], unique=True)
+register_index("leaderboard_settlements", [("status", 1), ("paying_at", 1)])
+
+def leaderboard_prize(window: str, rank: int) -> int:
+    tiers = LEADERBOARD_REWARDS.get(window, {})
+    if f"top{rank}" in tiers:
+        return tiers[f"top{rank}"]
+    if 4 <= rank <= 10:
+        return tiers.get("top4_10", 0)
+    return 0
+
+def closed_leaderboard_periods(now: datetime, lookback: int = 1) -> list:
+    """(window, period) for the last `lookback` periods of each window whose reset (plus grace) has passed, oldest first"""
+    now = now - timedelta(seconds=LEADERBOARD_SETTLEMENT_GRACE_SECONDS)
+    periods = []
+    month_start = now.replace(day=1)
+    for back in range(lookback, 0, -1):
+        periods.append(("daily", leaderboard_periods(now - timedelta(days=back))["daily"]))
+        periods.append(("weekly", leaderboard_periods(now - timedelta(days=7 * back))["weekly"]))
+        month = month_start
+        for _ in range(back):
+            month = (month - timedelta(days=1)).replace(day=1)
+        periods.append(("monthly", leaderboard_periods(month)["monthly"]))
+    return periods
+
+async def freeze_leaderboard_winners(board: str, window: str, period: str) -> list:
+    """Prize-winning rows of a closed period, as they stand at settlement time"""
+    if board == "video":
+        data = await build_monthly_video_leaderboard(period)
+        return [
+            {
+                "rank": entry["rank"],
+                "user_id": entry["user_id"],
+                "score": entry["total_likes"],
+                "coins": MONTHLY_PRIZES.get(entry["rank"], {}).get("coins", 0),
+                "prize": MONTHLY_PRIZES.get(entry["rank"], {}).get("prize"),
+                "crown": entry["crown"]
+            }
+            for entry in data["leaderboard"] if entry["crown"] or entry["rank"] in MONTHLY_PRIZES
+        ]
+    
+    rows = await db.leaderboard_scores.find(
+        {"board": board, "window": window, "period": period, "score": {"$gt": 0}},
+        {"_id": 0, "user_id": 1, "score": 1}
+    ).sort([("score", -1), ("user_id", 1)]).limit(10).to_list(10)
+    return [
+        {"rank": i + 1, "user_id": row["user_id"], "score": row["score"], "coins": leaderboard_prize(window, i + 1)}
+        for i, row in enumerate(rows)
+        if leaderboard_prize(window, i + 1) > 0
+    ]
+
+async def settle_leaderboard_period(board: str, window: str, period: str) -> dict:
+    """
+    Pay out one closed leaderboard period exactly once.
+    
+    The winners are frozen into a leaderboard_settlements document keyed by
+    board/window/period, then paid in one posting: a single bulk_write of
+    wallet credits, one bulk_write of wallet transactions and one bulk_write
+    of crown grants. A run leases the period (frozen -> paying) and marks it
+    paid only after the posting has gone through; a failed run hands it back
+    and a crashed one is reclaimed once its lease expires. The run that
+    makes the first payout attempt re-reads the winners from the scores, so
+    a snapshot left frozen by a worker that died before paying is never
+    paid stale; from then on the winners stay fixed.
+    
+    Every payout write is idempotent, so a retry after a partial failure
+    (possible when the posting runs without a transaction) completes the
+    period without paying anyone twice: a wallet is credited only if the
+    settlement id is not yet in its prize_settlements list, transactions
+    are upserted by a deterministic transaction_id and crowns by owner and
+    type. Winners without a wallet are recorded as unpaid, with no
+    transaction row.
+    """
+    settlement_id = f"{board}:{window}:{period}"
+    settlement = await db.leaderboard_settlements.find_one({"settlement_id": settlement_id}, {"_id": 0})
+    if settlement and settlement["status"] == "paid":
+        return {"settlement_id": settlement_id, "status": "paid", "skipped": True}
+    
+    fresh = not settlement
+    if fresh:
+        settlement = {
+            "settlement_id": settlement_id,
+            "board": board,
+            "window": window,
+            "period": period,
+            "winners": await freeze_leaderboard_winners(board, window, period),
+            "status": "frozen",
+            "created_at": datetime.now(timezone.utc)
+        }
+        try:
+            await db.leaderboard_settlements.insert_one({**settlement})
+        except DuplicateKeyError:
+            # Another worker froze it first; settle its snapshot, not ours
+            settlement = await db.leaderboard_settlements.find_one({"settlement_id": settlement_id}, {"_id": 0})
+            fresh = False
+    
+    now = datetime.now(timezone.utc)
+    lease_expired = now - timedelta(seconds=LEADERBOARD_SETTLEMENT_LEASE_SECONDS)
+    claimed = await db.leaderboard_settlements.find_one_and_update(
+        {"settlement_id": settlement_id, "$or": [
+            {"status": "frozen"},
+            {"status": "paying", "paying_at": {"$lt": lease_expired}}
+        ]},
+        {"$set": {"status": "paying", "paying_at": now}}
+    )
+    if not claimed:
+        return {"settlement_id": settlement_id, "status": "paying", "skipped": True}
+    if "paying_at" not in claimed and not fresh:
+        # Nothing was paid from this snapshot yet, so pay the standings as they are now
+        settlement["winners"] = await freeze_leaderboard_winners(board, window, period)
+        await db.leaderboard_settlements.update_one(
+            {"settlement_id": settlement_id, "paying_at": now},
+            {"$set": {"winners": settlement["winners"], "refrozen_at": now}}
+        )
+    
+    label = "Monthly Video" if board == "video" else f"{window.title()} {board.replace('_', ' ').title()}"
+    try:
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                unpaid = []
+                wallets = {
+                    wallet["user_id"]: wallet
+                    async for wallet in db.wallets.find(
+                        {"user_id": {"$in": [winner["user_id"] for winner in settlement["winners"]]}},
+                        {"_id": 0, "user_id": 1, "prize_settlements": 1},
+                        session=posting.session
+                    )
+                }
+                for winner in settlement["winners"]:
+                    wallet = wallets.get(winner["user_id"])
+                    if winner["coins"] > 0 and wallet is None:
+                        unpaid.append({"user_id": winner["user_id"], "rank": winner["rank"], "reason": "no_wallet"})
+                    elif winner["coins"] > 0:
+                        posting.update(
+                            "wallets",
+                            {"user_id": winner["user_id"], "prize_settlements": {"$ne": settlement_id}},
+                            {
+                                "$inc": {"coins_balance": winner["coins"]},
+                                "$set": {"updated_at": now},
+                                "$push": {"prize_settlements": {"$each": [settlement_id], "$slice": -LEADERBOARD_PRIZE_MEMORY}}
+                            }
+                        )
+                        transaction_id = f"prize_{settlement_id}:{winner['rank']}"
+                        posting.update(
+                            "wallet_transactions",
+                            {"transaction_id": transaction_id},
+                            {"$setOnInsert": {
+                                "transaction_id": transaction_id,
+                                "user_id": winner["user_id"],
+                                "transaction_type": "leaderboard_prize",
+                                "amount": winner["coins"],
+                                "currency_type": "coins",
+                                "status": TransactionStatus.COMPLETED,
+                                "reference_id": settlement_id,
+                                "description": f"{label} Leaderboard #{winner['rank']} ({period})",
+                                "created_at": now
+                            }},
+                            upsert=True
+                        )
+                    if winner.get("crown"):
+                        posting.update(
+                            "user_crowns",
+                            {"user_id": winner["user_id"], "crown_type": winner["crown"], "is_active": True},
+                            {"$setOnInsert": {
+                                "crown_id": str(uuid.uuid4()),
+                                "earned_at": now,
+                                "expires_at": None,
+                                "source": settlement_id
+                            }},
+                            upsert=True
+                        )
+                    coins = winner["coins"] if wallet else 0
+                    if settlement_id in (wallet or {}).get("prize_settlements", []):
+                        # Credited by an earlier, interrupted run
+                        continue
+                    if not coins and not winner.get("crown"):
+                        continue
+                    posting.notify({
+                        "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
+                        "user_id": winner["user_id"],
+                        "title": f"You placed #{winner['rank']} on the {label} Leaderboard! 🏆",
+                        "message": f"You earned {coins} coins" + (f" and a {winner['crown'].title()} Crown" if winner.get("crown") else "") + "!",
+                        "notification_type": "reward",
+                        "is_read": False,
+                        "action_url": "/leaderboard",
+                        "created_at": now
+                    })
+    except Exception:
+        # Hand the period back for the next run; the payout writes are idempotent
+        await db.leaderboard_settlements.update_one(
+            {"settlement_id": settlement_id, "status": "paying", "paying_at": now},
+            {"$set": {"status": "frozen"}}
+        )
+        raise
+    
+    await db.leaderboard_settlements.update_one(
+        {"settlement_id": settlement_id, "status": "paying", "paying_at": now},
+        {"$set": {"status": "paid", "paid_at": datetime.now(timezone.utc), "unpaid": unpaid}}
+    )
+    return {"settlement_id": settlement_id, "status": "paid", "winners": len(settlement["winners"]), "unpaid": len(unpaid)}
+
+async def settle_leaderboards(now: Optional[datetime] = None) -> list:
+    """Settle every closed period in the lookback that has not been paid yet, oldest first"""
+    periods = closed_leaderboard_periods(now or datetime.now(timezone.utc), LEADERBOARD_SETTLEMENT_LOOKBACK)
+    targets = [(board, window, period) for window, period in periods for board in LEADERBOARD_PRIZE_BOARDS]
+    targets += [("video", "monthly", period) for window, period in periods if window == "monthly"]
+    
+    paid = set(await db.leaderboard_settlements.distinct("settlement_id", {
+        "settlement_id": {"$in": [f"{board}:{window}:{period}" for board, window, period in targets]},
+        "status": "paid"
+    }))
+    results = []
+    for board, window, period in targets:
+        if f"{board}:{window}:{period}" in paid:
+            continue
+        try:
+            results.append(await settle_leaderboard_period(board, window, period))
+        except Exception as e:
+            logger.error(f"Leaderboard settlement {board}:{window}:{period} failed: {e}")
+    return results
+
+class PeriodicJob:
+    """Runs a coroutine function every `interval` seconds in a background task"""
+
+    def __init__(self, name: str, interval: float, job):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.job()
+            except Exception as e:
+                logger.error(f"{self.name} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+leaderboard_settlement_job = PeriodicJob(
+    "Leaderboard settlement", LEADERBOARD_SETTLEMENT_INTERVAL_SECONDS, settle_leaderboards
+)
+
+# ==================== PERIOD ROLLOVER ====================
+
+# The per-user day documents (activity_sessions, daily_mission_progress)
+# are created for recently active users shortly before UTC midnight, so
+# the first requests of the new day find them instead of all upserting at
+# once. One worker at a time leases a day in period_rollovers (status
+# running/failed/done with a lease_until); a failed run is retried on the
+# next tick and one whose worker died once its lease lapses. The lazy
+# upserts stay in place for everyone else.
+register_index("period_rollovers", [("date", 1)], unique=True)
+register_index("activity_sessions", [("date", 1), ("user_id", 1)])
+register_index("daily_mission_progress", [("date", 1), ("user_id", 1)])
+
+PERIOD_ROLLOVER_INTERVAL_SECONDS = float(os.environ.get("PERIOD_ROLLOVER_INTERVAL_SECONDS", "300"))
+PERIOD_ROLLOVER_LEAD_SECONDS = float(os.environ.get("PERIOD_ROLLOVER_LEAD_SECONDS", "1800"))
+PERIOD_ROLLOVER_ACTIVE_DAYS = int(os.environ.get("PERIOD_ROLLOVER_ACTIVE_DAYS", "3"))
+PERIOD_ROLLOVER_LEASE_SECONDS = float(os.environ.get("PERIOD_ROLLOVER_LEASE_SECONDS", "600"))
+PERIOD_ROLLOVER_BATCH_SIZE = 1000
+
+async def recently_active_users(now: datetime) -> set:
+    """Users with active minutes or mission progress in the last few days"""
+    dates = [(now - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(PERIOD_ROLLOVER_ACTIVE_DAYS)]
+    # Only real activity counts; the zeroed documents a rollover pre-created
+    # would otherwise keep every user ever rolled over "active" for good
+    users = set(await db.activity_sessions.distinct("user_id", {
+        "date": {"$in": dates},
+        "total_active_minutes": {"$gt": 0}
+    }))
+    users.update(await db.daily_mission_progress.distinct("user_id", {
+        "date": {"$in": dates},
+        "$or": [{f"missions.{mission_id}.progress": {"$gt": 0}} for mission_id in missions_engine.targets]
+    }))
+    return users
+
+async def insert_period_documents(collection: str, documents: list) -> int:
+    """insert_many in unordered batches; documents that already exist are skipped"""
+    inserted = 0
+    for i in range(0, len(documents), PERIOD_ROLLOVER_BATCH_SIZE):
+        batch = documents[i:i + PERIOD_ROLLOVER_BATCH_SIZE]
+        try:
+            await db[collection].insert_many(batch, ordered=False)
+            inserted += len(batch)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            unexpected = [error for error in errors if error.get("code") != 11000]
+            if unexpected:
+                logger.error(f"Period rollover of {collection}: {len(unexpected)} inserts failed: {unexpected[0].get('errmsg')}")
+            inserted += len(batch) - len(errors)
+    return inserted
+
+async def rollover_periods(date: str) -> dict:
+    """Pre-create `date`'s per-user documents for recently active users"""
+    now = datetime.now(timezone.utc)
+    lease_until = now + timedelta(seconds=PERIOD_ROLLOVER_LEASE_SECONDS)
+    try:
+        # Inserts the claim, or takes over a run whose lease lapsed; a done
+        # day or a live lease makes the upsert collide on the unique date
+        await db.period_rollovers.update_one(
+            {
+                "date": date,
+                "status": {"$ne": "done"},
+                "$or": [
+                    {"status": "failed"},
+                    {"lease_until": {"$lt": now}},
+                    # claims written before leases existed
+                    {"lease_until": {"$exists": False}, "completed_at": {"$exists": False}}
+                ]
+            },
+            {
+                "$set": {"status": "running", "lease_until": lease_until, "started_at": now},
+                "$inc": {"attempts": 1}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return {"date": date, "skipped": True}
+    
+    try:
+        result = await precreate_period_documents(date)
+    except Exception:
+        # Let the next run retry straight away
+        await db.period_rollovers.update_one(
+            {"date": date, "lease_until": lease_until},
+            {"$set": {"status": "failed"}}
+        )
+        raise
+    await db.period_rollovers.update_one(
+        {"date": date, "lease_until": lease_until},
+        {"$set": {**result, "status": "done", "completed_at": datetime.now(timezone.utc)}}
+    )
+    return result
+
+async def precreate_period_documents(date: str) -> dict:
+    day_start = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    users = sorted(await recently_active_users(day_start - timedelta(days=1)))
+    result = {
+        "date": date,
+        "users": len(users),
+        "activity_sessions": await insert_period_documents("activity_sessions", [
+            {
+                "session_id": f"activity_{uuid.uuid4().hex[:12]}",
+                "user_id": user_id,
+                "started_at": day_start,
+                "last_active_at": day_start,
+                "total_active_minutes": 0,
+                "rewards_claimed": 0,
+                "date": date
+            }
+            for user_id in users
+        ]),
+        "daily_mission_progress": await insert_period_documents("daily_mission_progress", [
+            missions_engine.blank(user_id, date) for user_id in users
+        ])
     }
+    return result
+
+async def run_period_rollover():
+    """Roll over to tomorrow once midnight UTC is within the lead time; finish an interrupted run for today"""
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    dates = []
+    if await db.period_rollovers.find_one({"date": today, "status": {"$ne": "done"}}, {"_id": 1}):
+        dates.append(today)
+    if (tomorrow - now).total_seconds() <= PERIOD_ROLLOVER_LEAD_SECONDS:
+        dates.append(tomorrow.strftime("%Y-%m-%d"))
+    for date in dates:
+        result = await rollover_periods(date)
+        if not result.get("skipped"):
+            logger.info(f"Period rollover: {result}")
+
+period_rollover_job = PeriodicJob("Period rollover", PERIOD_ROLLOVER_INTERVAL_SECONDS, run_period_rollover)
 
 # ==================== CHARITY 10B TRIGGER ====================
 
@@ -4683,16 +7156,7 @@ PLATFORM_CONFIG = {
 @api_router.get("/platform/charity-config")
 async def get_charity_config():
     """Get current charity configuration based on revenue"""
-    platform_stats = await db.platform_stats.find_one({"stat_id": "main"})
-    
-    if not platform_stats:
-        platform_stats = {
-            "stat_id": "main",
-            "total_revenue": 0,
-            "total_charity_collected": 0,
-            "created_at": datetime.now(timezone.utc)
-        }
-        await db.platform_stats.insert_one(platform_stats)
+    platform_stats = await platform_stats_counter.read()
     
     total_revenue = platform_stats.get("total_revenue", 0)
     threshold_reached = total_revenue >= PLATFORM_CONFIG["charity_threshold"]
@@ -4712,6 +7176,8 @@ async def get_charity_config():
 
 # ==================== STAR TO COINS EXCHANGE SYSTEM ====================
 
+register_index("star_exchanges", [("user_id", 1), ("created_at", -1)])
+
 # Exchange Configuration
 STAR_EXCHANGE_CONFIG = {
     "rate": 0.92,  # 1 Star = 0.92 Coins
@@ -4767,9 +7233,11 @@ async def calculate_star_exchange(request: StarExchangeRequest):
     }
 
 @api_router.post("/star-exchange/execute")
+@idempotent("star_exchange")
 async def execute_star_exchange(
     request: StarExchangeRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Execute Star to Coins exchange"""
     star_amount = request.star_amount
@@ -4781,33 +7249,23 @@ async def execute_star_exchange(
             detail=f"Minimum {STAR_EXCHANGE_CONFIG['minimum_stars']} stars required"
         )
     
-    # Get user's wallet
-    wallet = await db.wallets.find_one({"user_id": current_user.user_id})
-    if not wallet:
-        raise HTTPException(status_code=404, detail="Wallet not found")
-    
-    current_stars = wallet.get("stars_balance", 0)
-    
-    # Check sufficient stars
-    if current_stars < star_amount:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Insufficient stars. You have {current_stars} stars"
-        )
-    
     # Check daily limit
-    today = datetime.now(timezone.utc).date()
-    today_exchanges = await db.star_exchanges.aggregate([
-        {
-            "$match": {
-                "user_id": current_user.user_id,
-                "created_at": {"$gte": datetime.combine(today, datetime.min.time())}
-            }
-        },
-        {"$group": {"_id": None, "total": {"$sum": "$stars_exchanged"}}}
-    ]).to_list(1)
-    
-    today_total = today_exchanges[0]["total"] if today_exchanges else 0
+    _, today_summary = await read_ledger_summary(current_user.user_id)
+    if "star_exchange" in today_summary:
+        today_total = today_summary["star_exchange"].get("total_stars_exchanged", 0)
+    else:
+        # No summary yet (e.g. before the ledger summary backfill) - count the exchanges directly
+        today = datetime.now(timezone.utc).date()
+        today_exchanges = await db.star_exchanges.aggregate([
+            {
+                "$match": {
+                    "user_id": current_user.user_id,
+                    "created_at": {"$gte": datetime.combine(today, datetime.min.time())}
+                }
+            },
+            {"$group": {"_id": None, "total": {"$sum": "$stars_exchanged"}}}
+        ]).to_list(1)
+        today_total = today_exchanges[0]["total"] if today_exchanges else 0
     
     if today_total + star_amount > STAR_EXCHANGE_CONFIG["daily_limit"]:
         raise HTTPException(
@@ -4820,28 +7278,30 @@ async def execute_star_exchange(
     fee_coins = int(star_amount * STAR_EXCHANGE_CONFIG["fee_percentage"] / 100)
     
     # Execute exchange - Deduct stars, Add coins
-    await db.wallets.update_one(
-        {"user_id": current_user.user_id},
-        {
-            "$inc": {
-                "stars_balance": -star_amount,
-                "coins_balance": coins_received
-            }
-        }
+    updated_wallet = await debit_wallet(
+        current_user.user_id,
+        {"stars_balance": star_amount},
+        credits={"coins_balance": coins_received}
     )
     
+    if not updated_wallet:
+        wallet = await db.wallets.find_one(
+            {"user_id": current_user.user_id},
+            {"_id": 0, "stars_balance": 1}
+        )
+        if not wallet:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient stars. You have {wallet.get('stars_balance', 0)} stars"
+        )
+    
     # Add fee to platform treasury
-    await db.platform_stats.update_one(
-        {"stat_id": "main"},
-        {
-            "$inc": {
-                "exchange_fees_collected": fee_coins,
-                "total_stars_exchanged": star_amount,
-                "total_coins_issued": coins_received
-            }
-        },
-        upsert=True
-    )
+    await platform_stats_counter.increment({
+        "exchange_fees_collected": fee_coins,
+        "total_stars_exchanged": star_amount,
+        "total_coins_issued": coins_received
+    })
     
     # Log exchange transaction
     exchange_record = {
@@ -4853,9 +7313,16 @@ async def execute_star_exchange(
         "created_at": datetime.now(timezone.utc)
     }
     await db.star_exchanges.insert_one(exchange_record)
+    await update_ledger_summary(current_user.user_id, {
+        "star_exchange.count": 1,
+        "star_exchange.total_stars_exchanged": star_amount,
+        "star_exchange.total_coins_received": coins_received,
+        "star_exchange.total_fees": fee_coins
+    })
     
     # Create transaction record
     await db.wallet_transactions.insert_one({
+        "transaction_id": f"txn_{uuid.uuid4().hex[:12]}",
         "user_id": current_user.user_id,
         "type": "star_to_coin_exchange",
         "stars_deducted": star_amount,
@@ -4865,9 +7332,6 @@ async def execute_star_exchange(
         "created_at": datetime.now(timezone.utc)
     })
     
-    # Get updated balances
-    updated_wallet = await db.wallets.find_one({"user_id": current_user.user_id})
-    
     return {
         "success": True,
         "message": f"Successfully exchanged {star_amount:,} Stars to {coins_received:,} Coins!",
@@ -4880,39 +7344,30 @@ async def execute_star_exchange(
 
 @api_router.get("/star-exchange/history")
 async def get_star_exchange_history(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Get user's star exchange history"""
-    exchanges = await db.star_exchanges.find(
-        {"user_id": current_user.user_id}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+    exchanges, next_cursor = await keyset_page(
+        "star_exchanges",
+        {"user_id": current_user.user_id},
+        limit,
+        cursor,
+        keep_id=True
+    )
     
     for e in exchanges:
         e["_id"] = str(e["_id"])
         e["created_at"] = e["created_at"].isoformat() if e.get("created_at") else None
     
     # Get totals
-    totals = await db.star_exchanges.aggregate([
-        {"$match": {"user_id": current_user.user_id}},
-        {"$group": {
-            "_id": None,
-            "total_stars_exchanged": {"$sum": "$stars_exchanged"},
-            "total_coins_received": {"$sum": "$coins_received"},
-            "total_fees": {"$sum": "$fee_coins"},
-            "count": {"$sum": 1}
-        }}
-    ]).to_list(1)
-    
-    total_stats = totals[0] if totals else {
-        "total_stars_exchanged": 0,
-        "total_coins_received": 0,
-        "total_fees": 0,
-        "count": 0
-    }
+    summary, _ = await read_ledger_summary(current_user.user_id)
+    total_stats = summary.get("star_exchange", {})
     
     return {
         "exchanges": exchanges,
+        "next_cursor": next_cursor,
         "totals": {
             "total_stars_exchanged": total_stats.get("total_stars_exchanged", 0),
             "total_coins_received": total_stats.get("total_coins_received", 0),
@@ -4924,27 +7379,12 @@ async def get_star_exchange_history(
 @api_router.get("/star-exchange/daily-stats")
 async def get_daily_exchange_stats(current_user: dict = Depends(get_current_user)):
     """Get today's exchange statistics for user"""
-    today = datetime.now(timezone.utc).date()
-    
-    today_stats = await db.star_exchanges.aggregate([
-        {
-            "$match": {
-                "user_id": current_user.user_id,
-                "created_at": {"$gte": datetime.combine(today, datetime.min.time())}
-            }
-        },
-        {"$group": {
-            "_id": None,
-            "today_stars_exchanged": {"$sum": "$stars_exchanged"},
-            "today_coins_received": {"$sum": "$coins_received"},
-            "exchange_count": {"$sum": 1}
-        }}
-    ]).to_list(1)
-    
-    stats = today_stats[0] if today_stats else {
-        "today_stars_exchanged": 0,
-        "today_coins_received": 0,
-        "exchange_count": 0
+    _, today_summary = await read_ledger_summary(current_user.user_id)
+    today_exchanges = today_summary.get("star_exchange", {})
+    stats = {
+        "today_stars_exchanged": today_exchanges.get("total_stars_exchanged", 0),
+        "today_coins_received": today_exchanges.get("total_coins_received", 0),
+        "exchange_count": today_exchanges.get("count", 0)
     }
     
     remaining_daily_limit = STAR_EXCHANGE_CONFIG["daily_limit"] - stats.get("today_stars_exchanged", 0)
@@ -4974,6 +7414,8 @@ async def health_check():
 
 # ==================== CROWN SYSTEM APIs ====================
 
+register_index("user_crowns", [("user_id", 1), ("is_active", 1)])
+
 @api_router.get("/crowns/types")
 async def get_crown_types():
     """Get all available crown types and their requirements"""
@@ -5111,11 +7553,9 @@ async def claim_crown(crown_type: str, user: User = Depends(get_current_user)):
 
 # ==================== VIDEO LEADERBOARD APIs ====================
 
-@api_router.get("/leaderboard/video/monthly")
-async def get_monthly_video_leaderboard(
-    month: Optional[str] = None  # Format: "2025-01"
-):
-    """Get monthly video leaderboard with prizes"""
+@leaderboard_engine.board("video_monthly")
+async def build_monthly_video_leaderboard(month: Optional[str] = None):
+    """Monthly video leaderboard; defaults to the current month"""
     if not month:
         month = datetime.now(timezone.utc).strftime("%Y-%m")
     
@@ -5134,12 +7574,19 @@ async def get_monthly_video_leaderboard(
     
     results = await db.videos.aggregate(pipeline).to_list(150)
     
+    user_ids = [entry["_id"] for entry in results]
+    profiles = await load_user_profiles(user_ids)
+    crowns_by_user: dict = {}
+    async for c in db.user_crowns.find(
+        {"user_id": {"$in": user_ids}, "is_active": True},
+        {"_id": 0, "user_id": 1, "crown_type": 1}
+    ):
+        crowns_by_user.setdefault(c["user_id"], []).append(c)
+    
     leaderboard = []
     for i, entry in enumerate(results, 1):
-        user = await db.users.find_one({"user_id": entry["_id"]})
-        user_crowns = await db.user_crowns.find(
-            {"user_id": entry["_id"], "is_active": True}
-        ).to_list(10)
+        user = profiles.get(entry["_id"])
+        user_crowns = crowns_by_user.get(entry["_id"], [])[:10]
         
         # Determine prize for top 10
         prize_info = MONTHLY_PRIZES.get(i, {"prize": None, "coins": 0})
@@ -5171,13 +7618,28 @@ async def get_monthly_video_leaderboard(
     return {
         "month": month,
         "leaderboard": leaderboard,
-        "total_participants": len(leaderboard),
-        "prizes": MONTHLY_PRIZES,
-        "last_updated": datetime.now(timezone.utc).isoformat()
+        "total_participants": len(leaderboard)
     }
 
-@api_router.get("/leaderboard/top-150")
-async def get_top_150_models():
+@api_router.get("/leaderboard/video/monthly")
+async def get_monthly_video_leaderboard(
+    month: Optional[str] = None  # Format: "2025-01"
+):
+    """Get monthly video leaderboard with prizes"""
+    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+    if month and month != current_month:
+        # Each past month gets its own stored snapshot, so only real ones are accepted
+        if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", month):
+            raise HTTPException(status_code=400, detail="month must be in YYYY-MM format")
+        if month > current_month:
+            raise HTTPException(status_code=400, detail="month must not be in the future")
+        leaderboard = await leaderboard_engine.serve("video_monthly", month)
+    else:
+        leaderboard = await leaderboard_engine.serve("video_monthly")
+    return {**leaderboard, "prizes": MONTHLY_PRIZES}
+
+@leaderboard_engine.board("top_150")
+async def build_top_150_models():
     """Get top 150 models across all categories"""
     # Aggregate user scores
     pipeline = [
@@ -5203,9 +7665,10 @@ async def get_top_150_models():
     
     results = await db.videos.aggregate(pipeline).to_list(150)
     
+    profiles = await load_user_profiles(entry["_id"] for entry in results)
     top_models = []
     for i, entry in enumerate(results, 1):
-        user = await db.users.find_one({"user_id": entry["_id"]})
+        user = profiles.get(entry["_id"])
         top_models.append({
             "rank": i,
             "user_id": entry["_id"],
@@ -5228,8 +7691,16 @@ async def get_top_150_models():
         }
     }
 
+@api_router.get("/leaderboard/top-150")
+async def get_top_150_models():
+    """Get top 150 models across all categories"""
+    return await leaderboard_engine.serve("top_150")
+
 # ==================== MHA EVENT APIs ====================
 
+register_index("mha_participants", [("event_id", 1), ("user_id", 1)])
+register_index("mha_participants", [("event_id", 1), ("total_score", -1)])
+
 @api_router.get("/events/mha/active")
 async def get_active_mha_events():
     """Get all active MHA events"""
@@ -5299,9 +7770,10 @@ async def get_mha_event_leaderboard(event_id: str):
         {"event_id": event_id}
     ).sort("total_score", -1).to_list(150)
     
+    profiles = await load_user_profiles(p["user_id"] for p in participants)
     leaderboard = []
     for i, p in enumerate(participants, 1):
-        user = await db.users.find_one({"user_id": p["user_id"]})
+        user = profiles.get(p["user_id"])
         leaderboard.append({
             "rank": i,
             "user_id": p["user_id"],
@@ -5328,12 +7800,7 @@ async def get_mha_event_leaderboard(event_id: str):
 async def get_charity_status():
     """Get current charity contribution status and rates"""
     # Get company revenue (mock for now)
-    company_stats = await db.company_stats.find_one({"type": "revenue"}) or {
-        "total_revenue": 0,
-        "total_charity_contributed": 0
-    }
-    
-    total_revenue = company_stats.get("total_revenue", 0)
+    total_revenue = await live_counters.get("company_revenue")
     
     # Determine current phase
     if total_revenue >= CHARITY_PHASE_1_THRESHOLD:
@@ -5347,7 +7814,7 @@ async def get_charity_status():
         "current_phase": phase,
         "charity_rate": current_charity_rate * 100,
         "security_fund_rate": SECURITY_FUND_RATE * 100,
-        "total_charity_contributed": company_stats.get("total_charity_contributed", 0),
+        "total_charity_contributed": await live_counters.get("company_charity_contributed"),
         "revenue_to_next_phase": max(0, CHARITY_PHASE_1_THRESHOLD - total_revenue),
         "phase_threshold": CHARITY_PHASE_1_THRESHOLD,
         "message": "45% of company income goes to charity after ₹10 Billion revenue milestone"
@@ -5355,6 +7822,9 @@ async def get_charity_status():
 
 # ==================== UNIVERSAL PARTNER APIs ====================
 
+register_index("partners", [("partner_id", 1)])
+register_index("partners", [("email", 1)])
+
 class PartnerApplicationRequest(BaseModel):
     organization_name: str
     partner_type: str
@@ -5712,6 +8182,9 @@ async def get_my_education_progress(user: User = Depends(get_current_user)):
 
 # ==================== TALENT REGISTRATION APIs ====================
 
+register_index("talents", [("user_id", 1)])
+register_index("talents", [("talent_id", 1)])
+
 class TalentRegistrationRequest(BaseModel):
     talent_type: str  # teacher, doctor, lawyer, etc.
     profession_title: str
@@ -5907,9 +8380,10 @@ async def browse_talents(
     
     talents = await db.talents.find(query).sort("rating", -1).to_list(100)
     
+    profiles = await load_user_profiles(t["user_id"] for t in talents)
     result = []
     for t in talents:
-        user = await db.users.find_one({"user_id": t["user_id"]})
+        user = profiles.get(t["user_id"])
         result.append({
             "talent_id": t["talent_id"],
             "user_name": user["name"] if user else "Unknown",
@@ -6090,8 +8564,243 @@ async def get_my_ads(user: User = Depends(get_current_user)):
         "total": len(ads)
     }
 
+# ==================== LLM GATEWAY ====================
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("LLM_REQUEST_TIMEOUT_SECONDS", "30"))
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+register_index("llm_response_cache", [("key", 1)], unique=True)
+register_index("llm_response_cache", [("expires_at", 1)], expireAfterSeconds=0)
+
+class LLMGateway:
+    """
+    Front door for chat completions.
+    
+    complete() answers from an in-process LRU or the shared
+    llm_response_cache collection when the key was seen within the TTL,
+    joins an identical request already in flight instead of sending a
+    second one, and otherwise waits (up to queue_timeout) for one of
+    max_concurrency slots before calling the API with request_timeout.
+    Per-model call, hit and latency counters are kept for stats().
+    
+    Only the shared collection is seen by every worker. The LRU, the
+    in-flight joins, the slots and the counters are per process: N workers
+    may send N identical requests at once and up to N * max_concurrency
+    calls. An answer taken from the shared cache is kept locally only until
+    the shared entry expires, so no worker serves it longer than the TTL.
+    """
+
+    def __init__(self, client, max_concurrency: int, queue_timeout: float, request_timeout: float,
+                 cache_ttl: int, cache_max_entries: int):
+        self.client = client
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: dict = {}
+        self._metrics: dict = {}
+        self.max_concurrency = max_concurrency
+        self.waiting = 0
+
+    def _model_metrics(self, model: str) -> dict:
+        return self._metrics.setdefault(model, {
+            "requests": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "latencies_ms": deque(maxlen=500)
+        })
+
+    def _remember(self, key: str, answer: str, ttl: Optional[float] = None):
+        self._cache[key] = (answer, time.monotonic() + (self.cache_ttl if ttl is None else ttl))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    async def cached(self, key: str) -> Optional[str]:
+        local = self._cache.get(key)
+        if local and local[1] > time.monotonic():
+            return local[0]
+        now = datetime.now(timezone.utc)
+        # The TTL monitor only sweeps once a minute, so skip expired entries here
+        shared = await db.llm_response_cache.find_one(
+            {"key": key, "expires_at": {"$gt": now}},
+            {"_id": 0, "answer": 1, "expires_at": 1}
+        )
+        if shared:
+            self._remember(key, shared["answer"], (as_utc(shared["expires_at"]) - now).total_seconds())
+            return shared["answer"]
+        return None
+
+    async def store(self, key: str, model: str, answer: str):
+        self._remember(key, answer)
+        now = datetime.now(timezone.utc)
+        await db.llm_response_cache.update_one(
+            {"key": key},
+            {"$set": {
+                "model": model,
+                "answer": answer,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.cache_ttl)
+            }},
+            upsert=True
+        )
+
+    async def acquire(self, model: str):
+        """Wait for a concurrency slot; raises asyncio.TimeoutError when the queue wait runs out"""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._model_metrics(model)["rejected"] += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._slots.release()
+
+    async def _call(self, key: str, model: str, messages: list, params: dict) -> str:
+        metrics = self._model_metrics(model)
+        await self.acquire(model)
+        started = time.monotonic()
+        try:
+            metrics["calls"] += 1
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model, messages=messages, **params),
+                timeout=self.request_timeout
+            )
+        except asyncio.TimeoutError:
+            metrics["timeouts"] += 1
+            raise
+        except Exception:
+            metrics["errors"] += 1
+            raise
+        finally:
+            self.release()
+            metrics["latencies_ms"].append((time.monotonic() - started) * 1000)
+        
+        answer = response.choices[0].message.content
+        await self.store(key, model, answer)
+        return answer
+
+    async def stream(self, key: str, model: str, messages: list, **params):
+        """
+        Yield answer text incrementally. A cached answer comes back as one
+        chunk; otherwise a slot is held for the whole stream=True call and the
+        assembled answer is cached once it finishes.
+        """
+        metrics = self._model_metrics(model)
+        metrics["requests"] += 1
+        
+        answer = await self.cached(key)
+        if answer is not None:
+            metrics["cache_hits"] += 1
+            yield answer
+            return
+        
+        await self.acquire(model)
+        started = time.monotonic()
+        deadline = started + self.request_timeout
+        parts = []
+        response = None
+        try:
+            metrics["calls"] += 1
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model, messages=messages, stream=True, **params),
+                timeout=self.request_timeout
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except asyncio.TimeoutError:
+            metrics["timeouts"] += 1
+            raise
+        except Exception:
+            metrics["errors"] += 1
+            raise
+        finally:
+            self.release()
+            metrics["latencies_ms"].append((time.monotonic() - started) * 1000)
+            if response is not None:
+                # Stop the upstream generation too when our caller went away
+                with anyio.CancelScope(shield=True):
+                    await response.close()
+        
+        await self.store(key, model, "".join(parts))
+
+    async def complete(self, key: str, model: str, messages: list, **params) -> str:
+        metrics = self._model_metrics(model)
+        metrics["requests"] += 1
+        
+        answer = await self.cached(key)
+        if answer is not None:
+            metrics["cache_hits"] += 1
+            return answer
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._call(key, model, messages, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metrics["coalesced"] += 1
+        # Shielded so one caller disconnecting does not cancel the shared call
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        models = {}
+        for model, metrics in self._metrics.items():
+            latencies = sorted(metrics["latencies_ms"])
+            models[model] = {
+                **{k: v for k, v in metrics.items() if k != "latencies_ms"},
+                "hit_rate": round(metrics["cache_hits"] / metrics["requests"], 4) if metrics["requests"] else 0.0,
+                "latency_ms": {
+                    "p50": round(latencies[len(latencies) // 2], 1) if latencies else None,
+                    "p95": round(latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+                    "max": round(latencies[-1], 1) if latencies else None
+                }
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.waiting,
+            "in_flight": len(self._inflight),
+            "cached_entries": len(self._cache),
+            "models": models
+        }
+
+llm_gateway = LLMGateway(
+    openai_client,
+    LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_TIMEOUT_SECONDS,
+    LLM_REQUEST_TIMEOUT_SECONDS,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_MAX_ENTRIES
+)
+
+@api_router.get("/llm/gateway/stats")
+async def get_llm_gateway_stats(current_user: User = Depends(get_current_user)):
+    """Per-model LLM call, cache-hit and latency counters"""
+    return {"success": True, "gateway": llm_gateway.stats()}
+
 # ==================== Gyan TEACHER APIs ====================
 
+register_index("gyan_guru_queries", [("user_id", 1), ("created_at", -1)])
+
 @api_router.get("/gyan-guru/subjects")
 async def get_gyan_guru_subjects():
     """Get all subjects Gyan Mind Trigger can help with"""
@@ -6124,9 +8833,10 @@ class GyanMindQuestionRequest(BaseModel):
 @api_router.post("/gyan-guru/ask")
 async def ask_gyan_guru(
     request: GyanMindQuestionRequest,
+    stream: bool = False,
     user: User = Depends(get_current_user)
 ):
-    """Ask a question to Gyan Mind Trigger"""
+    """Ask a question to Gyan Mind Trigger (?stream=true streams the answer as server-sent events)"""
     user_id = user.user_id
     
     # Check daily question limit
@@ -6153,6 +8863,13 @@ async def ask_gyan_guru(
             "daily_limit": daily_limit
         }
     
+    if stream:
+        return StreamingResponse(
+            stream_gyan_guru_answer(request, user_id, daily_limit - today_questions - 1),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
     # Generate Gyan response using REAL LLM
     query_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc)
@@ -6187,8 +8904,10 @@ async def ask_gyan_guru(
         "trust_features": GYAN_MIND_CONFIG["trust_building_features"]
     }
 
-async def generate_gyan_guru_response_llm(subject: str, question: str, language: str) -> dict:
-    """Generate Gyan Mind Trigger response using real LLM (Emergent API) - MULTILINGUAL SUPPORT"""
+GYAN_GURU_MODEL = "gpt-4o-mini"
+
+def gyan_guru_system_prompt(subject: str, language: str) -> str:
+    """System prompt for a subject and answer language - MULTILINGUAL SUPPORT"""
     
     # Subject-specific system prompts
     subject_prompts = {
@@ -6282,38 +9001,49 @@ Guidelines:
 - Be encouraging and supportive
 - Keep responses concise but informative (2-3 paragraphs max)
 """
+    return full_system
+
+# Sources shown with an answer, by subject
+GYAN_GURU_SOURCES = {
+    "mathematics": ["NCERT Mathematics", "Khan Academy", "Gyan Sultanat"],
+    "science": ["NCERT Science", "National Geographic", "Gyan Sultanat"],
+    "law": ["Indian Kanoon", "Legal Services India", "Gyan Sultanat"],
+    "health": ["WHO Guidelines", "AIIMS", "Gyan Sultanat"],
+    "business": ["Harvard Business Review", "Economic Times", "Gyan Sultanat"],
+    "psychology": ["Psychology Today", "NIMHANS", "Gyan Sultanat"],
+    "history": ["NCERT History", "Britannica", "Gyan Sultanat"],
+    "geography": ["National Geographic", "NCERT Geography", "Gyan Sultanat"],
+    "technology": ["MIT OpenCourseWare", "TechCrunch", "Gyan Sultanat"],
+    "finance": ["Economic Times", "Investopedia", "Gyan Sultanat"],
+}
+
+def gyan_guru_cache_key(subject: str, question: str, language: str) -> str:
+    """Cache key over the normalized (subject, language, question)"""
+    normalized = re.sub(r"\s+", " ", question).strip().rstrip("?!.।").lower()
+    raw = f"{subject.strip().lower()}|{language.strip().lower()}|{normalized}"
+    return f"gyan_guru:{hashlib.sha256(raw.encode()).hexdigest()}"
 
+def gyan_guru_messages(subject: str, question: str, language: str) -> list:
+    return [
+        {"role": "system", "content": gyan_guru_system_prompt(subject, language)},
+        {"role": "user", "content": question}
+    ]
+
+async def generate_gyan_guru_response_llm(subject: str, question: str, language: str) -> dict:
+    """Generate Gyan Mind Trigger response using real LLM (Emergent API) through the LLM gateway"""
     try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": full_system},
-                {"role": "user", "content": question}
-            ],
+        answer = await llm_gateway.complete(
+            gyan_guru_cache_key(subject, question, language),
+            GYAN_GURU_MODEL,
+            gyan_guru_messages(subject, question, language),
             max_tokens=500,
             temperature=0.7
         )
         
-        answer = response.choices[0].message.content
-        
-        # Determine sources based on subject
-        sources_map = {
-            "mathematics": ["NCERT Mathematics", "Khan Academy", "Gyan Sultanat"],
-            "science": ["NCERT Science", "National Geographic", "Gyan Sultanat"],
-            "law": ["Indian Kanoon", "Legal Services India", "Gyan Sultanat"],
-            "health": ["WHO Guidelines", "AIIMS", "Gyan Sultanat"],
-            "business": ["Harvard Business Review", "Economic Times", "Gyan Sultanat"],
-            "psychology": ["Psychology Today", "NIMHANS", "Gyan Sultanat"],
-            "history": ["NCERT History", "Britannica", "Gyan Sultanat"],
-            "geography": ["National Geographic", "NCERT Geography", "Gyan Sultanat"],
-            "technology": ["MIT OpenCourseWare", "TechCrunch", "Gyan Sultanat"],
-            "finance": ["Economic Times", "Investopedia", "Gyan Sultanat"],
-        }
-        
         return {
             "answer": answer,
             "confidence": 0.92,
-            "sources": sources_map.get(subject, ["Gyan Sultanat Knowledge Base"])
+            "sources": GYAN_GURU_SOURCES.get(subject, ["Gyan Sultanat Knowledge Base"])
         }
         
     except Exception as e:
@@ -6325,6 +9055,75 @@ Guidelines:
             "sources": ["Gyan Sultanat"]
         }
 
+async def stream_gyan_guru_answer(request: GyanMindQuestionRequest, user_id: str, questions_remaining: int):
+    """
+    SSE body for a streamed answer: `token` events with incremental text,
+    then one `done` event (or an `error` event if the answer broke off).
+    The query is saved once the stream closes, even if the client went away
+    part-way through; the save and the upstream close are shielded from the
+    disconnect's cancellation.
+    """
+    query_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    parts = []
+    confidence = 0.92
+    sources = GYAN_GURU_SOURCES.get(request.subject, ["Gyan Sultanat Knowledge Base"])
+    completed = False
+    
+    try:
+        try:
+            async with aclosing(llm_gateway.stream(
+                gyan_guru_cache_key(request.subject, request.question, request.language),
+                GYAN_GURU_MODEL,
+                gyan_guru_messages(request.subject, request.question, request.language),
+                max_tokens=500,
+                temperature=0.7
+            )) as tokens:
+                async for text in tokens:
+                    parts.append(text)
+                    yield f"event: token\ndata: {json.dumps({'delta': text})}\n\n"
+        except Exception as e:
+            logging.error(f"Gyan Mind Trigger LLM stream error: {str(e)}")
+            if parts:
+                yield f"event: error\ndata: {json.dumps({'message': 'Answer interrupted, please try again'})}\n\n"
+                return
+            else:
+                # Same fallback as the non-streaming path
+                fallback = f"Main aapke sawaal '{request.question}' ka jawab dhundh raha hoon. Kripya thodi der baad dobara try karein ya apna sawaal alag tarike se poochhein."
+                parts.append(fallback)
+                confidence = 0.5
+                sources = ["Gyan Sultanat"]
+                yield f"event: token\ndata: {json.dumps({'delta': fallback})}\n\n"
+        completed = True
+        
+        yield "event: done\ndata: " + json.dumps({
+            "success": True,
+            "query_id": query_id,
+            "confidence_score": confidence,
+            "sources": sources,
+            "subject": request.subject,
+            "questions_remaining": questions_remaining,
+            "trust_features": GYAN_MIND_CONFIG["trust_building_features"]
+        }) + "\n\n"
+    finally:
+        if parts:
+            with anyio.CancelScope(shield=True):
+                await db.gyan_guru_queries.insert_one({
+                    "query_id": query_id,
+                    "user_id": user_id,
+                    "subject": request.subject,
+                    "question": request.question,
+                    "answer": "".join(parts),
+                    "confidence_score": confidence,
+                    "sources": sources,
+                    "language": request.language,
+                    "helpful_votes": 0,
+                    "streamed": True,
+                    "completed": completed,
+                    "created_at": now,
+                    "answered_at": datetime.now(timezone.utc)
+                })
+
 def generate_gyan_guru_response(subject: str, question: str, language: str) -> dict:
     """Sync wrapper - will be called from async context"""
     # This is kept for backward compatibility
@@ -7342,18 +10141,11 @@ async def download_charity_thank_you_pdf(user_id: str, amount: float = 0.0):
 @api_router.get("/finance/live-charity-counter")
 async def get_live_charity_counter():
     """Get the live charity counter total"""
-    # Aggregate all charity contributions
-    pipeline = [
-        {"$match": {"transaction_type": "charity_contribution", "status": "completed"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    
-    result = await db.wallet_transactions.aggregate(pipeline).to_list(1)
-    total = result[0]["total"] if result else 0.0
+    total = await live_counters.get("charity_collected")
     
     # Get recent contributions
-    recent = await db.wallet_transactions.find(
-        {"transaction_type": "charity_contribution", "status": "completed"}
+    recent = await db.charity_contributions.find(
+        {}, {"_id": 0, "amount": 1, "created_at": 1}
     ).sort("created_at", -1).limit(10).to_list(10)
     
     return {
@@ -7398,12 +10190,7 @@ async def get_sultan_financial_dashboard():
     total_revenue = total_result[0]["total"] if total_result else 0.0
     
     # Charity total
-    charity_pipeline = [
-        {"$match": {"transaction_type": "charity_contribution", "status": "completed"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    charity_result = await db.wallet_transactions.aggregate(charity_pipeline).to_list(1)
-    total_charity = charity_result[0]["total"] if charity_result else 0.0
+    total_charity = await live_counters.get("charity_collected")
     
     # User counts
     total_users = await db.users.count_documents({})
@@ -7476,6 +10263,10 @@ async def get_transaction_audit(transaction_id: str):
 # Owner: Arif Ullah (Sultan)
 # Payoneer Customer ID: 35953271
 
+register_index("payments", [("payment_id", 1)])
+register_index("payments", [("status", 1), ("created_at", -1)])
+register_index("payments", [("user_id", 1), ("created_at", -1)])
+
 class PaymentMethod(str, Enum):
     UPI = "upi"
     CARD = "card"
@@ -7640,8 +10431,8 @@ async def verify_payment(request: PaymentVerifyRequest):
     
     # In test mode, auto-verify the payment
     if PAYMENT_CONFIG["test_mode"]:
-        await db.payments.update_one(
-            {"payment_id": request.payment_id},
+        result = await db.payments.update_one(
+            {"payment_id": request.payment_id, "status": {"$ne": PaymentStatus.SUCCESS.value}},
             {"$set": {
                 "status": PaymentStatus.SUCCESS.value,
                 "transaction_id": request.transaction_id,
@@ -7649,6 +10440,8 @@ async def verify_payment(request: PaymentVerifyRequest):
                 "updated_at": datetime.now(timezone.utc)
             }}
         )
+        if result.modified_count:
+            await record_payment_success(payment["amount"], payment["created_at"])
         
         # Add to user's wallet
         user = await db.users.find_one({"user_id": payment["user_id"]})
@@ -8523,6 +11316,224 @@ async def get_release_info():
         }
     }
 
+# ==================== PAYMENTS ROLLUP ====================
+
+# One document per (bucket, period) with the amount and count of successful
+# payments: bucket "hour" ("2025-01-31T14"), "day" ("2025-01-31"), "month"
+# ("2025-01") and "all". Every success $incs all four, so the dashboards
+# read a handful of small documents instead of the payments collection.
+PAYMENT_ROLLUP_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d", "month": "%Y-%m"}
+
+register_index("payments_rollup", [("bucket", 1), ("period", 1)], unique=True)
+
+def payment_rollup_periods(at: datetime) -> dict:
+    return {**{bucket: at.strftime(fmt) for bucket, fmt in PAYMENT_ROLLUP_FORMATS.items()}, "all": "all"}
+
+async def record_payment_success(amount: float, at: datetime):
+    """Add one successful payment to its hour/day/month buckets and the all-time total"""
+    now = datetime.now(timezone.utc)
+    await db.payments_rollup.bulk_write([
+        UpdateOne(
+            {"bucket": bucket, "period": period},
+            {"$inc": {"amount": amount, "count": 1}, "$set": {"updated_at": now}},
+            upsert=True
+        )
+        for bucket, period in payment_rollup_periods(at).items()
+    ], ordered=False)
+    live_counters.add("total_income", amount)
+
+async def read_payment_rollups(periods: dict) -> dict:
+    """Fetch {bucket: [periods]} in one query; returns {(bucket, period): doc}, missing buckets omitted"""
+    docs = await db.payments_rollup.find(
+        {"$or": [{"bucket": bucket, "period": {"$in": list(keys)}} for bucket, keys in periods.items()]},
+        {"_id": 0}
+    ).to_list(None)
+    return {(doc["bucket"], doc["period"]): doc for doc in docs}
+
+async def rebuild_payment_rollups(before: Optional[datetime] = None):
+    """Recompute the rollups with a single $dateTrunc aggregation, up to the `before` watermark"""
+    buckets: dict = {}
+    match = {"status": PaymentStatus.SUCCESS.value}
+    if before:
+        # Writers count a payment when it succeeds, so split on verified_at
+        match["$or"] = [
+            {"verified_at": {"$lt": before}},
+            {"verified_at": {"$exists": False}, "created_at": {"$lt": before}}
+        ]
+    hours = db.payments.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$created_at", "unit": "hour"}},
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1}
+        }}
+    ])
+    async for row in hours:
+        for key in payment_rollup_periods(row["_id"]).items():
+            bucket = buckets.setdefault(key, {"amount": 0, "count": 0})
+            bucket["amount"] += row["amount"]
+            bucket["count"] += row["count"]
+    
+    return await write_rollup_totals("payments_rollup", ("bucket", "period"), buckets, before)
+
+# ==================== LIVE COUNTERS ====================
+
+LIVE_COUNTER_PUSH_INTERVAL_MS = int(os.environ.get("LIVE_COUNTER_PUSH_INTERVAL_MS", "1000"))
+LIVE_COUNTER_RESYNC_SECONDS = float(os.environ.get("LIVE_COUNTER_RESYNC_SECONDS", "15"))
+LIVE_COUNTER_KEEPALIVE_SECONDS = float(os.environ.get("LIVE_COUNTER_KEEPALIVE_SECONDS", "15"))
+
+class LiveCounterHub:
+    """
+    In-process aggregator behind the live dashboard counters.
+    
+    Each counter registers a loader that computes it from the database.
+    Loaders run once on first use and then every resync interval (to pick
+    up writes made by other worker processes); in between, write paths
+    apply deltas with add(). Polling endpoints read the in-memory value and
+    SSE subscribers get the counters that changed, coalesced to at most one
+    push per interval, so N dashboards cost one computation, not N.
+    """
+
+    def __init__(self, push_interval_ms: int, resync_seconds: float):
+        self.push_interval = push_interval_ms / 1000
+        self.resync_seconds = resync_seconds
+        self._loaders: dict = {}
+        self.values: dict = {}
+        self._published: dict = {}
+        self._subscribers: set = set()
+        self._last_resync = 0.0
+        self._worker: Optional[asyncio.Task] = None
+
+    def counter(self, name: str):
+        def decorator(loader):
+            self._loaders[name] = loader
+            return loader
+        return decorator
+
+    def add(self, name: str, delta: float):
+        if name in self.values:
+            self.values[name] += delta
+
+    async def get(self, name: str) -> float:
+        if name not in self.values:
+            self.values[name] = await self._loaders[name]()
+        return self.values[name]
+
+    async def snapshot(self) -> dict:
+        return {name: await self.get(name) for name in self._loaders}
+
+    async def resync(self):
+        for name, loader in self._loaders.items():
+            try:
+                self.values[name] = await loader()
+            except Exception as e:
+                logger.error(f"Live counter {name} resync failed: {e}")
+        self._last_resync = time.monotonic()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self):
+        changed = {
+            name: value for name, value in self.values.items()
+            if self._published.get(name) != value
+        }
+        if not changed:
+            return
+        event = {
+            "counters": changed,
+            "deltas": {name: value - self._published.get(name, 0) for name, value in changed.items()},
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+        self._published.update(changed)
+        for queue in self._subscribers:
+            if queue.full():
+                # Slow consumer: drop its oldest event, the next one carries current totals
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            if time.monotonic() - self._last_resync >= self.resync_seconds:
+                await self.resync()
+            self._publish()
+            await asyncio.sleep(self.push_interval)
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+live_counters = LiveCounterHub(LIVE_COUNTER_PUSH_INTERVAL_MS, LIVE_COUNTER_RESYNC_SECONDS)
+
+@live_counters.counter("total_income")
+async def load_total_income() -> float:
+    rollups = await read_payment_rollups({"all": ["all"]})
+    return rollups.get(("all", "all"), {}).get("amount", 0)
+
+@live_counters.counter("total_users")
+async def load_total_users() -> float:
+    return await db.users.estimated_document_count()
+
+@live_counters.counter("charity_collected")
+async def load_charity_collected() -> float:
+    return (await read_charity_totals())["total"]
+
+@live_counters.counter("company_revenue")
+async def load_company_revenue() -> float:
+    stats = await db.company_stats.find_one({"type": "revenue"}, {"_id": 0, "total_revenue": 1})
+    return (stats or {}).get("total_revenue", 0)
+
+@live_counters.counter("company_charity_contributed")
+async def load_company_charity_contributed() -> float:
+    stats = await db.company_stats.find_one({"type": "revenue"}, {"_id": 0, "total_charity_contributed": 1})
+    return (stats or {}).get("total_charity_contributed", 0)
+
+@api_router.get("/live/counters")
+async def get_live_counters(current_user: User = Depends(get_current_user)):
+    """Current value of every live dashboard counter"""
+    return {"counters": await live_counters.snapshot(), "timestamp": datetime.now(timezone.utc).isoformat()}
+
+@api_router.get("/live/counters/stream")
+async def stream_live_counters(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Server-sent events: one `snapshot` event with every counter, then a
+    `delta` event whenever counters change (at most once per push interval)
+    """
+    async def events():
+        queue = live_counters.subscribe()
+        try:
+            snapshot = {"counters": await live_counters.snapshot(), "timestamp": datetime.now(timezone.utc).isoformat()}
+            yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=LIVE_COUNTER_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: delta\ndata: {json.dumps(event)}\n\n"
+        finally:
+            live_counters.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ==================== SULTAN'S INCOME TRACKER ====================
 
 @api_router.get("/sultan/income-tracker")
@@ -8533,37 +11544,20 @@ async def get_sultan_income_tracker():
     """
     now = datetime.now(timezone.utc)
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # Get today's payments
-    today_payments = await db.payments.find({
-        "created_at": {"$gte": today_start},
-        "status": "success"
-    }).to_list(1000)
-    
-    today_income = sum(p.get("amount", 0) for p in today_payments)
-    today_count = len(today_payments)
-    
-    # Get this week's data
     week_start = today_start - timedelta(days=today_start.weekday())
-    week_payments = await db.payments.find({
-        "created_at": {"$gte": week_start},
-        "status": "success"
-    }).to_list(5000)
-    
-    week_income = sum(p.get("amount", 0) for p in week_payments)
     
-    # Get this month's data
-    month_start = today_start.replace(day=1)
-    month_payments = await db.payments.find({
-        "created_at": {"$gte": month_start},
-        "status": "success"
-    }).to_list(10000)
+    # Today, this week, this month and all time from the payment rollups
+    today_key = now.strftime("%Y-%m-%d")
+    month_key = now.strftime("%Y-%m")
+    week_days = [(week_start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(today_start.weekday() + 1)]
+    rollups = await read_payment_rollups({"day": week_days, "month": [month_key], "all": ["all"]})
     
-    month_income = sum(p.get("amount", 0) for p in month_payments)
-    
-    # Get all time data
-    all_payments = await db.payments.find({"status": "success"}).to_list(50000)
-    total_income = sum(p.get("amount", 0) for p in all_payments)
+    today_rollup = rollups.get(("day", today_key), {})
+    today_income = today_rollup.get("amount", 0)
+    today_count = today_rollup.get("count", 0)
+    week_income = sum(rollups.get(("day", day), {}).get("amount", 0) for day in week_days)
+    month_income = rollups.get(("month", month_key), {}).get("amount", 0)
+    total_income = rollups.get(("all", "all"), {}).get("amount", 0)
     
     # User statistics
     total_users = await db.users.count_documents({})
@@ -8649,29 +11643,23 @@ async def get_sultan_daily_report():
     now = datetime.now(timezone.utc)
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     
-    # Get hourly breakdown
+    # Get hourly breakdown of completed hours from the hour rollups
+    hours = [today_start + timedelta(hours=hour) for hour in range(now.hour)]
+    hour_keys = [h.strftime(PAYMENT_ROLLUP_FORMATS["hour"]) for h in hours]
+    rollups = await read_payment_rollups({"hour": hour_keys}) if hour_keys else {}
+    
     hourly_data = []
-    for hour in range(24):
-        hour_start = today_start + timedelta(hours=hour)
-        hour_end = hour_start + timedelta(hours=1)
-        
-        if hour_end > now:
-            break
-            
-        payments = await db.payments.find({
-            "created_at": {"$gte": hour_start, "$lt": hour_end},
-            "status": "success"
-        }).to_list(1000)
-        
-        hour_income = sum(p.get("amount", 0) for p in payments)
+    total_today = 0
+    for hour_start, key in zip(hours, hour_keys):
+        rollup = rollups.get(("hour", key), {})
+        hour_income = rollup.get("amount", 0)
+        total_today += hour_income
         hourly_data.append({
-            "hour": f"{hour:02d}:00",
+            "hour": f"{hour_start.hour:02d}:00",
             "income": f"₹{hour_income:,.2f}",
-            "transactions": len(payments)
+            "transactions": rollup.get("count", 0)
         })
     
-    total_today = sum(float(h["income"].replace("₹", "").replace(",", "")) for h in hourly_data)
-    
     return {
         "success": True,
         "report_title": "📊 SULTAN'S DAILY REPORT",
@@ -8696,9 +11684,8 @@ async def get_sultan_live_counter():
     now = datetime.now(timezone.utc)
     
     # All time income
-    all_payments = await db.payments.find({"status": "success"}).to_list(50000)
-    total_income = sum(p.get("amount", 0) for p in all_payments)
-    total_users = await db.users.count_documents({})
+    total_income = await live_counters.get("total_income")
+    total_users = await live_counters.get("total_users")
     
     # Calculate net
     net_to_sultan = total_income * 0.38  # After all deductions
@@ -8766,6 +11753,7 @@ async def test_sultan_payment():
     }
     
     await db.payments.insert_one(test_payment)
+    await record_payment_success(test_payment["amount"], now)
     
     return {
         "success": True,
@@ -8862,6 +11850,7 @@ async def free_user_registration(name: str, email: str, phone: str = None):
     }
     
     await db.users.insert_one(new_user)
+    live_counters.add("total_users", 1)
     
     return {
         "success": True,
@@ -9097,12 +12086,7 @@ async def get_charity_mission():
     now = datetime.now(timezone.utc)
     
     # Get total charity collected
-    charity_pipeline = [
-        {"$match": {"transaction_type": "charity_contribution", "status": "completed"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    result = await db.wallet_transactions.aggregate(charity_pipeline).to_list(1)
-    total_charity = result[0]["total"] if result else 0.0
+    total_charity = await live_counters.get("charity_collected")
     
     return {
         "success": True,
@@ -9221,16 +12205,9 @@ async def get_sultan_pulse():
     """
     now = datetime.now(timezone.utc)
     
-    # Calculate live charity stats
-    charity_pipeline = [
-        {"$match": {"transaction_type": "charity_contribution", "status": "completed"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    result = await db.wallet_transactions.aggregate(charity_pipeline).to_list(1)
-    total_charity = result[0]["total"] if result else 0.0
-    
-    # Calculate total users
-    total_users = await db.users.count_documents({})
+    # Live charity stats and user count from the in-process counters
+    total_charity = await live_counters.get("charity_collected")
+    total_users = await live_counters.get("total_users")
     
     return {
         "success": True,
@@ -9417,12 +12394,7 @@ async def get_banking_report():
     now = datetime.now(timezone.utc)
     
     # Get charity stats
-    charity_pipeline = [
-        {"$match": {"transaction_type": "charity_contribution", "status": "completed"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    result = await db.wallet_transactions.aggregate(charity_pipeline).to_list(1)
-    total_charity = result[0]["total"] if result else 0.0
+    total_charity = await live_counters.get("charity_collected")
     
     total_users = await db.users.count_documents({})
     total_transactions = await db.wallet_transactions.count_documents({})
@@ -13758,6 +16730,29 @@ async def get_country_compliance(country_code: str):
         "guarantee": f"All data of {country['country_name']} users is stored in {country['server_location']} and follows local laws."
     }
 
+# ==================== DATA MIGRATIONS ====================
+
+# Backfills for the summary and rollup collections that writers maintain
+# incrementally, up to the live_rollups_since() watermark. They run in the
+# background once the workers are serving, each through run_migration() so
+# one worker runs it; the job keeps retrying failed ones and picks up ones
+# whose worker died. The --rebuild-* flags still do full rebuilds by hand.
+DATA_MIGRATION_INTERVAL_SECONDS = float(os.environ.get("DATA_MIGRATION_INTERVAL_SECONDS", "300"))
+
+DATA_MIGRATIONS = [
+    ("ledger_summary", rebuild_ledger_summary),
+    ("live_leaderboards", rebuild_live_leaderboards),
+    ("charity_sources", rebuild_charity_sources),
+    ("payment_rollups", rebuild_payment_rollups)
+]
+
+async def run_data_migrations():
+    before = await live_rollups_since()
+    for name, migration in DATA_MIGRATIONS:
+        await run_migration(name, functools.partial(migration, before=before))
+
+data_migrations_job = PeriodicJob("Data migrations", DATA_MIGRATION_INTERVAL_SECONDS, run_data_migrations)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -13769,6 +16764,133 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_workers():
+    await ensure_indexes()
+    # Before serving, so writes from here on are counted live and not backfilled
+    await live_rollups_since()
+    data_migrations_job.start()
+    notification_queue.start()
+    leaderboard_engine.start()
+    leaderboard_settlement_job.start()
+    live_counters.start()
+    activity_heartbeats.start()
+    missions_engine.start()
+    period_rollover_job.start()
+    host_sessions_engine.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await data_migrations_job.stop()
+    await host_sessions_engine.stop()
+    await period_rollover_job.stop()
+    await missions_engine.drain()
+    await activity_heartbeats.drain()
+    await live_counters.stop()
+    await leaderboard_settlement_job.stop()
+    await leaderboard_engine.stop()
+    await notification_queue.drain()
     client.close()
+
+# ==================== INDEX USAGE REPORT (CLI) ====================
+
+def route_collections(endpoint) -> List[str]:
+    """Collections an endpoint touches, read from its source"""
+    try:
+        source = inspect.getsource(endpoint)
+    except (OSError, TypeError):
+        return []
+    names = re.findall(r"\bdb\.(\w+)\.", source)
+    names += re.findall(r"(?:\bdb\[|posting\.(?:insert|update)\()\"(\w+)\"", source)
+    for board in re.findall(r"leaderboard_engine\.serve\(\"(\w+)\"", source):
+        names += route_collections(leaderboard_engine._builders[board][0])
+    return sorted(set(names))
+
+async def index_report() -> List[dict]:
+    """
+    Registered indexes and their $indexStats usage, listed per API route.
+    
+    `missing` marks a registered index the database does not have (None
+    when the collection's stats could not be read).
+    """
+    usage = {}
+    readable = set()
+    for collection in sorted({spec["collection"] for spec in INDEX_REGISTRY}):
+        try:
+            stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+            readable.add(collection)
+        except Exception:
+            stats = []
+        for stat in stats:
+            usage[(collection, stat["name"])] = stat.get("accesses", {}).get("ops", 0)
+    
+    report = []
+    for route in app.routes:
+        endpoint = getattr(route, "endpoint", None)
+        if not endpoint or not getattr(route, "methods", None):
+            continue
+        collections = route_collections(endpoint)
+        report.append({
+            "path": route.path,
+            "methods": sorted(route.methods),
+            "collections": [
+                {
+                    "collection": collection,
+                    "indexes": [
+                        {
+                            "name": spec["options"]["name"],
+                            "unique": bool(spec["options"].get("unique")),
+                            "ops": usage.get((collection, spec["options"]["name"])),
+                            "missing": (
+                                (collection, spec["options"]["name"]) not in usage
+                                if collection in readable else None
+                            )
+                        }
+                        for spec in INDEX_REGISTRY if spec["collection"] == collection
+                    ]
+                }
+                for collection in collections
+            ]
+        })
+    return report
+
+def print_index_report():
+    report = asyncio.run(index_report())
+    for route in report:
+        print(f"{','.join(route['methods']):<8} {route['path']}")
+        for entry in route["collections"]:
+            if not entry["indexes"]:
+                print(f"    {entry['collection']}: NO REGISTERED INDEX")
+            for index in entry["indexes"]:
+                if index["missing"]:
+                    unique = " (UNIQUE)" if index["unique"] else ""
+                    print(f"    {entry['collection']}.{index['name']}: MISSING{unique}")
+                    continue
+                ops = "n/a" if index["ops"] is None else index["ops"]
+                print(f"    {entry['collection']}.{index['name']}: {ops} ops")
+
+if __name__ == "__main__" and "--index-report" in sys.argv:
+    print_index_report()
+
+if __name__ == "__main__" and "--rebuild-ledger-summary" in sys.argv:
+    print(f"Rebuilt {asyncio.run(rebuild_ledger_summary())} ledger summary documents")
+
+if __name__ == "__main__" and "--rebuild-live-leaderboards" in sys.argv:
+    print(f"Rebuilt {asyncio.run(rebuild_live_leaderboards())} live leaderboard rows")
+
+if __name__ == "__main__" and "--merge-duplicate-activity-sessions" in sys.argv:
+    print(f"Merged {asyncio.run(merge_duplicate_activity_sessions())} duplicate activity sessions")
+
+if __name__ == "__main__" and "--rebuild-charity-sources" in sys.argv:
+    print(f"Charity source corrections: {asyncio.run(rebuild_charity_sources())}")
+
+if __name__ == "__main__" and "--rebuild-payment-rollups" in sys.argv:
+    print(f"Rebuilt {asyncio.run(rebuild_payment_rollups())} payment rollup documents")
+
+if __name__ == "__main__" and "--rollover-periods" in sys.argv:
+    tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%d")
+    print(asyncio.run(rollover_periods(tomorrow)))
+
+if __name__ == "__main__" and "--settle-leaderboards" in sys.argv:
+    for result in asyncio.run(settle_leaderboards()):
+        print(result)
@@ -0,0 +1,32 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import mongomock.collection
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# server.py connects lazily, so importing it needs only the settings
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# pymongo passes sort= to bulk UpdateOne, which mongomock does not accept yet
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+mongomock.collection.BulkOperationBuilder.add_update = (
+    lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A fresh in-memory database with every registered index, installed as server.db"""
+    import server
+
+    database = AsyncMongoMockClient()["test_database"]
+    monkeypatch.setattr(server, "db", database)
+    # mongomock has no sessions, so postings run in no-transaction mode
+    monkeypatch.setattr(server, "LEDGER_TRANSACTIONS", "off")
+    asyncio.run(server.ensure_indexes())
+    return database
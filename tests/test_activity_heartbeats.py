@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime, timezone
+
+import server
+from server import ActivityHeartbeatBuffer
+
+DATE = "2026-10-17"
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+
+async def minutes(db, user_id):
+    session = await db.activity_sessions.find_one({"user_id": user_id, "date": DATE})
+    return session["total_active_minutes"]
+
+
+def test_beats_inside_the_min_interval_count_once(db):
+    buffer = ActivityHeartbeatBuffer(5)
+
+    async def scenario():
+        results = [await buffer.beat("u1", DATE, NOW) for _ in range(3)]
+        await buffer.flush()
+        return results, await minutes(db, "u1")
+
+    results, stored = asyncio.run(scenario())
+    assert [r["total_active_minutes"] for r in results] == [1, 1, 1]
+    assert stored == 1
+
+
+def test_flush_writes_every_user_in_one_bulk_write(db, monkeypatch):
+    monkeypatch.setattr(server, "HEARTBEAT_MIN_INTERVAL_SECONDS", 0)
+    buffer = ActivityHeartbeatBuffer(5)
+    writes = []
+    bulk_write = type(db.activity_sessions).bulk_write
+
+    async def counting_bulk_write(self, requests, **kwargs):
+        writes.append(len(requests))
+        return await bulk_write(self, requests, **kwargs)
+
+    monkeypatch.setattr(type(db.activity_sessions), "bulk_write", counting_bulk_write)
+
+    async def scenario():
+        for user_id in ("u1", "u2"):
+            for _ in range(3):
+                await buffer.beat(user_id, DATE, NOW)
+        await buffer.flush()
+        # Nothing pending, so a second flush writes nothing
+        await buffer.flush()
+        answer = await buffer.beat("u1", DATE, NOW)
+        return answer, await minutes(db, "u1"), await minutes(db, "u2")
+
+    answer, u1, u2 = asyncio.run(scenario())
+    assert writes == [2]
+    assert (u1, u2) == (3, 3)
+    assert answer["total_active_minutes"] == 4
+
+
+def test_flush_user_persists_one_user(db, monkeypatch):
+    monkeypatch.setattr(server, "HEARTBEAT_MIN_INTERVAL_SECONDS", 0)
+    buffer = ActivityHeartbeatBuffer(5)
+
+    async def scenario():
+        await buffer.beat("u1", DATE, NOW)
+        await buffer.beat("u2", DATE, NOW)
+        await buffer.flush_user("u1", DATE)
+        return await minutes(db, "u1"), await minutes(db, "u2")
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+
+def test_failed_flush_keeps_minutes_pending(db, monkeypatch):
+    buffer = ActivityHeartbeatBuffer(5)
+    bulk_write = type(db.activity_sessions).bulk_write
+
+    async def scenario():
+        await buffer.beat("u1", DATE, NOW)
+
+        async def broken_bulk_write(self, requests, **kwargs):
+            raise server.PyMongoError("primary stepped down")
+
+        monkeypatch.setattr(type(db.activity_sessions), "bulk_write", broken_bulk_write)
+        await buffer.flush()
+        monkeypatch.setattr(type(db.activity_sessions), "bulk_write", bulk_write)
+        await buffer.flush()
+        return await minutes(db, "u1")
+
+    assert asyncio.run(scenario()) == 1
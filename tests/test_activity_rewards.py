@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import claim_activity_reward
+
+USER = SimpleNamespace(user_id="u1")
+
+
+@pytest.fixture
+def activity(db, monkeypatch):
+    monkeypatch.setattr(server, "notification_queue", server.NotificationQueue(250, 500, 1000))
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    asyncio.run(db.wallets.insert_one({"user_id": "u1", "coins_balance": 0}))
+    asyncio.run(db.activity_sessions.insert_one({
+        "user_id": "u1", "date": today, "total_active_minutes": 30, "rewards_claimed": 0
+    }))
+
+    async def state():
+        session = await db.activity_sessions.find_one({"user_id": "u1", "date": today})
+        wallet = await db.wallets.find_one({"user_id": "u1"})
+        return session["rewards_claimed"], wallet["coins_balance"]
+
+    return state
+
+
+def test_claim_pays_and_counts_one_reward(activity):
+    async def scenario():
+        result = await claim_activity_reward(current_user=USER)
+        return result, await activity()
+
+    result, state = asyncio.run(scenario())
+    assert result["reward_amount"] == 250
+    assert state == (1, 250)
+
+
+def test_failed_credit_gives_the_claim_back(activity, monkeypatch):
+    async def broken_debit_wallet(*args, **kwargs):
+        raise server.PyMongoError("primary stepped down")
+
+    monkeypatch.setattr(server, "debit_wallet", broken_debit_wallet)
+
+    async def scenario():
+        with pytest.raises(server.PyMongoError):
+            await claim_activity_reward(current_user=USER)
+        return await activity()
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+
+def test_failed_flush_reverses_the_payout_and_the_claim(activity, db, monkeypatch):
+    collection_type = type(db.wallet_transactions)
+    insert_many = collection_type.insert_many
+
+    async def broken_insert_many(self, *args, **kwargs):
+        if self.name == "wallet_transactions":
+            raise server.PyMongoError("primary stepped down")
+        return await insert_many(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "insert_many", broken_insert_many)
+
+    async def scenario():
+        with pytest.raises(server.PyMongoError):
+            await claim_activity_reward(current_user=USER)
+        return await activity(), await db.ledger_posting_failures.find_one()
+
+    state, failure = asyncio.run(scenario())
+    assert state == (0, 0)
+    assert failure["undone"] is True
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+from server import record_leaderboard_score, run_data_migrations
+
+WATERMARK = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+
+def test_data_migrations_run_once_and_retry_failures(db, monkeypatch):
+    runs = []
+
+    async def backfill(before):
+        runs.append("backfill")
+        return 3
+
+    async def broken(before):
+        runs.append("broken")
+        raise RuntimeError("aggregation failed")
+
+    monkeypatch.setattr(server, "DATA_MIGRATIONS", [("backfill", backfill), ("broken", broken)])
+
+    async def scenario():
+        await run_data_migrations()
+        await run_data_migrations()
+        return {
+            record["name"]: record["status"]
+            async for record in db.data_migrations.find({"name": {"$ne": "live_rollups"}})
+        }
+
+    assert asyncio.run(scenario()) == {"backfill": "done", "broken": "failed"}
+    assert runs == ["backfill", "broken", "broken"]
+
+
+def test_watermark_is_recorded_once(db):
+    async def scenario():
+        first = await server.live_rollups_since()
+        await asyncio.sleep(0.01)
+        return first, await server.live_rollups_since()
+
+    first, second = asyncio.run(scenario())
+    assert first == second
+
+
+def test_backfill_adds_history_to_live_counts_once(db):
+    async def scenario():
+        await db.gift_records.insert_many([
+            {"sender_id": "u1", "receiver_id": "u2", "total_value": 10, "created_at": WATERMARK - timedelta(days=3)},
+            {"sender_id": "u1", "receiver_id": "u2", "total_value": 5, "created_at": WATERMARK - timedelta(hours=1)},
+            # Written after the watermark: the live writer below already counted it
+            {"sender_id": "u1", "receiver_id": "u2", "total_value": 7, "created_at": WATERMARK + timedelta(hours=1)}
+        ])
+        await record_leaderboard_score("gifts_sent", "u1", 7)
+        await server.rebuild_live_leaderboards(before=WATERMARK)
+        # A retried run after a crash must not add the history twice
+        await server.rebuild_live_leaderboards(before=WATERMARK)
+        return await db.leaderboard_scores.find_one({"board": "gifts_sent", "window": "all", "user_id": "u1"})
+
+    row = asyncio.run(scenario())
+    assert row["score"] == 22
+    assert row["events"] == 3
+
+
+def test_charity_source_backfill_is_seeded_once(db):
+    async def scenario():
+        await db.charity_contributions.insert_many([
+            {"user_id": "u1", "source": "gift", "amount": 4, "created_at": WATERMARK - timedelta(days=1)},
+            {"user_id": "u1", "source": "gift", "amount": 9, "created_at": WATERMARK + timedelta(days=1)}
+        ])
+        await server.charity_wallet_counter.increment({"source_gift": 9})
+        await server.rebuild_charity_sources(before=WATERMARK)
+        await server.rebuild_charity_sources(before=WATERMARK)
+        return await server.charity_wallet_counter.read(use_cache=False)
+
+    assert asyncio.run(scenario())["source_gift"] == 13
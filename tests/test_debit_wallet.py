@@ -0,0 +1,41 @@
+import asyncio
+
+from server import debit_wallet
+
+
+def run(db, *debits):
+    async def scenario():
+        await db.wallets.insert_one({"user_id": "u1", "coins_balance": 100, "stars_balance": 10})
+        results = await asyncio.gather(*[debit_wallet("u1", **debit) for debit in debits])
+        return results, await db.wallets.find_one({"user_id": "u1"}, {"_id": 0, "updated_at": 0})
+    return asyncio.run(scenario())
+
+
+def test_debit_and_credit_apply_in_one_update(db):
+    (wallet,), stored = run(db, {"debits": {"coins_balance": 40}, "credits": {"stars_balance": 4}})
+    assert (wallet["coins_balance"], wallet["stars_balance"]) == (60, 14)
+    assert stored == {"user_id": "u1", "coins_balance": 60, "stars_balance": 14}
+
+
+def test_insufficient_balance_changes_nothing(db):
+    (wallet,), stored = run(db, {"debits": {"coins_balance": 101}, "credits": {"stars_balance": 4}})
+    assert wallet is None
+    assert stored == {"user_id": "u1", "coins_balance": 100, "stars_balance": 10}
+
+
+def test_minimum_floor_is_enforced(db):
+    (wallet,), _ = run(db, {"debits": {"coins_balance": 10}, "minimums": {"coins_balance": 500}})
+    assert wallet is None
+
+
+def test_concurrent_spends_never_overdraw(db):
+    results, stored = run(db, *[{"debits": {"coins_balance": 30}} for _ in range(5)])
+    assert sum(result is None for result in results) >= 2
+    assert stored["coins_balance"] == 10
+
+
+def test_missing_wallet_is_not_created(db):
+    async def scenario():
+        return await debit_wallet("nobody", {}, {"coins_balance": 5}), await db.wallets.count_documents({})
+
+    assert asyncio.run(scenario()) == (None, 0)
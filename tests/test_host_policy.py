@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from server import (
+    HOST_POLICY_CONFIG,
+    host_min_minutes,
+    host_reward_rates,
+    host_session_stars,
+    host_welcome_status,
+)
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("minutes, welcome, stars", [
+    (59, True, 0),
+    (60, True, 2000),
+    (119, True, 2000),
+    (150, True, 4000),
+    (59, False, 0),
+    (60, False, 1000),
+    (185, False, 3000),
+])
+def test_video_stars(minutes, welcome, stars):
+    assert host_session_stars("video", minutes, welcome) == stars
+
+
+@pytest.mark.parametrize("minutes, stars", [
+    (119, 0),
+    (120, 3000),
+    (239, 3000),
+    (240, 6000),
+])
+def test_welcome_audio_pays_per_two_hour_block(minutes, stars):
+    assert host_session_stars("audio", minutes, True) == stars
+
+
+@pytest.mark.parametrize("minutes, stars", [
+    (30, 0),
+    (60, 500),
+    (90, 500),
+    (180, 1500),
+])
+def test_normal_audio_has_no_minimum(minutes, stars):
+    assert host_session_stars("audio", minutes, False) == stars
+
+
+def test_unknown_host_type_earns_nothing():
+    assert host_session_stars("radio", 600, True) == 0
+
+
+def test_stars_follow_config():
+    config = {**HOST_POLICY_CONFIG, "normal_video_reward_per_hour": 10, "min_video_minutes": 30}
+    assert host_session_stars("video", 45, False, config) == 0
+    assert host_session_stars("video", 120, False, config) == 20
+
+
+def test_reward_rates():
+    assert host_reward_rates(True) == {"video_per_hour": 2000, "audio_per_2hours": 3000}
+    assert host_reward_rates(False) == {"video_per_hour": 1000, "audio_per_2hours": 1000}
+
+
+def test_min_minutes():
+    assert host_min_minutes("video") == 60
+    assert host_min_minutes("audio") == 120
+
+
+def test_welcome_period_lasts_seven_days():
+    assert host_welcome_status(NOW - timedelta(days=6, hours=23), NOW) == (6, True)
+    assert host_welcome_status(NOW - timedelta(days=7), NOW) == (7, False)
+
+
+def test_welcome_status_accepts_naive_timestamps():
+    registered_at = (NOW - timedelta(days=2)).replace(tzinfo=None)
+    assert host_welcome_status(registered_at, NOW) == (2, True)
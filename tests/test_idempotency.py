@@ -0,0 +1,129 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import idempotent
+
+USER = SimpleNamespace(user_id="u1")
+KEY = "gift:u1:key-1"
+
+
+@pytest.fixture
+def endpoint(db, monkeypatch):
+    monkeypatch.setattr(server, "_idempotency_cache", server.OrderedDict())
+    calls = []
+
+    @idempotent("gift")
+    async def send_gift(request, current_user, idempotency_key=None):
+        calls.append(request)
+        if request.get("fail"):
+            raise RuntimeError("wallet unavailable")
+        return {"sent": request["amount"], "call": len(calls)}
+
+    send_gift.calls = calls
+    return send_gift
+
+
+def call(endpoint, request, key="key-1"):
+    return endpoint(request=request, current_user=USER, idempotency_key=key)
+
+
+def test_retry_gets_the_stored_response(endpoint, db):
+    async def scenario():
+        first = await call(endpoint, {"amount": 5})
+        server._idempotency_cache.clear()
+        second = await call(endpoint, {"amount": 5})
+        return first, second, await db.idempotency_keys.find_one({"key": KEY})
+
+    first, second, stored = asyncio.run(scenario())
+    assert first == second == {"sent": 5, "call": 1}
+    assert len(endpoint.calls) == 1
+    assert stored["status"] == "completed"
+
+
+def test_without_key_every_call_runs(endpoint):
+    async def scenario():
+        await call(endpoint, {"amount": 5}, key=None)
+        await call(endpoint, {"amount": 5}, key=None)
+
+    asyncio.run(scenario())
+    assert len(endpoint.calls) == 2
+
+
+def test_key_reused_with_a_different_body_is_rejected(endpoint):
+    async def scenario():
+        await call(endpoint, {"amount": 5})
+        await call(endpoint, {"amount": 6})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 422
+
+
+def test_retry_while_first_is_pending_gets_409(endpoint, db):
+    async def scenario():
+        now = datetime.now(timezone.utc)
+        await db.idempotency_keys.insert_one({
+            "key": KEY,
+            "fingerprint": server.hashlib.sha256(b'{"amount": 5}').hexdigest(),
+            "status": "pending",
+            "created_at": now,
+            "expires_at": now + timedelta(hours=1)
+        })
+        await call(endpoint, {"amount": 5})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 409
+    assert endpoint.calls == []
+
+
+def test_failed_request_releases_the_key(endpoint, db):
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await call(endpoint, {"amount": 5, "fail": True})
+        released = await db.idempotency_keys.count_documents({"key": KEY})
+        return released, await call(endpoint, {"amount": 5})
+
+    released, retried = asyncio.run(scenario())
+    assert released == 0
+    assert retried["call"] == 2
+
+
+def test_failed_completion_write_still_answers_retries(endpoint, db, monkeypatch):
+    collection_type = type(db.idempotency_keys)
+    update_one = collection_type.update_one
+
+    async def broken_update(self, *args, **kwargs):
+        if self.name == "idempotency_keys":
+            raise server.PyMongoError("primary stepped down")
+        return await update_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(server, "IDEMPOTENCY_WRITE_ATTEMPTS", 1)
+    monkeypatch.setattr(collection_type, "update_one", broken_update)
+
+    async def scenario():
+        first = await call(endpoint, {"amount": 5})
+        second = await call(endpoint, {"amount": 5})
+        return first, second, await db.idempotency_keys.find_one({"key": KEY})
+
+    first, second, stored = asyncio.run(scenario())
+    assert stored["status"] == "pending"
+    assert first == second
+    assert len(endpoint.calls) == 1
+
+
+def test_cached_response_expires_with_its_key(endpoint, db):
+    async def scenario():
+        await call(endpoint, {"amount": 5})
+        fingerprint, response, _ = server._idempotency_cache[KEY]
+        server._idempotency_cache[KEY] = (fingerprint, response, datetime.now(timezone.utc) - timedelta(seconds=1))
+        # The TTL index would have removed the stored key by now as well
+        await db.idempotency_keys.delete_many({})
+        return await call(endpoint, {"amount": 5})
+
+    assert asyncio.run(scenario())["call"] == 2
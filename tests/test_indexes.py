@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from server import ensure_indexes, find_or_create
+
+
+@pytest.fixture
+def legacy_db(monkeypatch):
+    """A database that already holds data, before any index was built"""
+    database = AsyncMongoMockClient()["legacy_database"]
+    monkeypatch.setattr(server, "db", database)
+    # data_migrations claims need their unique index before the dedupes run
+    asyncio.run(database.data_migrations.create_index("name", unique=True))
+    return database
+
+
+def test_duplicates_are_folded_before_unique_indexes_build(legacy_db):
+    async def scenario():
+        await legacy_db.host_profiles.insert_many([
+            {"user_id": "u1", "level": "gold"},
+            {"user_id": "u1", "level": "new"},
+            {"user_id": "u2", "level": "new"}
+        ])
+        await legacy_db.activity_sessions.insert_many([
+            {"user_id": "u1", "date": "2026-10-17", "total_active_minutes": 30, "rewards_claimed": 1},
+            {"user_id": "u1", "date": "2026-10-17", "total_active_minutes": 20, "rewards_claimed": 0}
+        ])
+        await ensure_indexes()
+        profiles = await legacy_db.host_profiles.find({}, {"_id": 0}).to_list(None)
+        activity = await legacy_db.activity_sessions.find({}, {"_id": 0}).to_list(None)
+        return profiles, activity
+
+    profiles, activity = asyncio.run(scenario())
+    assert profiles == [{"user_id": "u1", "level": "gold"}, {"user_id": "u2", "level": "new"}]
+    assert len(activity) == 1
+    assert activity[0]["total_active_minutes"] == 50
+
+
+def test_only_the_newest_duplicate_active_host_session_stays_open(legacy_db):
+    # Called directly: mongomock builds partial unique indexes over every document
+    async def scenario():
+        await legacy_db.host_sessions.insert_many([
+            {"session_id": "s1", "user_id": "u1", "status": "active", "started_at": 1},
+            {"session_id": "s2", "user_id": "u1", "status": "active", "started_at": 2},
+            {"session_id": "s0", "user_id": "u1", "status": "completed", "started_at": 0}
+        ])
+        superseded = await server.supersede_duplicate_active_sessions("host_sessions", ["user_id"])
+        return superseded, {s["session_id"]: s["status"] async for s in legacy_db.host_sessions.find()}
+
+    superseded, sessions = asyncio.run(scenario())
+    assert superseded == 1
+    assert sessions == {"s1": "superseded", "s2": "active", "s0": "completed"}
+
+
+def test_duplicates_without_a_dedupe_stop_startup(legacy_db):
+    async def scenario():
+        await legacy_db.wallets.insert_many([{"user_id": "u1"}, {"user_id": "u1"}])
+        await ensure_indexes()
+
+    with pytest.raises(RuntimeError, match="wallets.user_id_1"):
+        asyncio.run(scenario())
+
+
+def test_concurrent_first_requests_share_one_document(db):
+    async def scenario():
+        created = await asyncio.gather(*[
+            find_or_create("host_profiles", {"user_id": "u1"}, {"level": "new"}) for _ in range(3)
+        ])
+        return created, await db.host_profiles.count_documents({"user_id": "u1"})
+
+    created, stored = asyncio.run(scenario())
+    assert created == [{"user_id": "u1", "level": "new"}] * 3
+    assert stored == 1
@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from server import NotificationQueue, closed_leaderboard_periods, settle_leaderboard_period
+
+PERIOD = "2026-10-16"
+SETTLEMENT_ID = f"charity:daily:{PERIOD}"
+
+
+@pytest.fixture
+def board(db, monkeypatch):
+    monkeypatch.setattr(server, "notification_queue", NotificationQueue(250, 500, 1000))
+
+    async def setup():
+        await db.wallets.insert_many([
+            {"user_id": "a", "coins_balance": 0},
+            {"user_id": "b", "coins_balance": 0}
+        ])
+        await db.leaderboard_scores.insert_many([
+            {"board": "charity", "window": "daily", "period": PERIOD, "user_id": user_id, "score": score}
+            for user_id, score in [("a", 90), ("b", 50), ("c", 10), ("d", 0)]
+        ])
+
+    asyncio.run(setup())
+    return db
+
+
+async def balances(db):
+    return {wallet["user_id"]: wallet["coins_balance"] async for wallet in db.wallets.find()}
+
+
+def test_settlement_pays_winners_once(board):
+    async def scenario():
+        first = await settle_leaderboard_period("charity", "daily", PERIOD)
+        again = await settle_leaderboard_period("charity", "daily", PERIOD)
+        settlement = await board.leaderboard_settlements.find_one({"settlement_id": SETTLEMENT_ID})
+        transactions = await board.wallet_transactions.find({"reference_id": SETTLEMENT_ID}).to_list(None)
+        return first, again, settlement, transactions, await balances(board)
+
+    first, again, settlement, transactions, coins = asyncio.run(scenario())
+    assert first == {"settlement_id": SETTLEMENT_ID, "status": "paid", "winners": 3, "unpaid": 1}
+    assert again["skipped"]
+    assert coins == {"a": 500, "b": 300}
+    assert sorted(t["transaction_id"] for t in transactions) == [
+        f"prize_{SETTLEMENT_ID}:1", f"prize_{SETTLEMENT_ID}:2"
+    ]
+    assert settlement["unpaid"] == [{"user_id": "c", "rank": 3, "reason": "no_wallet"}]
+    assert len(server.notification_queue._buffer) == 2
+
+
+def test_rerun_after_interrupted_payout_does_not_pay_twice(board):
+    async def scenario():
+        await settle_leaderboard_period("charity", "daily", PERIOD)
+        # As if the run died after the payout but before marking the period paid
+        await board.leaderboard_settlements.update_one(
+            {"settlement_id": SETTLEMENT_ID}, {"$set": {"status": "frozen"}}
+        )
+        server.notification_queue._buffer.clear()
+        result = await settle_leaderboard_period("charity", "daily", PERIOD)
+        return result, await balances(board), await board.wallet_transactions.count_documents({})
+
+    result, coins, transactions = asyncio.run(scenario())
+    assert result["status"] == "paid"
+    assert coins == {"a": 500, "b": 300}
+    assert transactions == 2
+    assert server.notification_queue._buffer == []
+
+
+def test_winners_are_frozen_at_first_settlement(board):
+    async def scenario():
+        await settle_leaderboard_period("charity", "daily", PERIOD)
+        await board.leaderboard_scores.update_one({"user_id": "b"}, {"$set": {"score": 1000}})
+        await board.leaderboard_settlements.update_one(
+            {"settlement_id": SETTLEMENT_ID}, {"$set": {"status": "frozen"}}
+        )
+        await settle_leaderboard_period("charity", "daily", PERIOD)
+        return await balances(board)
+
+    assert asyncio.run(scenario()) == {"a": 500, "b": 300}
+
+
+def test_live_lease_blocks_and_stale_lease_is_reclaimed(board):
+    async def claim(paying_at):
+        await board.leaderboard_settlements.update_one(
+            {"settlement_id": SETTLEMENT_ID},
+            {"$set": {"status": "paying", "paying_at": paying_at}}
+        )
+        return await settle_leaderboard_period("charity", "daily", PERIOD)
+
+    async def scenario():
+        await board.leaderboard_settlements.insert_one({
+            "settlement_id": SETTLEMENT_ID,
+            "board": "charity",
+            "window": "daily",
+            "period": PERIOD,
+            "winners": await server.freeze_leaderboard_winners("charity", "daily", PERIOD),
+            "status": "frozen"
+        })
+        now = datetime.now(timezone.utc)
+        live = await claim(now)
+        stale = await claim(now - timedelta(seconds=server.LEADERBOARD_SETTLEMENT_LEASE_SECONDS + 1))
+        return live, stale, await balances(board)
+
+    live, stale, coins = asyncio.run(scenario())
+    assert live == {"settlement_id": SETTLEMENT_ID, "status": "paying", "skipped": True}
+    assert stale["status"] == "paid"
+    assert coins == {"a": 500, "b": 300}
+
+
+def test_failed_payout_hands_the_period_back(board, monkeypatch):
+    async def broken_flush(self):
+        raise RuntimeError("wallets unavailable")
+
+    monkeypatch.setattr(server.LedgerPosting, "_flush", broken_flush)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await settle_leaderboard_period("charity", "daily", PERIOD)
+        return await board.leaderboard_settlements.find_one({"settlement_id": SETTLEMENT_ID})
+
+    assert asyncio.run(scenario())["status"] == "frozen"
+
+
+def test_closed_periods_cover_the_lookback_oldest_first():
+    now = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+    assert closed_leaderboard_periods(now, 2) == [
+        ("daily", "2026-10-15"),
+        ("weekly", "2026-W40"),
+        ("monthly", "2026-08"),
+        ("daily", "2026-10-16"),
+        ("weekly", "2026-W41"),
+        ("monthly", "2026-09")
+    ]
+
+
+def test_snapshot_left_unpaid_is_refrozen_before_the_first_payout(board):
+    async def scenario():
+        # Frozen by a worker that died before it claimed the payout
+        await board.leaderboard_settlements.insert_one({
+            "settlement_id": SETTLEMENT_ID,
+            "board": "charity",
+            "window": "daily",
+            "period": PERIOD,
+            "winners": [{"rank": 1, "user_id": "b", "score": 50, "coins": 500}],
+            "status": "frozen",
+            "created_at": datetime.now(timezone.utc) - timedelta(hours=6)
+        })
+        await settle_leaderboard_period("charity", "daily", PERIOD)
+        return await balances(board)
+
+    assert asyncio.run(scenario()) == {"a": 500, "b": 300}
@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import server
+from server import LedgerPosting, NotificationQueue
+
+
+@pytest.fixture
+def notifications(monkeypatch):
+    queue = NotificationQueue(250, 500, 1000)
+    monkeypatch.setattr(server, "notification_queue", queue)
+    return queue
+
+
+async def balance(db, user_id):
+    return (await db.wallets.find_one({"user_id": user_id}))["coins_balance"]
+
+
+def test_posting_flushes_queued_writes_and_notifies_after_commit(db, notifications):
+    async def scenario():
+        await db.wallets.insert_one({"user_id": "u1", "coins_balance": 100})
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                wallet = await posting.debit("u1", {"coins_balance": 30})
+                posting.insert("wallet_transactions", {"transaction_id": "t1", "user_id": "u1", "amount": -30})
+                posting.notify({"user_id": "u1", "title": "Spent"})
+                assert notifications._buffer == []
+        return wallet, posting, await balance(db, "u1"), await db.wallet_transactions.count_documents({})
+
+    wallet, posting, coins, transactions = asyncio.run(scenario())
+    assert wallet["coins_balance"] == 70
+    assert posting.committed
+    assert coins == 70
+    assert transactions == 1
+    assert notifications._buffer == [{"user_id": "u1", "title": "Spent"}]
+
+
+def test_failed_block_reverses_wallet_moves_and_journals(db, notifications):
+    async def scenario():
+        await db.wallets.insert_one({"user_id": "u1", "coins_balance": 100})
+        await db.wallets.insert_one({"user_id": "u2", "coins_balance": 0})
+        with pytest.raises(RuntimeError):
+            async for posting in LedgerPosting.attempts():
+                async with posting:
+                    await posting.debit("u1", {"coins_balance": 40})
+                    await posting.credit("u2", {"coins_balance": 40})
+                    posting.notify({"user_id": "u2", "title": "Received"})
+                    raise RuntimeError("gift record invalid")
+        return await balance(db, "u1"), await balance(db, "u2"), await db.ledger_posting_failures.find_one()
+
+    u1, u2, failure = asyncio.run(scenario())
+    assert (u1, u2) == (100, 0)
+    assert failure["wallet_moves_reversed"] is True
+    assert len(failure["wallet_moves"]) == 2
+    assert notifications._buffer == []
+
+
+def test_failed_flush_reverses_wallet_moves(db, notifications):
+    async def scenario():
+        await db.wallets.insert_one({"user_id": "u1", "coins_balance": 100})
+        await db.wallet_transactions.insert_one({"transaction_id": "t1"})
+        with pytest.raises(PyMongoError):
+            async for posting in LedgerPosting.attempts():
+                async with posting:
+                    await posting.debit("u1", {"coins_balance": 30})
+                    # Collides with the unique transaction_id index
+                    posting.insert("wallet_transactions", {"transaction_id": "t1"})
+        return await balance(db, "u1"), await db.ledger_posting_failures.count_documents({})
+
+    assert asyncio.run(scenario()) == (100, 1)
+
+
+def test_failed_debit_guard_returns_none_without_compensation(db, notifications):
+    async def scenario():
+        await db.wallets.insert_one({"user_id": "u1", "coins_balance": 10})
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                wallet = await posting.debit("u1", {"coins_balance": 30})
+        return wallet, await balance(db, "u1")
+
+    assert asyncio.run(scenario()) == (None, 10)
+
+
+class FakeSession:
+    def __init__(self, log):
+        self.log = log
+        self.in_transaction = False
+
+    def start_transaction(self):
+        self.in_transaction = True
+        self.log.append("start")
+
+    async def commit_transaction(self):
+        self.in_transaction = False
+        self.log.append("commit")
+
+    async def abort_transaction(self):
+        self.in_transaction = False
+        self.log.append("abort")
+
+    async def end_session(self):
+        self.log.append("end")
+
+
+class FakeClient:
+    def __init__(self):
+        self.log = []
+
+    async def start_session(self):
+        return FakeSession(self.log)
+
+
+@pytest.fixture
+def transactions(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(server, "LEDGER_TRANSACTIONS", "on")
+    monkeypatch.setattr(server, "client", client)
+    return client
+
+
+def transient(message):
+    return PyMongoError(message, error_labels=["TransientTransactionError"])
+
+
+def test_transient_transaction_error_reruns_the_block(transactions, notifications, monkeypatch):
+    flushes = []
+
+    async def flush(self):
+        flushes.append(self)
+        if len(flushes) == 1:
+            raise transient("write conflict")
+
+    monkeypatch.setattr(LedgerPosting, "_flush", flush)
+
+    async def scenario():
+        runs = 0
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                runs += 1
+                posting.notify({"user_id": "u1"})
+        return runs, posting
+
+    runs, posting = asyncio.run(scenario())
+    assert runs == 2
+    assert posting.committed
+    assert transactions.log == ["start", "abort", "end", "start", "commit", "end"]
+    # Only the committed attempt's notification goes out
+    assert notifications._buffer == [{"user_id": "u1"}]
+
+
+def test_transient_errors_give_up_after_the_last_attempt(transactions, notifications, monkeypatch):
+    async def flush(self):
+        raise transient("write conflict")
+
+    monkeypatch.setattr(LedgerPosting, "_flush", flush)
+    monkeypatch.setattr(server, "LEDGER_TRANSACTION_ATTEMPTS", 3)
+
+    async def scenario():
+        runs = 0
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                runs += 1
+        return runs
+
+    with pytest.raises(PyMongoError):
+        asyncio.run(scenario())
+    assert transactions.log.count("start") == 3
+    assert "commit" not in transactions.log
+
+
+def test_unknown_commit_result_retries_the_commit(transactions, notifications, monkeypatch):
+    commits = []
+
+    async def commit_transaction(self):
+        commits.append(self)
+        if len(commits) == 1:
+            raise PyMongoError("network blip", error_labels=["UnknownTransactionCommitResult"])
+        self.in_transaction = False
+
+    async def flush(self):
+        pass
+
+    monkeypatch.setattr(FakeSession, "commit_transaction", commit_transaction)
+    monkeypatch.setattr(LedgerPosting, "_flush", flush)
+
+    async def scenario():
+        runs = 0
+        async for posting in LedgerPosting.attempts():
+            async with posting:
+                runs += 1
+        return runs, posting
+
+    runs, posting = asyncio.run(scenario())
+    assert runs == 1
+    assert len(commits) == 2
+    assert posting.committed
@@ -0,0 +1,84 @@
+import asyncio
+
+from server import LiveCounterHub
+
+
+def hub(values):
+    counters = LiveCounterHub(10, 60)
+    loads = []
+
+    @counters.counter("total_users")
+    async def load_total_users():
+        loads.append("total_users")
+        return values["total_users"]
+
+    counters.loads = loads
+    return counters
+
+
+def test_counter_loads_once_then_follows_deltas():
+    values = {"total_users": 10}
+    counters = hub(values)
+
+    async def scenario():
+        first = await counters.get("total_users")
+        counters.add("total_users", 2)
+        return first, await counters.get("total_users")
+
+    assert asyncio.run(scenario()) == (10, 12)
+    assert counters.loads == ["total_users"]
+
+
+def test_delta_before_the_first_load_is_ignored():
+    counters = hub({"total_users": 10})
+    counters.add("total_users", 2)
+    assert asyncio.run(counters.get("total_users")) == 10
+
+
+def test_resync_replaces_drifted_values():
+    values = {"total_users": 10}
+    counters = hub(values)
+
+    async def scenario():
+        await counters.get("total_users")
+        counters.add("total_users", 1)
+        values["total_users"] = 20
+        await counters.resync()
+        return await counters.snapshot()
+
+    assert asyncio.run(scenario()) == {"total_users": 20}
+
+
+def test_subscribers_get_one_coalesced_event_per_push():
+    counters = hub({"total_users": 10})
+
+    async def scenario():
+        queue = counters.subscribe()
+        await counters.get("total_users")
+        counters._publish()
+        for _ in range(3):
+            counters.add("total_users", 1)
+        counters._publish()
+        # Nothing changed since the last push
+        counters._publish()
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    events = asyncio.run(scenario())
+    assert [event["counters"] for event in events] == [{"total_users": 10}, {"total_users": 13}]
+    assert events[1]["deltas"] == {"total_users": 3}
+
+
+def test_slow_subscriber_drops_its_oldest_event():
+    counters = hub({"total_users": 0})
+
+    async def scenario():
+        queue = counters.subscribe()
+        await counters.get("total_users")
+        for _ in range(20):
+            counters.add("total_users", 1)
+            counters._publish()
+        return [queue.get_nowait()["counters"]["total_users"] for _ in range(queue.qsize())]
+
+    received = asyncio.run(scenario())
+    assert len(received) == 16
+    assert received[-1] == 20
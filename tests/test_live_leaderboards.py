@@ -0,0 +1,44 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+from server import leaderboard_periods, live_leaderboard_top, record_leaderboard_score
+
+
+@pytest.fixture
+def scores(db, monkeypatch):
+    monkeypatch.setattr(server, "_live_top_cache", {})
+    monkeypatch.setattr(server, "_profile_cache", server.OrderedDict())
+    return db
+
+
+def test_window_periods_follow_the_reward_resets():
+    assert leaderboard_periods(datetime(2026, 10, 17, 23, 59, tzinfo=timezone.utc)) == {
+        "all": "all", "daily": "2026-10-17", "weekly": "2026-W42", "monthly": "2026-10"
+    }
+
+
+def test_scores_add_up_in_every_window(scores):
+    async def scenario():
+        await record_leaderboard_score("charity", "u1", 10)
+        await record_leaderboard_score("charity", "u1", 5)
+        return await scores.leaderboard_scores.find({"user_id": "u1"}, {"_id": 0, "window": 1, "score": 1, "events": 1}).to_list(None)
+
+    rows = asyncio.run(scenario())
+    assert sorted(row["window"] for row in rows) == ["all", "daily", "monthly", "weekly"]
+    assert all((row["score"], row["events"]) == (15, 2) for row in rows)
+
+
+def test_top_is_ranked_by_score_then_user_id(scores):
+    async def scenario():
+        await scores.users.insert_one({"user_id": "u2", "name": "Ravi", "picture": None})
+        for user_id, score in [("u1", 10), ("u2", 30), ("u3", 10)]:
+            await record_leaderboard_score("charity", user_id, score)
+        return await live_leaderboard_top("charity", "daily", limit=2)
+
+    top = asyncio.run(scenario())
+    assert [(row["rank"], row["user_id"], row["score"]) for row in top] == [(1, "u2", 30), (2, "u1", 10)]
+    assert top[0]["user"]["name"] == "Ravi"
+    assert top[1]["user"] is None
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import AsyncOpenAI
+
+from server import LLMGateway
+
+MESSAGES = [{"role": "user", "content": "What is 2 + 2?"}]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Plays back the server's scripted replies to /chat/completions"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        status, delay, payload = self.server.replies.pop(0) if self.server.replies else self.server.default
+        time.sleep(delay)
+        if body.get("stream"):
+            self.send_response(status)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for part in payload:
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        if status == 200:
+            payload = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": payload},
+                    "finish_reason": "stop"
+                }]
+            }
+        else:
+            payload = {"error": {"message": payload, "type": "server_error"}}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.replies = []
+    server.default = (200, 0, "4")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def gateway(stub, request_timeout=5.0, max_retries=0):
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        max_retries=max_retries
+    )
+    return LLMGateway(client, 2, 1.0, request_timeout, 60, 100)
+
+
+def test_complete_caches_answer(db, stub):
+    llm = gateway(stub)
+
+    async def scenario():
+        first = await llm.complete("k", "gpt-test", MESSAGES)
+        second = await llm.complete("k", "gpt-test", MESSAGES)
+        stored = await db.llm_response_cache.find_one({"key": "k"})
+        return first, second, stored
+
+    first, second, stored = asyncio.run(scenario())
+    assert first == second == "4"
+    assert stored["answer"] == "4"
+    assert len(stub.requests) == 1
+    assert llm.stats()["models"]["gpt-test"]["cache_hits"] == 1
+
+
+def test_concurrent_identical_requests_share_one_call(db, stub):
+    stub.default = (200, 0.2, "4")
+    llm = gateway(stub)
+
+    async def scenario():
+        return await asyncio.gather(*[llm.complete("k", "gpt-test", MESSAGES) for _ in range(3)])
+
+    assert asyncio.run(scenario()) == ["4", "4", "4"]
+    assert len(stub.requests) == 1
+    assert llm.stats()["models"]["gpt-test"]["coalesced"] == 2
+
+
+def test_server_error_is_retried(db, stub):
+    stub.replies = [(500, 0, "overloaded")]
+    llm = gateway(stub, max_retries=2)
+
+    assert asyncio.run(llm.complete("k", "gpt-test", MESSAGES)) == "4"
+    assert len(stub.requests) == 2
+    assert llm.stats()["models"]["gpt-test"]["errors"] == 0
+
+
+def test_server_error_without_retries_is_counted(db, stub):
+    stub.replies = [(500, 0, "overloaded")]
+    llm = gateway(stub)
+
+    with pytest.raises(Exception):
+        asyncio.run(llm.complete("k", "gpt-test", MESSAGES))
+    assert llm.stats()["models"]["gpt-test"]["errors"] == 1
+    assert llm._inflight == {}
+
+
+def test_slow_upstream_times_out_and_frees_the_slot(db, stub):
+    stub.replies = [(200, 1.0, "late")]
+    llm = gateway(stub, request_timeout=0.2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(llm.complete("k", "gpt-test", MESSAGES))
+    assert llm.stats()["models"]["gpt-test"]["timeouts"] == 1
+    assert llm._slots._value == 2
+
+
+def test_stream_yields_chunks_and_caches_the_answer(db, stub):
+    stub.replies = [(200, 0, ["Two ", "plus ", "two ", "is four."])]
+    llm = gateway(stub)
+
+    async def scenario():
+        streamed = [part async for part in llm.stream("k", "gpt-test", MESSAGES)]
+        replayed = [part async for part in llm.stream("k", "gpt-test", MESSAGES)]
+        return streamed, replayed
+
+    streamed, replayed = asyncio.run(scenario())
+    assert streamed == ["Two ", "plus ", "two ", "is four."]
+    assert replayed == ["Two plus two is four."]
+    assert len(stub.requests) == 1
+    assert stub.requests[0]["stream"] is True
+
+
+def test_stream_closed_early_is_not_cached(db, stub):
+    stub.replies = [(200, 0, ["Two ", "plus ", "two ", "is four."])]
+    llm = gateway(stub)
+
+    async def scenario():
+        tokens = llm.stream("k", "gpt-test", MESSAGES)
+        first = await tokens.__anext__()
+        await tokens.aclose()
+        return first, await llm.cached("k")
+
+    first, cached = asyncio.run(scenario())
+    assert first == "Two "
+    assert cached is None
+    assert llm._slots._value == 2
+
+
+def test_shared_entry_is_kept_locally_only_until_it_expires(db, stub):
+    llm = gateway(stub)
+
+    async def scenario():
+        now = datetime.now(timezone.utc)
+        await db.llm_response_cache.insert_many([
+            {"key": "fresh", "answer": "cached", "expires_at": now + timedelta(seconds=0.2)},
+            # Past its TTL but not swept yet
+            {"key": "expired", "answer": "stale", "expires_at": now - timedelta(seconds=1)}
+        ])
+        fresh = await llm.cached("fresh")
+        expired = await llm.cached("expired")
+        await db.llm_response_cache.delete_many({})
+        await asyncio.sleep(0.3)
+        return fresh, expired, await llm.cached("fresh")
+
+    assert asyncio.run(scenario()) == ("cached", None, None)
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timezone
+
+import server
+from server import DAILY_MISSIONS, MissionsEngine
+
+TODAY = str(datetime.now(timezone.utc).date())
+
+
+def engine():
+    return MissionsEngine(DAILY_MISSIONS, 5)
+
+
+def test_events_buffer_until_flushed_in_one_write(db, monkeypatch):
+    missions = engine()
+    writes = []
+    bulk_write = type(db.daily_mission_progress).bulk_write
+
+    async def counting_bulk_write(self, requests, **kwargs):
+        writes.append(len(requests))
+        return await bulk_write(self, requests, **kwargs)
+
+    monkeypatch.setattr(type(db.daily_mission_progress), "bulk_write", counting_bulk_write)
+
+    async def scenario():
+        for _ in range(3):
+            missions.advance("u1", {"solve_questions": 2})
+        missions.advance("u2", {"help_friend": 1, "unknown": 5})
+        before = await db.daily_mission_progress.count_documents({})
+        await missions.flush()
+        return before, {
+            doc["user_id"]: doc["missions"] async for doc in db.daily_mission_progress.find({"date": TODAY})
+        }
+
+    before, stored = asyncio.run(scenario())
+    assert before == 0
+    assert writes == [2]
+    assert stored["u1"]["solve_questions"] == {"progress": 6, "completed": False, "claimed": False}
+    assert stored["u2"]["help_friend"]["completed"] is True
+    assert "unknown" not in stored["u2"]
+
+
+def test_progress_is_capped_at_the_target(db):
+    missions = engine()
+
+    async def scenario():
+        missions.advance("u1", {"study_time": 25})
+        await missions.flush()
+        missions.advance("u1", {"study_time": 25})
+        await missions.flush()
+        return await missions.progress("u1", TODAY)
+
+    study = asyncio.run(scenario())["missions"]["study_time"]
+    assert study == {"progress": 30, "completed": True, "claimed": False}
+
+
+def test_progress_read_applies_the_users_buffered_increments(db):
+    missions = engine()
+
+    async def scenario():
+        missions.advance("u1", {"solve_questions": 4})
+        missions.advance("u2", {"solve_questions": 1})
+        doc = await missions.progress("u1", TODAY)
+        return doc, list(missions._pending)
+
+    doc, pending = asyncio.run(scenario())
+    assert doc["missions"]["solve_questions"]["progress"] == 4
+    assert doc["missions"]["complete_video"] == {"progress": 0, "completed": False, "claimed": False}
+    assert pending == [("u2", TODAY)]
+
+
+def test_failed_flush_keeps_increments_pending(db, monkeypatch):
+    missions = engine()
+    bulk_write = type(db.daily_mission_progress).bulk_write
+
+    async def broken_bulk_write(self, requests, **kwargs):
+        raise server.PyMongoError("primary stepped down")
+
+    async def scenario():
+        missions.advance("u1", {"solve_questions": 3})
+        monkeypatch.setattr(type(db.daily_mission_progress), "bulk_write", broken_bulk_write)
+        await missions.flush()
+        monkeypatch.setattr(type(db.daily_mission_progress), "bulk_write", bulk_write)
+        await missions.flush()
+        return await db.daily_mission_progress.find_one({"user_id": "u1"})
+
+    assert asyncio.run(scenario())["missions"]["solve_questions"]["progress"] == 3
@@ -0,0 +1,69 @@
+import asyncio
+
+import server
+from server import NotificationQueue
+
+
+class FlakyNotifications:
+    """insert_many that is slow and fails the first `failures` calls"""
+
+    def __init__(self, collection, failures=0):
+        self.collection = collection
+        self.failures = failures
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(0.05)
+        if self.failures:
+            self.failures -= 1
+            raise server.PyMongoError("primary stepped down")
+        return await self.collection.insert_many(documents, ordered=ordered)
+
+
+def install(db, monkeypatch, failures=0):
+    class Database:
+        notifications = FlakyNotifications(db.notifications, failures)
+
+    monkeypatch.setattr(server, "db", Database())
+
+
+def test_drain_waits_for_the_flush_in_progress(db, monkeypatch):
+    install(db, monkeypatch)
+    queue = NotificationQueue(10, 2, 100)
+
+    async def scenario():
+        queue.start()
+        for i in range(5):
+            queue.enqueue({"i": i})
+        # Let the worker take a batch out of the buffer before draining
+        await asyncio.sleep(0.01)
+        await queue.drain()
+        return sorted([doc["i"] async for doc in db.notifications.find()])
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+    assert queue._buffer == []
+
+
+def test_failed_batch_is_buffered_again(db, monkeypatch):
+    install(db, monkeypatch, failures=1)
+    queue = NotificationQueue(10, 2, 100)
+
+    async def scenario():
+        for i in range(3):
+            queue.enqueue({"i": i})
+        await queue.flush()
+        kept = [doc["i"] for doc in queue._buffer]
+        await queue.flush()
+        return kept, sorted([doc["i"] async for doc in db.notifications.find()])
+
+    kept, saved = asyncio.run(scenario())
+    assert kept == [0, 1, 2]
+    assert saved == [0, 1, 2]
+    assert queue.failed == 2
+
+
+def test_buffer_drops_the_oldest_past_its_cap():
+    queue = NotificationQueue(10, 2, 3)
+    for i in range(5):
+        queue.enqueue({"i": i})
+    assert [doc["i"] for doc in queue._buffer] == [2, 3, 4]
+    assert queue.dropped == 2
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+USER = server.User(user_id="u1", email="u1@example.com", name="U1", created_at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+START = datetime(2026, 10, 17, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(server, "_page_count_cache", {})
+    asyncio.run(db.wallet_transactions.insert_many([
+        {"transaction_id": f"txn_{i}", "user_id": "u1", "amount": i, "created_at": START + timedelta(minutes=i)}
+        for i in range(5)
+    ]))
+    server.app.dependency_overrides[server.get_current_user] = lambda: USER
+    yield TestClient(server.app)
+    server.app.dependency_overrides.clear()
+
+
+def test_cursor_pages_walk_every_transaction_once(client):
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/wallet/transactions", params=params).json()
+        seen += [t["amount"] for t in page["transactions"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [4, 3, 2, 1, 0]
+
+
+def test_total_is_returned_unless_skipped(client):
+    assert client.get("/api/wallet/transactions").json()["total"] == 5
+    assert client.get("/api/wallet/transactions", params={"include_total": False}).json()["total"] is None
+
+
+def test_offset_paging_still_works(client):
+    page = client.get("/api/wallet/transactions", params={"limit": 2, "offset": 2}).json()
+    assert [t["amount"] for t in page["transactions"]] == [2, 1]
+
+
+@pytest.mark.parametrize("params", [
+    {"limit": 0},
+    {"limit": server.PAGE_MAX_LIMIT + 1},
+    {"limit": server.PAGE_MAX_LIMIT + 1, "offset": 2},
+    {"offset": -1}
+])
+def test_out_of_range_paging_is_rejected(client, params):
+    assert client.get("/api/wallet/transactions", params=params).status_code == 422
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from server import rollover_periods
+
+DATE = "2026-10-18"
+
+
+@pytest.fixture
+def precreate(monkeypatch):
+    runs = []
+
+    async def precreate_period_documents(date):
+        runs.append(date)
+        if precreate.fail:
+            raise RuntimeError("database unavailable")
+        return {"date": date, "users": 0}
+
+    precreate.fail = False
+    monkeypatch.setattr(server, "precreate_period_documents", precreate_period_documents)
+    precreate.runs = runs
+    return precreate
+
+
+def rollover(db, date=DATE):
+    async def run():
+        result = await rollover_periods(date)
+        return result, await db.period_rollovers.find_one({"date": date})
+    return asyncio.run(run())
+
+
+def test_rollover_runs_once_per_day(db, precreate):
+    first, record = rollover(db)
+    second, _ = rollover(db)
+    assert first == {"date": DATE, "users": 0}
+    assert second == {"date": DATE, "skipped": True}
+    assert record["status"] == "done"
+    assert precreate.runs == [DATE]
+
+
+def test_failed_rollover_is_retried(db, precreate):
+    precreate.fail = True
+    with pytest.raises(RuntimeError):
+        rollover(db)
+    precreate.fail = False
+    result, record = rollover(db)
+    assert result == {"date": DATE, "users": 0}
+    assert record["status"] == "done"
+    assert record["attempts"] == 2
+
+
+@pytest.mark.parametrize("lease_offset, reclaimed", [(300, False), (-1, True)])
+def test_running_rollover_is_reclaimed_once_its_lease_lapses(db, precreate, lease_offset, reclaimed):
+    asyncio.run(db.period_rollovers.insert_one({
+        "date": DATE,
+        "status": "running",
+        "lease_until": datetime.now(timezone.utc) + timedelta(seconds=lease_offset)
+    }))
+    result, _ = rollover(db)
+    assert ("skipped" not in result) == reclaimed
+
+
+def test_legacy_unfinished_claim_is_reclaimed(db, precreate):
+    asyncio.run(db.period_rollovers.insert_one({"date": DATE, "started_at": datetime.now(timezone.utc)}))
+    result, record = rollover(db)
+    assert result == {"date": DATE, "users": 0}
+    assert record["status"] == "done"
+
+
+def test_only_real_activity_gets_documents_precreated(db):
+    mission_id = next(iter(server.missions_engine.targets))
+
+    async def scenario():
+        await db.activity_sessions.insert_many([
+            {"user_id": "active", "date": "2026-10-17", "total_active_minutes": 12},
+            # Zeroed documents an earlier rollover pre-created
+            {"user_id": "idle", "date": "2026-10-17", "total_active_minutes": 0}
+        ])
+        await db.daily_mission_progress.insert_many([
+            server.missions_engine.blank("idle", "2026-10-17"),
+            {**server.missions_engine.blank("missions", "2026-10-17"), "missions": {mission_id: {"progress": 1}}}
+        ])
+        await server.precreate_period_documents(DATE)
+        return sorted(await db.activity_sessions.distinct("user_id", {"date": DATE}))
+
+    assert asyncio.run(scenario()) == ["active", "missions"]
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+
+from server import SessionCache, User
+
+LATER = datetime.now(timezone.utc) + timedelta(days=1)
+
+
+def user(user_id):
+    return User(user_id=user_id, email=f"{user_id}@example.com", name=user_id, created_at=datetime(2026, 1, 1))
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SessionCache(2, 60)
+    cache.put("t1", user("u1"), LATER)
+    cache.put("t2", user("u2"), LATER)
+    cache.get("t1")
+    cache.put("t3", user("u3"), LATER)
+    assert cache.get("t2") is None
+    assert cache.get("t1").user_id == "u1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_with_the_ttl_or_the_session():
+    cache = SessionCache(10, 0)
+    cache.put("t1", user("u1"), LATER)
+    assert cache.get("t1") is None
+
+    cache = SessionCache(10, 60)
+    cache.put("t1", user("u1"), datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert cache.get("t1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_user_drops_every_session_of_that_user():
+    cache = SessionCache(10, 60)
+    cache.put("t1", user("u1"), LATER)
+    cache.put("t2", user("u1"), LATER)
+    cache.put("t3", user("u2"), LATER)
+    cache.invalidate_user("u1")
+    assert [cache.get(t) for t in ("t1", "t2")] == [None, None]
+    assert cache.get("t3").user_id == "u2"
+
+
+def test_stats_report_the_hit_rate():
+    cache = SessionCache(10, 60)
+    cache.put("t1", user("u1"), LATER)
+    cache.get("t1")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+PROFILE = {"user_id": "u1", "email": "u1@example.com", "name": "Asha", "picture": None,
+           "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc)}
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(server, "session_cache", server.SessionCache(100, 60))
+    asyncio.run(db.users.insert_one(dict(PROFILE)))
+
+    def login(token, embedded=True):
+        session = {"session_token": token, "user_id": "u1",
+                   "expires_at": datetime.now(timezone.utc) + timedelta(days=1)}
+        if embedded:
+            session["user"] = server.session_user_snapshot(PROFILE)
+        asyncio.run(db.user_sessions.insert_one(session))
+        return {"Authorization": f"Bearer {token}"}
+
+    client = TestClient(server.app)
+    client.login = login
+    return client
+
+
+@pytest.mark.parametrize("mode", ["denormalized", "lookup"])
+@pytest.mark.parametrize("embedded", [True, False])
+def test_session_resolves_to_its_user(client, monkeypatch, mode, embedded):
+    monkeypatch.setattr(server, "SESSION_RESOLUTION_MODE", mode)
+    me = client.get("/api/auth/me", headers=client.login("t1", embedded))
+    assert me.status_code == 200
+    assert me.json()["name"] == "Asha"
+
+
+def test_logout_ends_the_cached_session(client):
+    headers = client.login("t1")
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    client.post("/api/auth/logout", headers=headers)
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+
+def test_profile_update_reaches_cached_and_embedded_copies(client):
+    headers = client.login("t1")
+    client.get("/api/auth/me", headers=headers)
+    asyncio.run(server.update_user_profile("u1", {"name": "Asha K"}))
+    server.session_cache._entries.clear()
+    assert client.get("/api/auth/me", headers=headers).json()["name"] == "Asha K"
+
+
+def test_profile_update_drops_the_cached_user(client):
+    headers = client.login("t1")
+    client.get("/api/auth/me", headers=headers)
+    asyncio.run(server.update_user_profile("u1", {"name": "Asha K"}))
+    assert server.session_cache.stats()["entries"] == 0
+
+
+def test_expired_session_is_rejected(client, db):
+    headers = client.login("t1")
+    asyncio.run(db.user_sessions.update_one(
+        {"session_token": "t1"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    ))
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
@@ -0,0 +1,42 @@
+import asyncio
+
+from server import ShardedCounter
+
+
+def test_increments_spread_over_shards_and_sum_on_read(db):
+    counter = ShardedCounter("charity_wallet", "global", {"counter_id": {"$exists": False}}, shards=4, rollup_ttl=0)
+
+    async def scenario():
+        await asyncio.gather(*[counter.increment({"total_received": 5}) for _ in range(40)])
+        return await counter.read(), await db.charity_wallet.count_documents({"counter_id": "global"})
+
+    rollup, shards = asyncio.run(scenario())
+    assert rollup["total_received"] == 200
+    assert 1 < shards <= 4
+
+
+def test_read_includes_the_pre_sharding_document(db):
+    counter = ShardedCounter("platform_stats", "main", {"stat_id": "main"}, shards=4, rollup_ttl=0)
+
+    async def scenario():
+        await db.platform_stats.insert_one({"stat_id": "main", "total_users": 7, "label": "platform"})
+        await counter.increment({"total_users": 1})
+        return await counter.read()
+
+    rollup = asyncio.run(scenario())
+    assert rollup["total_users"] == 8
+    assert rollup["label"] == "platform"
+
+
+def test_rollup_is_cached_until_its_ttl(db):
+    counter = ShardedCounter("charity_wallet", "global", {"counter_id": {"$exists": False}}, shards=4, rollup_ttl=60)
+
+    async def scenario():
+        await counter.increment({"total_received": 1})
+        first = await counter.read()
+        await counter.increment({"total_received": 1})
+        return first, await counter.read(), await counter.read(use_cache=False)
+
+    cached, again, fresh = asyncio.run(scenario())
+    assert cached["total_received"] == again["total_received"] == 1
+    assert fresh["total_received"] == 2
@@ -0,0 +1,26 @@
+import asyncio
+from types import SimpleNamespace
+
+from server import StarExchangeRequest, execute_star_exchange
+
+USER = SimpleNamespace(user_id="u1")
+
+
+def exchange(stars):
+    return execute_star_exchange(request=StarExchangeRequest(star_amount=stars), current_user=USER, idempotency_key=None)
+
+
+def test_repeated_exchanges_each_record_a_transaction(db):
+    async def scenario():
+        # Rows from before every writer set a transaction_id
+        await db.wallet_transactions.insert_many([{"user_id": "u0"}, {"user_id": "u0"}])
+        await db.wallets.insert_one({"user_id": "u1", "stars_balance": 5000, "coins_balance": 0})
+        first = await exchange(1000)
+        second = await exchange(1000)
+        rows = await db.wallet_transactions.find({"user_id": "u1"}).to_list(None)
+        return first, second, rows
+
+    first, second, rows = asyncio.run(scenario())
+    assert first["new_star_balance"] == 4000
+    assert second["new_star_balance"] == 3000
+    assert len({row["transaction_id"] for row in rows}) == 2
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import server
+from server import load_user_profiles
+
+
+@pytest.fixture
+def users(db, monkeypatch):
+    monkeypatch.setattr(server, "_profile_cache", server.OrderedDict())
+    asyncio.run(db.users.insert_many([
+        {"user_id": f"u{i}", "name": f"User {i}", "picture": None, "email": f"u{i}@example.com"} for i in range(3)
+    ]))
+    queries = []
+    find = type(db.users).find
+
+    def counting_find(self, *args, **kwargs):
+        if self.name == "users":
+            queries.append(args[0])
+        return find(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(db.users), "find", counting_find)
+    return queries
+
+
+def test_profiles_load_in_one_query_and_then_from_cache(users):
+    async def scenario():
+        first = await load_user_profiles(["u0", "u1", "u1", "ghost"])
+        second = await load_user_profiles(["u0", "u1"])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second == {
+        "u0": {"user_id": "u0", "name": "User 0", "picture": None},
+        "u1": {"user_id": "u1", "name": "User 1", "picture": None}
+    }
+    assert users == [{"user_id": {"$in": ["u0", "u1", "ghost"]}}]
+
+
+def test_only_uncached_ids_are_fetched(users):
+    async def scenario():
+        await load_user_profiles(["u0"])
+        return await load_user_profiles(["u0", "u2"])
+
+    assert set(asyncio.run(scenario())) == {"u0", "u2"}
+    assert users[-1] == {"user_id": {"$in": ["u2"]}}
+
+
+def test_cache_stays_within_its_bound(users, monkeypatch):
+    monkeypatch.setattr(server, "PROFILE_CACHE_MAX_ENTRIES", 2)
+    asyncio.run(load_user_profiles(["u0", "u1", "u2"]))
+    assert list(server._profile_cache) == ["u1", "u2"]